@@ -0,0 +1,284 @@
+"""pymycqu 的基准测试
+
+在仓库根目录下运行::
+
+    python benchmarks/run.py                        # 运行全部用例
+    python benchmarks/run.py -k auth                # 只运行名称中包含 auth 的用例
+    python benchmarks/run.py --save base.json       # 保存结果
+    python benchmarks/run.py --compare base.json    # 与保存的结果比较，变慢超过阈值时以非零状态退出
+
+每个用例报告每秒操作数（ops/s）和单次操作期间 tracemalloc 记录的内存峰值。
+所用的页面和 json 数据位于 ``benchmarks/fixtures``。它们不是真实抓取的响应，而是按照本库解析的字段和页面结构
+合成的数据（不含任何真实的个人信息），只包含真实响应中已知存在的字段；数据规模与真实响应相近，
+但字段取值的分布可能不同，比较结果时应以同一份数据为准。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from mycqu import auth, gpa, score  # noqa: E402
+from mycqu.course import CQUSession, CourseTimetable  # noqa: E402
+from mycqu.exam import Exam  # noqa: E402
+
+CASES: List[Tuple[str, Callable[[], Callable[[], Any]]]] = []
+
+
+def case(name: str):
+    """注册一个用例，被装饰的函数完成准备工作并返回要计时的无参函数"""
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        CASES.append((name, setup))
+        return setup
+    return decorator
+
+
+def fixture_text(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def fixture_json(name: str) -> Any:
+    return json.loads(fixture_text(name))
+
+
+def load_crypto_backends() -> Dict[str, Tuple[Callable, Callable]]:
+    """分别在屏蔽其他加密库的情况下加载 ``_lib_wrapper/encrypt.py``，返回各个可用后端的 ``pad`` 和 ``aes_cbc_encryptor``"""
+    path = os.path.join(ROOT, "mycqu", "_lib_wrapper", "encrypt.py")
+    backends: Dict[str, Tuple[Callable, Callable]] = {}
+    for name, blocked in (("pycryptodomex", ()),
+                          ("pycryptodome", ("Cryptodome",)),
+                          ("pyaes", ("Cryptodome", "Crypto"))):
+        saved = {module: sys.modules.pop(module) for module in list(sys.modules)
+                 if module.split(".")[0] in blocked}
+        for module in blocked:
+            sys.modules[module] = None  # type: ignore
+        try:
+            spec = importlib.util.spec_from_file_location("_bench_encrypt_" + name, path)
+            assert spec and spec.loader
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)  # type: ignore
+        except ImportError:
+            continue
+        finally:
+            for blocked_module in blocked:
+                del sys.modules[blocked_module]
+            sys.modules.update(saved)
+        actual = ("pycryptodomex" if hasattr(module, "AES_") else
+                  "pycryptodome" if hasattr(module, "AES__") else "pyaes")
+        if actual == name:
+            backends[name] = (module.pad, module.aes_cbc_encryptor)
+    return backends
+
+
+@case("auth.AuthPageParser")
+def bench_auth_page_parser():
+    html = fixture_text("login_page.html")
+
+    def run():
+        auth.AuthPageParser().feed(html)
+    return run
+
+
+@case("auth.LoginedPageParser")
+def bench_logined_page_parser():
+    html = fixture_text("login_failed_page.html")
+
+    def run():
+        try:
+            auth.LoginedPageParser(200).feed(html)
+        except auth.IncorrectLoginCredentials:
+            pass
+    return run
+
+
+@case("auth.parse_auth_page")
+def bench_parse_auth_page():
+    html = fixture_text("login_page.html")
+
+    def run():
+        auth.parse_auth_page(html)
+    return run
+
+
+@case("auth.parse_logined_page")
+def bench_parse_logined_page():
+    html = fixture_text("login_failed_page.html")
+
+    def run():
+        try:
+            auth.parse_logined_page(html, 200)
+        except auth.IncorrectLoginCredentials:
+            pass
+    return run
+
+
+def _formdata_case(backend: str, pad: Callable, encryptor: Callable):
+    def setup():
+        html = fixture_text("login_page.html")
+
+        def run():
+            old = auth.pad, auth.aes_cbc_encryptor
+            auth.pad, auth.aes_cbc_encryptor = pad, encryptor
+            try:
+                auth.get_formdata(html, "20180001", "password")
+            finally:
+                auth.pad, auth.aes_cbc_encryptor = old
+        return run
+    case(f"auth.get_formdata[{backend}]")(setup)
+
+
+for _backend, (_pad, _encryptor) in load_crypto_backends().items():
+    _formdata_case(_backend, _pad, _encryptor)
+
+
+def _timetable_case(trusted: bool):
+    def setup():
+        timetables = fixture_json("timetable.json")["classTimetableVOList"]
+
+        def run():
+            return [CourseTimetable.from_dict(timetable, trusted) for timetable in timetables
+                    if timetable["teachingWeekFormat"]]
+        return run
+    case("course.CourseTimetable.from_dict" + ("[trusted]" if trusted else ""))(setup)
+
+
+def _exam_case(trusted: bool):
+    def setup():
+        exams = fixture_json("exam.json")["data"]["content"]
+
+        def run():
+            return [Exam.from_dict(exam, trusted) for exam in exams]
+        return run
+    case("exam.Exam.from_dict" + ("[trusted]" if trusted else ""))(setup)
+
+
+def _score_case(trusted: bool):
+    def setup():
+        data = fixture_json("score.json")["data"]
+
+        def run():
+            old = score.get_score_raw
+            score.get_score_raw = lambda auth, http=None: data
+            try:
+                return score.Score.fetch("Bearer token", trusted)
+            finally:
+                score.get_score_raw = old
+        return run
+    case("score.Score.fetch" + ("[trusted]" if trusted else ""))(setup)
+
+
+def _score_tracker_case(trusted: bool):
+    def setup():
+        data = fixture_json("score.json")["data"]
+        tracker = score.ScoreTracker(trusted)
+        tracker.update(data)
+
+        def run():
+            return tracker.update(data)
+        return run
+    case("score.ScoreTracker.update[unchanged" + (",trusted]" if trusted else "]"))(setup)
+
+
+for _trusted in (False, True):
+    _timetable_case(_trusted)
+    _exam_case(_trusted)
+    _score_case(_trusted)
+    _score_tracker_case(_trusted)
+
+
+@case("gpa.ScoreTable.by_session")
+def bench_score_table_by_session():
+    rows = [row for term in fixture_json("score.json")["data"].values() for row in term["stuScoreHomePgVoS"]]
+    # 覆盖 2015 年之前（id 随时间递减）、2015 ~ 2018 年（特殊 id）和 2018 年之后的学期
+    names = ["2013秋", "2012秋", "2016秋", "2018秋", "2015春", "2021春"]
+    scores = [score.Score.from_dict(dict(row, sessionName=names[i % len(names)])) for i, row in enumerate(rows)]
+    table = gpa.ScoreTable({"20180001": scores})
+
+    def run():
+        return table.by_session()
+    return run
+
+
+@case("course.CQUSession.get_id")
+def bench_session_get_id():
+    sessions = [CQUSession(year, is_autumn) for year in range(2000, 2030) for is_autumn in (False, True)]
+
+    def run():
+        for cqu_session in sessions:
+            cqu_session.get_id()
+    return run
+
+
+@case("course.CQUSession.from_str")
+def bench_session_from_str():
+    strings = [f"{year}{'年' if year % 2 else ''}{term}" for year in range(2000, 2030) for term in "春秋"]
+
+    def run():
+        for string in strings:
+            CQUSession.from_str(string)
+    return run
+
+
+def measure(run: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops": 1 / best, "peak_kib": peak / 1024}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="keyword", default="", help="只运行名称中包含该字符串的用例")
+    parser.add_argument("--repeat", type=int, default=5, help="重复计时的次数，取最好的一次")
+    parser.add_argument("--save", metavar="FILE", help="将结果保存为 json")
+    parser.add_argument("--compare", metavar="FILE", help="与之前保存的结果比较")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="比较时 ops/s 下降超过该比例视为性能退化，默认为 0.1")
+    args = parser.parse_args(argv)
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+    print(f"{'case':<45} {'ops/s':>12} {'peak KiB':>10} {'vs base':>9}")
+    for name, setup in CASES:
+        if args.keyword not in name:
+            continue
+        result = results[name] = measure(setup(), args.repeat)
+        change = ""
+        if name in baseline:
+            ratio = result["ops"] / baseline[name]["ops"]
+            change = f"{ratio - 1:+.1%}"
+            if ratio < 1 - args.threshold:
+                regressions.append(name)
+        print(f"{name:<45} {result['ops']:>12.1f} {result['peak_kib']:>10.1f} {change:>9}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+    if regressions:
+        print("regressions: " + ", ".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,2 @@
-from . import auth, course, exam, mycqu, score
-__all__ = ("auth", "course", "exam", "mycqu", "user", "score")
+from . import auth, cache, connection, course, exam, instrument, mycqu, pool, resilience, scheduler, score, store
+__all__ = ("auth", "cache", "connection", "course", "exam", "instrument", "mycqu", "pool", "resilience", "scheduler", "user", "score", "store")
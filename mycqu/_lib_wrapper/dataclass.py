@@ -3,7 +3,7 @@
 https://github.com/samuelcolvin/pydantic/issues/650#issuecomment-709945440
 """
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Type, TypeVar
 
 # Trick
 if TYPE_CHECKING:
@@ -11,4 +11,21 @@ if TYPE_CHECKING:
 else:
     from pydantic.dataclasses import dataclass
 
-__all__ = ("dataclass",)
+__all__ = ("dataclass", "construct")
+
+_T = TypeVar("_T")
+
+
+def construct(cls: Type[_T], trusted: bool = False, **fields: Any) -> _T:
+    """Construct a dataclass of pydantic, skipping validation if ``trusted``
+
+    The trusted path bypasses ``__init__`` and installs ``fields`` as the
+    instance ``__dict__`` directly, so the values must already have the
+    declared types.
+    """
+    if not trusted:
+        return cls(**fields)
+    obj = object.__new__(cls)
+    fields["__pydantic_initialised__"] = True
+    object.__setattr__(obj, "__dict__", fields)
+    return obj
@@ -4,6 +4,7 @@ from typing import Callable
 pad: Callable[[bytes], bytes]
 aes_cbc_encryptor: Callable[[bytes, bytes], Callable[[bytes], bytes]]
 aes_ecb_encryptor: Callable[[bytes], Callable[[bytes], bytes]]
+aes_ecb_decryptor: Callable[[bytes], Callable[[bytes], bytes]]
 try:
     from Cryptodome.Cipher import AES as AES_
     from Cryptodome.Util.Padding import pad as pad_
@@ -24,6 +25,10 @@ except (OSError, ImportError):
             def aes_ecb_encryptor(key):
                 encrypt = AESModeOfOperationECB(key).encrypt
                 return lambda x: b''.join(encrypt(x[i: i+16]) for i in range(0, len(x), 16))
+
+            def aes_ecb_decryptor(key):
+                decrypt = AESModeOfOperationECB(key).decrypt
+                return lambda x: b''.join(decrypt(x[i: i+16]) for i in range(0, len(x), 16))
             pad = append_PKCS7_padding
         except ImportError:
             raise ImportError(  # pylint: ignore disable=raise-missing-from
@@ -37,6 +42,9 @@ except (OSError, ImportError):
 
         def aes_ecb_encryptor(key):
             return AES__.new(key, AES__.MODE_ECB).encrypt
+
+        def aes_ecb_decryptor(key):
+            return AES__.new(key, AES__.MODE_ECB).decrypt
 else:
     def pad(x):
         return pad_(x, 16, style='pkcs7')
@@ -47,4 +55,7 @@ else:
     def aes_ecb_encryptor(key):
         return AES_.new(key, AES_.MODE_ECB).encrypt
 
-__all__ = ("aes_cbc_encryptor", "aes_ecb_encryptor", "pad")
+    def aes_ecb_decryptor(key):
+        return AES_.new(key, AES_.MODE_ECB).decrypt
+
+__all__ = ("aes_cbc_encryptor", "aes_ecb_encryptor", "aes_ecb_decryptor", "pad")
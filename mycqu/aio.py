@@ -0,0 +1,420 @@
+"""基于 asyncio 的异步接口，需要安装可选依赖 `httpx <https://www.python-httpx.org>`_
+
+本模块中的函数与同步接口一一对应，它们接受一个 :class:`httpx.AsyncClient`
+代替 :class:`requests.Session`，同一个客户端中的所有请求共享其连接池和 cookies。
+页面解析和数据模型构建沿用同步接口中的实现。
+
+>>> import httpx
+>>> from mycqu import aio
+>>> async def main():
+...     async with httpx.AsyncClient() as client:
+...         await aio.login(client, "统一身份认证号", "统一身份认证密码")
+...         await aio.access_mycqu(client)
+...         return await aio.fetch_course_timetable(client, "201xxxxx")
+"""
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+import inspect
+import json
+import time
+import weakref
+from datetime import datetime
+import httpx
+from .auth import (AUTHSERVER_URL, AUTHSERVER_CAPTCHA_DETERMINE_URL, AUTHSERVER_CAPTCHA_IMAGE_URL,
+                   AUTHSERVER_LOGOUT_URL, SSO_LOGIN_URL, NeedCaptcha, NotLogined,
+                   UnknownAuthserverException, MultiSessionConflict, parse_logined_page, get_formdata)
+from .mycqu import (MYCQU_AUTHORIZE_URL, MYCQU_TOKEN_URL, MYCQU_TOKEN_INDEX_URL, MYCQU_SERVICE_URL,
+                    CODE_RE, MycquUnauthorized, MycquToken)
+from .course import (CQUSession, CQUSessionInfo, CourseTimetable, CUR_SESSION_URL, ALL_SESSIONSINFO_URL,
+                     TIMETABLE_URL, SESSION_RESOLVER)
+from .exam import Exam, EXAM_LIST_URL, encrypt_student_id
+from .score import Score, CQUWebsiteError, SCORE_URL, SCORE_HEADERS
+from .card import (EnergyFees, CardPageParser, NetworkError, ParseError,
+                   FeeAcquisitionFailed, LOGIN_URL as CARD_LOGIN_URL, FEE_ITEM_ID, HALL_TICKET_URL,
+                   TICKET_URL, SYNJONES_AUTH_URL, FEE_DATA_URL, hall_ticket_form, ticket_form,
+                   fee_data_form, parse_ticket)
+from .instrument import report, parsing
+from .utils.datetimes import TIMEZONE
+
+__all__ = ("login", "logout", "is_logined", "access_sso_service", "access_mycqu",
+           "fetch_cqu_session_info", "fetch_all_cqu_session_info", "fetch_course_timetable", "fetch_exam", "fetch_score",
+           "fetch_energy_fees")
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+# 与 requests 的默认跳转次数上限（requests.models.DEFAULT_REDIRECT_LIMIT）相同
+_MAX_REDIRECTS = 30
+_TOKENS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def is_logined(client: httpx.AsyncClient) -> bool:
+    """判断是否处于统一身份认证登陆状态，参见 :func:`.auth.is_logined`
+
+    :param client: 异步客户端
+    :type client: httpx.AsyncClient
+    :return: :obj:`True` 如果处于登陆状态，:obj:`False` 如果处于未登陆或登陆过期状态
+    :rtype: bool
+    """
+    return report("auth.is_logined", await client.get(AUTHSERVER_URL, follow_redirects=False)).status_code == 302
+
+
+async def logout(client: httpx.AsyncClient) -> None:
+    """注销统一身份认证登录状态，参见 :func:`.auth.logout`
+
+    :param client: 进行过登录的异步客户端
+    :type client: httpx.AsyncClient
+    """
+    report("auth.logout", await client.get(AUTHSERVER_LOGOUT_URL))
+
+
+async def access_sso_service(client: httpx.AsyncClient, service: str) -> httpx.Response:
+    """经由 sso.cqu.edu.cn 访问服务，参见 :func:`.auth.access_sso_service`
+
+    :param client: 登陆了统一身份认证的异步客户端
+    :type client: httpx.AsyncClient
+    :param service: 服务地址
+    :type service: str
+    :raises NotLogined: 未登陆或登陆过期
+    :raises UnknownAuthserverException: 跳转过程中出现预期之外的页面，或跳转超过 30 次仍未到达服务地址
+    :return: 到达服务地址时的响应
+    :rtype: httpx.Response
+    """
+    resp = report("sso.access",
+                  await client.get(SSO_LOGIN_URL, params={"service": service}, follow_redirects=False))
+    redirects = 0
+    while True:
+        url = str(resp.url)
+        if url.startswith(SSO_LOGIN_URL) and resp.status_code != 302:
+            if '<div class="code">adapter</div>' not in resp.text:
+                raise UnknownAuthserverException(
+                    f"unexpected page from {url} (status code {resp.status_code})")
+            location = './clientredirect?client_name=adapter'
+        elif url.startswith(AUTHSERVER_URL) and resp.status_code != 302:
+            raise NotLogined()
+        elif url.startswith(service):
+            return resp
+        elif resp.status_code in _REDIRECT_CODES:
+            location = resp.headers['Location']
+        else:
+            raise UnknownAuthserverException(
+                f"status code {resp.status_code} is got from {url} before arriving {service}")
+        if redirects >= _MAX_REDIRECTS:
+            raise UnknownAuthserverException(f"exceeded {_MAX_REDIRECTS} redirects before arriving {service}")
+        redirects += 1
+        resp = report("sso.access", await client.get(resp.url.join(location), follow_redirects=False))
+
+
+async def login(client: httpx.AsyncClient,
+                username: str,
+                password: str,
+                service: Optional[str] = None,
+                timeout: int = 10,
+                force_relogin: bool = False,
+                captcha_callback: Optional[
+                    Callable[[bytes, str], Union[Optional[str], Awaitable[Optional[str]]]]] = None,
+                keep_longer: bool = False,
+                kick_others: bool = False
+                ) -> httpx.Response:
+    """登录统一身份认证，参数及异常与 :func:`.auth.login` 相同
+
+    不同之处在于 ``captcha_callback`` 可以是异步函数；抛出的 :class:`.auth.NeedCaptcha` 中的
+    :attr:`~.auth.NeedCaptcha.after_captcha` 以及 :class:`.auth.MultiSessionConflict` 中的
+    :attr:`~.auth.MultiSessionConflict.kick`、:attr:`~.auth.MultiSessionConflict.cancel`
+    均为异步函数，需要 ``await`` 其返回值。
+
+    :param client: 用于登录统一身份认证的异步客户端
+    :type client: httpx.AsyncClient
+    :return: 登陆了统一身份认证后所跳转到的地址的响应
+    :rtype: httpx.Response
+    """
+    async def get_login_page():
+        return report("login.page", await client.get(
+            AUTHSERVER_URL,
+            params=None if service is None else {"service": service},
+            follow_redirects=False,
+            timeout=timeout))
+    login_page = await get_login_page()
+    if login_page.status_code == 302:
+        if not force_relogin:
+            return login_page
+        await logout(client)
+        login_page = await get_login_page()
+    elif login_page.status_code != 200:
+        raise UnknownAuthserverException()
+    try:
+        with parsing("login.form"):
+            formdata = get_formdata(login_page.text, username, password)
+    except ValueError:
+        await logout(client)
+        login_page = await get_login_page()
+        with parsing("login.form"):
+            formdata = get_formdata(login_page.text, username, password)
+    if keep_longer:
+        formdata['rememberMe'] = 'on'
+
+    async def after_captcha(captcha_str: Optional[str]):
+        if captcha_str is None:
+            formdata.pop("captchaResponse", None)
+        else:
+            formdata["captchaResponse"] = captcha_str
+        login_resp = report("login.post",
+                            await client.post(AUTHSERVER_URL, data=formdata, follow_redirects=False))
+
+        async def redirect_to_service():
+            return report("login.redirect",
+                          await client.get(login_resp.headers['Location'], follow_redirects=False))
+
+        if login_resp.status_code != 302:
+            with parsing("login.result"):
+                executions = parse_logined_page(login_resp.text, login_resp.status_code)
+
+            if executions is not None:
+                kick_execution, cancel_execution = executions
+
+                async def kick():
+                    nonlocal login_resp
+                    login_resp = report("login.kick", await client.post(
+                        AUTHSERVER_URL,
+                        data={"execution": kick_execution,
+                              "_eventId": "continue"},
+                        follow_redirects=False,
+                        timeout=timeout))
+                    return await redirect_to_service()
+
+                if kick_others:
+                    return await kick()
+
+                async def cancel():
+                    return report("login.cancel", await client.post(
+                        AUTHSERVER_URL,
+                        data={"execution": cancel_execution,
+                              "_eventId": "cancel"},
+                        follow_redirects=False,
+                        timeout=timeout))
+                raise MultiSessionConflict(kick=kick, cancel=cancel)  # type: ignore
+            raise UnknownAuthserverException(
+                f"status code {login_resp.status_code} is got (302 expected) when sending login post, "
+                "but can not find the element span.login_auth_error#msg")
+        return await redirect_to_service()
+
+    captcha_str = None
+    need_captcha = report("login.captcha_check",
+                          await client.get(AUTHSERVER_CAPTCHA_DETERMINE_URL, params={"username": username}))
+    if need_captcha.text == "true":
+        captcha_img_resp = report("login.captcha_image", await client.get(AUTHSERVER_CAPTCHA_IMAGE_URL))
+        image_type = captcha_img_resp.headers["Content-Type"]
+        if captcha_callback is not None:
+            captcha_str = captcha_callback(captcha_img_resp.content, image_type)
+            if inspect.isawaitable(captcha_str):
+                captcha_str = await captcha_str
+        if captcha_str is None:
+            raise NeedCaptcha(captcha_img_resp.content, image_type, after_captcha)  # type: ignore
+    return await after_captcha(captcha_str)
+
+
+async def fetch_oauth_token(client: httpx.AsyncClient) -> MycquToken:
+    """获取 my.cqu.edu.cn 的认证信息，参见 :func:`.mycqu.fetch_oauth_token`"""
+    resp = report("mycqu.authorize", await client.get(MYCQU_AUTHORIZE_URL, follow_redirects=False))
+    match = CODE_RE.search(resp.headers.get('Location', ''))
+    if not match:
+        raise UnknownAuthserverException(
+            f"status code {resp.status_code} is got when authorizing mycqu, but no code is found")
+    token_data = {
+        'client_id': 'enroll-prod',
+        'client_secret': 'app-a-1234',
+        'code': match[1],
+        'redirect_uri': MYCQU_TOKEN_INDEX_URL,
+        'grant_type': 'authorization_code'
+    }
+    now = time.time()
+    access_token = report("mycqu.token", await client.post(MYCQU_TOKEN_URL, data=token_data))
+    if access_token.status_code != 200:
+        raise UnknownAuthserverException(
+            f"status code {access_token.status_code} is got when fetching mycqu oauth token")
+    return MycquToken.from_dict(access_token.json(), now)
+
+
+async def access_mycqu(client: httpx.AsyncClient, add_to_header: bool = True,
+                       force: bool = False) -> Dict[str, str]:
+    """用登陆了统一身份认证的客户端在 my.cqu.edu.cn 进行认证，参见 :func:`.mycqu.access_mycqu`
+
+    认证信息会连同其过期时间缓存在客户端中，在其过期前再次调用时直接返回。
+
+    :param client: 登陆了统一身份认证的异步客户端
+    :type client: httpx.AsyncClient
+    :param add_to_header: 是否将 mycqu 的认证信息写入客户端的默认请求头，默认为 :obj:`True`
+    :type add_to_header: bool, optional
+    :param force: 是否忽略缓存的认证信息重新认证，默认为 :obj:`False`
+    :type force: bool, optional
+    :return: mycqu 认证信息的请求头
+    :rtype: Dict[str, str]
+    """
+    token = _TOKENS.get(client)
+    if not force and token is not None and token.is_fresh() and \
+            (not add_to_header or client.headers.get("Authorization") == token.authorization):
+        return {"Authorization": token.authorization}
+    client.headers.pop("Authorization", None)
+    await access_sso_service(client, MYCQU_SERVICE_URL)
+    token = _TOKENS[client] = await fetch_oauth_token(client)
+    if add_to_header:
+        client.headers["Authorization"] = token.authorization
+    return {"Authorization": token.authorization}
+
+
+async def fetch_cqu_session_info(client: httpx.AsyncClient) -> CQUSessionInfo:
+    """获取当前学期的学期信息，参见 :meth:`.course.CQUSessionInfo.fetch`
+
+    :param client: 在 mycqu 进行了认证（:func:`access_mycqu`）的异步客户端
+    :type client: httpx.AsyncClient
+    :raises MycquUnauthorized: 若客户端未在 my.cqu.edu.cn 认证
+    :rtype: CQUSessionInfo
+    """
+    resp = report("course.session_info", await client.get(CUR_SESSION_URL))
+    if resp.status_code == 401:
+        raise MycquUnauthorized()
+    return CQUSessionInfo.from_dict(resp.json()["data"])
+
+
+async def fetch_all_cqu_session_info(client: httpx.AsyncClient) -> List[CQUSessionInfo]:
+    """获取所有学期信息，参见 :meth:`.course.CQUSessionInfo.fetch_all`
+
+    :param client: 在 mycqu 进行了认证（:func:`access_mycqu`）的异步客户端
+    :type client: httpx.AsyncClient
+    :raises MycquUnauthorized: 若客户端未在 my.cqu.edu.cn 认证
+    :return: 按时间降序排序的学期
+    :rtype: List[CQUSessionInfo]
+    """
+    resp = report("course.session_list", await client.get(ALL_SESSIONSINFO_URL))
+    if resp.status_code == 401:
+        raise MycquUnauthorized()
+    cqusesions: List[CQUSessionInfo] = []
+    for data in resp.json()['sessionVOList']:
+        if not data['beginDate']:
+            break
+        cqusesions.append(CQUSessionInfo.from_dict(data))
+    return cqusesions
+
+
+async def _resolve_cqu_session_info(client: httpx.AsyncClient) -> CQUSessionInfo:
+    # 与 CQUSessionResolver.resolve 相同，共享同一份学期信息
+    day = datetime.now(TIMEZONE).date()
+    if SESSION_RESOLVER.needs_refresh(day):
+        SESSION_RESOLVER.update(await fetch_all_cqu_session_info(client), day)
+    info = SESSION_RESOLVER.lookup(day)
+    return info if info is not None else await fetch_cqu_session_info(client)
+
+
+async def fetch_course_timetable(client: httpx.AsyncClient, code: str,
+                                 cqu_session: Optional[Union[CQUSession, str]] = None
+                                 ) -> List[CourseTimetable]:
+    """获取学生或老师的课表，参见 :meth:`.course.CourseTimetable.fetch`
+
+    :param client: 在 mycqu 进行了认证（:func:`access_mycqu`）的异步客户端
+    :type client: httpx.AsyncClient
+    :param code: 学生或教师的学工号
+    :type code: str
+    :param cqu_session: 需要获取课表的学期，留空则获取由 :data:`.course.SESSION_RESOLVER` 确定的当前学期的课表
+    :type cqu_session: Optional[Union[CQUSession, str]], optional
+    :raises MycquUnauthorized: 若客户端未在 my.cqu.edu.cn 进行认证
+    :rtype: List[CourseTimetable]
+    """
+    if cqu_session is None:
+        cqu_session = (await _resolve_cqu_session_info(client)).session
+    elif isinstance(cqu_session, str):
+        cqu_session = CQUSession.from_str(cqu_session)
+    resp = report("course.timetable", await client.post(TIMETABLE_URL,
+                                                        params={"sessionId": cqu_session.get_id()},
+                                                        json=[code]))
+    if resp.status_code == 401:
+        raise MycquUnauthorized()
+    with parsing("course.timetable.decode"):
+        timetables = resp.json()['classTimetableVOList']
+    with parsing("course.timetable.from_dict"):
+        return [CourseTimetable.from_dict(timetable) for timetable in timetables
+                if timetable["teachingWeekFormat"]]
+
+
+async def fetch_exam(client: httpx.AsyncClient, student_id: str) -> List[Exam]:
+    """获取指定学生的考表，参见 :meth:`.exam.Exam.fetch`
+
+    :param client: 异步客户端，无需登录
+    :type client: httpx.AsyncClient
+    :param student_id: 学生学号
+    :type student_id: str
+    :rtype: List[Exam]
+    """
+    resp = report("exam.list",
+                  await client.get(EXAM_LIST_URL, params={"studentId": encrypt_student_id(student_id)}))
+    with parsing("exam.decode"):
+        exams = resp.json()["data"]["content"]
+    with parsing("exam.from_dict"):
+        return [Exam.from_dict(exam) for exam in exams]
+
+
+async def fetch_score(client: httpx.AsyncClient, auth: Optional[str] = None) -> List[Score]:
+    """获取成绩，参见 :meth:`.score.Score.fetch`
+
+    :param client: 异步客户端，``auth`` 为 :obj:`None` 时需要已在 mycqu 进行认证（:func:`access_mycqu`）
+    :type client: httpx.AsyncClient
+    :param auth: 登陆后获取的 authorization，留空则使用客户端自身的认证信息
+    :type auth: Optional[str], optional
+    :raises CQUWebsiteError: 查询时教务网报错
+    :raises MycquUnauthorized: 若未在 my.cqu.edu.cn 进行认证
+    :rtype: List[Score]
+    """
+    headers = None if auth is None else {**SCORE_HEADERS, 'Authorization': auth}
+    res = report("score.fetch", await client.get(SCORE_URL, headers=headers))
+    with parsing("score.decode"):
+        content: Dict[str, Any] = json.loads(res.content)
+    if content['status'] == 'error':
+        raise CQUWebsiteError(content['msg'])
+    if res.status_code == 401:
+        raise MycquUnauthorized()
+    with parsing("score.from_dict"):
+        return [Score.from_dict(course)
+                for courses in content['data'].values()
+                for course in courses['stuScoreHomePgVoS']]
+
+
+async def fetch_energy_fees(client: httpx.AsyncClient, isHuxi: bool, room: str) -> EnergyFees:
+    """获取水电费信息，参见 :meth:`.card.EnergyFees.fetch`
+
+    :param client: 登录了统一身份认证（:func:`login`）的异步客户端
+    :type client: httpx.AsyncClient
+    :param isHuxi: 房间号是否为虎溪校区的房间
+    :type isHuxi: bool
+    :param room: 需要获取水电费详情的宿舍
+    :type room: str
+    :raises NetworkError: 当访问相关网页时statue code不为200时抛出
+    :raises TicketGetError: 当未能从网页对应位置中获取到ticket时抛出
+    :raises ParseError: 当从返回数据解析所需值失败时抛出
+    :raises FeeAcquisitionFailed: 当网页获取水电费状态码不为success时抛出
+    :rtype: EnergyFees
+    """
+    res = report("card.login", await client.get(CARD_LOGIN_URL, follow_redirects=True))
+    parser = CardPageParser()
+    parser.feed(res.text)
+    res = report("card.hall_ticket",
+                 await client.post(HALL_TICKET_URL, data=hall_ticket_form(parser.ssoticket_id)))
+    if res.status_code != 200:
+        raise NetworkError()
+    res = report("card.ticket", await client.post(TICKET_URL, data=ticket_form()))
+    if res.status_code != 200:
+        raise NetworkError()
+    ticket = parse_ticket(res.text)
+    res = report("card.synjones_auth", await client.post(SYNJONES_AUTH_URL, data={'ticket': ticket}))
+    if res.status_code != 200:
+        raise NetworkError()
+    try:
+        synjones_auth = 'bearer ' + res.json()['data']['access_token']
+    except Exception:
+        raise ParseError()
+    res = report("card.fee_data", await client.post(
+        FEE_DATA_URL,
+        data=fee_data_form(room, FEE_ITEM_ID['Huxi'] if isHuxi else FEE_ITEM_ID['Old']),
+        headers={'Cookie': 'synjones-auth=' + synjones_auth}))
+    if res.status_code != 200:
+        raise NetworkError()
+    dic = res.json()
+    if dic['msg'] != 'success':
+        raise FeeAcquisitionFailed(dic['msg'])
+    return EnergyFees.from_dict(dic["map"]["showData"])
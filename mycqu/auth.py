@@ -1,13 +1,17 @@
 """统一身份认证相关的模块
 """
-from typing import Dict, Optional, Callable
+from typing import Dict, Optional, Callable, Tuple
+import contextvars
 import random
 import re
 from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor
+from html import unescape
 from html.parser import HTMLParser
 from urllib.parse import parse_qs, urlsplit
 from requests import Session, Response, cookies
 from ._lib_wrapper.encrypt import pad, aes_cbc_encryptor
+from .instrument import report, parsing
 
 __all__ = ("NotAllowedService", "NeedCaptcha", "InvaildCaptcha",
            "IncorrectLoginCredentials", "UnknownAuthserverException", "NotLogined",
@@ -19,6 +23,8 @@ AUTHSERVER_CAPTCHA_IMAGE_URL = "http://authserver.cqu.edu.cn/authserver/captcha.
 AUTHSERVER_LOGOUT_URL = "http://authserver.cqu.edu.cn/authserver/logout"
 SSO_LOGIN_URL = "https://sso.cqu.edu.cn/login"
 _CHAR_SET = 'ABCDEFGHJKMNPQRSTWXYZabcdefhijkmnprstwxyz2345678'
+# parallel 登录时查询验证码、预先获取验证码图片的线程池，在所有登录之间共用，线程在需要时才创建
+_PARALLEL_LOGIN_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mycqu-login")
 
 
 def _random_str(length: int):
@@ -186,19 +192,132 @@ class LoginedPageParser(HTMLParser):  # pylint: ignore disable=missing-class-doc
                 )
 
 
+# 标签中的属性，值可以用双引号、单引号或不用引号
+_ATTR_RE: re.Pattern = re.compile(r"""([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+_LOGIN_INPUTS = ('lt', 'dllt', 'execution', '_eventId', 'rmShown')
+_AUTH_ERROR_RE: re.Pattern = re.compile(r'<div id="msg" class="errors">.*?<h2[^>]*>(.*?)</h2>', re.S)
+_LOGIN_ERROR_RE: re.Pattern = re.compile(r'<span id="msg" class="login_auth_error">(.*?)</span>', re.S)
+_TAG_RE: re.Pattern = re.compile(r'<[^>]*>')
+
+
+def _tag_attrs(html: str, start: int, end: int) -> Dict[str, Optional[str]]:
+    attrs: Dict[str, Optional[str]] = {}
+    for match in _ATTR_RE.finditer(html, start, end):
+        value = match[2] if match[2] is not None else match[3] if match[3] is not None else match[4]
+        attrs.setdefault(match[1].lower(), None if value is None else unescape(value))
+    return attrs
+
+
+def _text(html: str) -> str:
+    # 去掉其中嵌套的标签，得到文本
+    return unescape(_TAG_RE.sub('', html)).strip()
+
+
+def _form_span(html: str, form_id: str) -> Optional[Tuple[int, int]]:
+    pos = html.find(f'id="{form_id}"')
+    if pos < 0:
+        return None
+    end = html.find('</form>', pos)
+    return pos, len(html) if end < 0 else end
+
+
+def _input_values(html: str, names: Tuple[str, ...], start: int = 0, end: int = -1,
+                  last_wins: bool = False) -> Dict[str, Optional[str]]:
+    # 依次查找 input 标签；last_wins 为 False 时同名的取第一个，names 中的都找到后立即停止，
+    # 否则与 HTMLParser 的实现一样同名的取最后一个，需要查找到 end 为止
+    values: Dict[str, Optional[str]] = {}
+    end = len(html) if end < 0 else end
+    pos = html.find('<input', start, end)
+    while pos >= 0 and (last_wins or len(values) < len(names)):
+        tag_end = html.find('>', pos)
+        if tag_end < 0:
+            break
+        if 'name=' in html[pos:tag_end]:
+            attrs = _tag_attrs(html, pos + 6, tag_end)
+            name = attrs.get('name')
+            if name in names and (last_wins or name not in values):
+                values[name] = attrs.get('value')
+        pos = html.find('<input', tag_end, end)
+    return values
+
+
+def parse_auth_page(html: str) -> Tuple[Dict[str, Optional[str]], Optional[str]]:
+    """从统一身份认证的登录页面中获取登录表单所需的隐藏字段和加密密码所用的盐
+
+    不对整个页面进行 HTML 解析，而是直接查找所需的字段：页面中有 ``casLoginForm`` 表单时只在该表单中查找，全部找到后即停止；
+    否则与 :class:`AuthPageParser` 一样在整个页面中查找，同名的字段取最后一个。
+
+    :param html: 登录页面
+    :type html: str
+    :raises NotAllowedService: 试图认证不允许的服务
+    :raises UnknownAuthserverException: 页面中有其他错误信息
+    :return: 隐藏字段（``lt``、``dllt``、``execution``、``_eventId``、``rmShown``，找不到的为 :obj:`None`）和盐（找不到时为 :obj:`None`）
+    :rtype: Tuple[Dict[str, Optional[str]], Optional[str]]
+    """
+    if 'class="errors"' in html:
+        match = _AUTH_ERROR_RE.search(html)
+        if match:
+            error_str = _text(match[1])
+            if error_str == "应用未注册":
+                raise NotAllowedService(error_str)
+            raise UnknownAuthserverException("Error message before login: " + error_str)
+    # 页面中可能还有其他登录方式（如动态码登录）的表单，其中也有 lt、dllt 等同名字段
+    span = _form_span(html, "casLoginForm")
+    values = _input_values(html, _LOGIN_INPUTS, last_wins=True) if span is None else _input_values(html, _LOGIN_INPUTS, *span)
+    salt_match = AuthPageParser._SALT_RE.search(html)  # pylint: disable=protected-access
+    return {name: values.get(name) for name in _LOGIN_INPUTS}, salt_match and salt_match[1]
+
+
+def _form_execution(html: str, form_id: str) -> str:
+    span = _form_span(html, form_id)
+    if span is None:
+        return ""
+    return _input_values(html, ('execution',), *span).get('execution') or ""
+
+
+def parse_logined_page(html: str, status_code: int) -> Optional[Tuple[str, str]]:
+    """解析提交登录表单后没有跳转（状态码不是 302）时的页面
+
+    与 :class:`LoginedPageParser` 一样识别错误信息和“单处登录”的冲突页面，但不对整个页面进行 HTML 解析。
+
+    :param html: 页面
+    :type html: str
+    :param status_code: 页面的状态码，用于错误信息
+    :type status_code: int
+    :raises InvaildCaptcha: 无效的验证码
+    :raises IncorrectLoginCredentials: 错误的登陆凭据
+    :raises UnknownAuthserverException: 页面中有其他错误信息
+    :return: 页面是“单处登录”的冲突页面时为踢出其他会话和取消登录所需的 ``execution``，否则为 :obj:`None`
+    :rtype: Optional[Tuple[str, str]]
+    """
+    match = _LOGIN_ERROR_RE.search(html)
+    if match:
+        error_str = _text(match[1])
+        if error_str == "无效的验证码":
+            raise InvaildCaptcha()
+        if error_str == "您提供的用户名或者密码有误":
+            raise IncorrectLoginCredentials()
+        raise UnknownAuthserverException(
+            f"status code {status_code} is got (302 expected)"
+            f" when sending login post, {error_str}"
+        )
+    if '<table class="kick_table">' not in html:
+        return None
+    return _form_execution(html, "continue"), _form_execution(html, "cancel")
+
+
 def get_formdata(html: str, username: str, password: str) -> Dict[str, Optional[str]]:
     # from https://github.com/CQULHW/CQUQueryGrade
-    parser = AuthPageParser()
-    parser.feed(html)
-    if not parser.salt:
-        ValueError("无法获取盐")
+    input_data, salt = parse_auth_page(html)
+    if not salt:
+        raise ValueError("无法获取盐")
     passwd_pkcs7 = pad((_random_str(64)+str(password)).encode())
     encryptor = aes_cbc_encryptor(
-        parser.salt.encode(), _random_str(16).encode())
+        salt.encode(), _random_str(16).encode())
     passwd_encrypted = b64encode(encryptor(passwd_pkcs7)).decode()
-    parser.input_data['username'] = username
-    parser.input_data['password'] = passwd_encrypted
-    return parser.input_data
+    input_data['username'] = username
+    input_data['password'] = passwd_encrypted
+    return input_data
 
 
 def is_logined(session: Session) -> bool:
@@ -209,7 +328,7 @@ def is_logined(session: Session) -> bool:
     :return: :obj:`True` 如果处于登陆状态，:obj:`False` 如果处于未登陆或登陆过期状态
     :rtype: bool
     """
-    return session.get(AUTHSERVER_URL, allow_redirects=False).status_code == 302
+    return report("auth.is_logined", session.get(AUTHSERVER_URL, allow_redirects=False)).status_code == 302
 
 
 def logout(session: Session) -> None:
@@ -218,18 +337,32 @@ def logout(session: Session) -> None:
     :param session: 进行过登录的会话
     :type session: Session
     """
-    session.get("http://authserver.cqu.edu.cn/authserver/logout")
+    report("auth.logout", session.get("http://authserver.cqu.edu.cn/authserver/logout"))
 
 
 def access_sso_service(session: Session, service: str) -> Response:
+    """经由 sso.cqu.edu.cn 访问服务
+
+    :param session: 登陆了统一身份认证的会话
+    :type session: Session
+    :param service: 服务地址
+    :type service: str
+    :raises NotLogined: 未登陆或登陆过期
+    :raises UnknownAuthserverException: 跳转过程中出现预期之外的页面
+    :return: 到达服务地址时的响应
+    :rtype: Response
+    """
     class ArriveService(Exception):
         def __init__(self, response: Response):
             super().__init__()
             self.response: Response = response
 
     def response_hook(response: Response, *args, **kwargs):
+        report("sso.access", response, history=False)
         if response.url.startswith(SSO_LOGIN_URL) and response.status_code != 302:
-            assert '<div class="code">adapter</div>' in response.text
+            if '<div class="code">adapter</div>' not in response.text:
+                raise UnknownAuthserverException(
+                    f"unexpected page from {response.url} (status code {response.status_code})")
             response.headers['Location'] = './clientredirect?client_name=adapter'
             response.status_code = 302
             return response
@@ -240,23 +373,36 @@ def access_sso_service(session: Session, service: str) -> Response:
             raise ArriveService(response)
 
     try:
-        assert not session.get(SSO_LOGIN_URL,
-                               params={"service": service},
-                               allow_redirects=True,
-                               hooks={"response": response_hook}
-                               )
+        resp = session.get(SSO_LOGIN_URL,
+                           params={"service": service},
+                           allow_redirects=True,
+                           hooks={"response": response_hook}
+                           )
     except ArriveService as arrive_service:
         return arrive_service.response
+    raise UnknownAuthserverException(
+        f"status code {resp.status_code} is got from {resp.url} before arriving {service}")
 
 
 def access_service(session: Session, service: str) -> Response:
-    resp = session.get(AUTHSERVER_URL,
-                       params={"service": service},
-                       allow_redirects=False)
+    resp = report("auth.access_service", session.get(AUTHSERVER_URL,
+                                                     params={"service": service},
+                                                     allow_redirects=False))
     if resp.status_code != 302:
-        AuthPageParser().feed(resp.text)
+        parse_auth_page(resp.text)
         raise NotLogined()
-    return session.get(url=resp.headers['Location'], allow_redirects=False)
+    return report("auth.access_service", session.get(url=resp.headers['Location'], allow_redirects=False))
+
+
+def _detached(session: Session) -> Session:
+    # 与 session 共用连接池和设置，但使用 cookie 副本的会话，其响应不会改变 session 的 cookie
+    detached = Session()
+    detached.headers = session.headers.copy()
+    detached.cookies = session.cookies.copy()
+    detached.auth, detached.proxies, detached.verify, detached.cert, detached.trust_env = \
+        session.auth, session.proxies, session.verify, session.cert, session.trust_env
+    detached.adapters = session.adapters
+    return detached
 
 
 def login(session: Session,
@@ -268,7 +414,8 @@ def login(session: Session,
           captcha_callback: Optional[
               Callable[[bytes, str], Optional[str]]] = None,
           keep_longer: bool = False,
-          kick_others: bool = False
+          kick_others: bool = False,
+          parallel: bool = False
           ) -> Response:
     """登录统一身份认证
 
@@ -294,6 +441,9 @@ def login(session: Session,
     :param kick_others: 当目标用户开启了“单处登录”并有其他登录会话时，踢出其他会话并登录单前会话；若该参数为 :obj:`False` 则抛出
                        :class:`MultiSessionConflict`
     :type kick_others: bool
+    :param parallel: 为 :obj:`True` 时，在另一线程中与获取登录页面同时查询是否需要验证码（使用 cookie 的副本，不影响会话），
+                     查询未完成时还会预先获取验证码图片；结果和抛出的异常与顺序登录相同，默认为 :obj:`False`
+    :type parallel: bool, optional
     :raises UnknownAuthserverException: 未知认证错误
     :raises InvaildCaptcha: 无效的验证码
     :raises IncorrectLoginCredentials: 错误的登陆凭据（如错误的密码、用户名）
@@ -303,11 +453,35 @@ def login(session: Session,
     :rtype: Response
     """
     def get_login_page():
-        return session.get(
+        return report("login.page", session.get(
             url=AUTHSERVER_URL,
             params=None if service is None else {"service": service},
             allow_redirects=False,
-            timeout=timeout)
+            timeout=timeout))
+    executor: Optional[ThreadPoolExecutor] = None
+    need_captcha: Optional[Future] = None
+    if parallel:
+        executor = _PARALLEL_LOGIN_EXECUTOR
+        # 是否需要验证码只取决于用户名
+        # 在调用者上下文的副本中进行，保留 scheduler.priority 等设置
+        need_captcha = executor.submit(
+            contextvars.copy_context().run, lambda: report("login.captcha_check", _detached(session).get(
+                AUTHSERVER_CAPTCHA_DETERMINE_URL, params={"username": username})))
+    return _login(session, username, password, get_login_page, timeout, force_relogin, captcha_callback,
+                  keep_longer, kick_others, executor, need_captcha)
+
+
+def _login(session: Session,
+           username: str,
+           password: str,
+           get_login_page: Callable[[], Response],
+           timeout: int,
+           force_relogin: bool,
+           captcha_callback: Optional[Callable[[bytes, str], Optional[str]]],
+           keep_longer: bool,
+           kick_others: bool,
+           executor: Optional[ThreadPoolExecutor],
+           need_captcha: Optional[Future]) -> Response:
     login_page = get_login_page()
     if login_page.status_code == 302:
         if not force_relogin:
@@ -318,10 +492,12 @@ def login(session: Session,
     elif login_page.status_code != 200:
         raise UnknownAuthserverException()
     try:
-        formdata = get_formdata(login_page.text, username, password)
+        with parsing("login.form"):
+            formdata = get_formdata(login_page.text, username, password)
     except ValueError:
         logout(session)
-        formdata = get_formdata(get_login_page().text, username, password)
+        with parsing("login.form"):
+            formdata = get_formdata(get_login_page().text, username, password)
     if keep_longer:
         formdata['rememberMe'] = 'on'
 
@@ -331,39 +507,39 @@ def login(session: Session,
                 del formdata["captchaResponse"]
         else:
             formdata["captchaResponse"] = captcha_str
-        login_resp = session.post(
-            url=AUTHSERVER_URL, data=formdata, allow_redirects=False)
+        login_resp = report("login.post", session.post(
+            url=AUTHSERVER_URL, data=formdata, allow_redirects=False))
 
         def redirect_to_service():
-            return session.get(url=login_resp.headers['Location'], allow_redirects=False)
+            return report("login.redirect", session.get(url=login_resp.headers['Location'], allow_redirects=False))
 
         if login_resp.status_code != 302:
-            parser = LoginedPageParser(login_resp.status_code)
-            parser.feed(login_resp.text)
+            with parsing("login.result"):
+                executions = parse_logined_page(login_resp.text, login_resp.status_code)
+
+            if executions is not None:
+                kick_execution, cancel_execution = executions
 
-            if parser._kick:  # pylint: ignore disable=protected-access
                 def kick():
                     nonlocal login_resp
-                    # pylint: ignore disable=protected-access
-                    login_resp = session.post(
+                    login_resp = report("login.kick", session.post(
                         url=AUTHSERVER_URL,
-                        data={"execution": parser._kick_execution,
+                        data={"execution": kick_execution,
                               "_eventId": "continue"},
                         allow_redirects=False,
-                        timeout=timeout)
+                        timeout=timeout))
                     return redirect_to_service()
 
                 if kick_others:
                     return kick()
                 else:
                     def cancel():
-                        # pylint: ignore disable=protected-access
-                        return session.post(
+                        return report("login.cancel", session.post(
                             url=AUTHSERVER_URL,
-                            data={"execution": parser._cancel_execution,
+                            data={"execution": cancel_execution,
                                   "_eventId": "cancel"},
                             allow_redirects=False,
-                            timeout=timeout)
+                            timeout=timeout))
                     raise MultiSessionConflict(kick=kick, cancel=cancel)
             raise UnknownAuthserverException(
                 f"status code {login_resp.status_code} is got (302 expected) when sending login post, "
@@ -371,8 +547,30 @@ def login(session: Session,
         return redirect_to_service()
 
     captcha_str = None
-    if session.get(AUTHSERVER_CAPTCHA_DETERMINE_URL, params={"username": username}).text == "true":
-        captcha_img_resp = session.get(AUTHSERVER_CAPTCHA_IMAGE_URL)
+    captcha_image: Optional[Future] = None
+    if need_captcha is None:
+        captcha_needed = report("login.captcha_check", session.get(
+            AUTHSERVER_CAPTCHA_DETERMINE_URL, params={"username": username})).text == "true"
+    else:
+        assert executor is not None
+        if not need_captcha.done():
+            # 验证码图片与会话的 cookie 绑定，只能在获取登录页面之后获取；此时查询还没有结果，则先获取图片，不需要时丢弃。
+            # 使用带有登录页面 cookie 的副本，避免在其他线程中与之后的登录请求同时使用 session
+            speculative = _detached(session)
+            captcha_image = executor.submit(
+                contextvars.copy_context().run,
+                lambda: report("login.captcha_image", speculative.get(AUTHSERVER_CAPTCHA_IMAGE_URL)))
+        captcha_needed = need_captcha.result().text == "true"
+        if captcha_image is not None and not captcha_needed:
+            # 不需要验证码时不等待图片：尚未开始则取消，已经开始的在副本上完成，其结果被丢弃
+            captcha_image.cancel()
+            captcha_image = None
+    if captcha_needed:
+        if captcha_image is None:
+            captcha_img_resp = report("login.captcha_image", session.get(AUTHSERVER_CAPTCHA_IMAGE_URL))
+        else:
+            captcha_img_resp = captcha_image.result()
+            cookies.merge_cookies(session.cookies, captcha_img_resp.cookies)
         if captcha_callback is None:
             raise NeedCaptcha(captcha_img_resp.content,
                               captcha_img_resp.headers["Content-Type"],
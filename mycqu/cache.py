@@ -0,0 +1,151 @@
+"""用于很少变化的公共资源（如学期列表）的响应缓存
+"""
+from __future__ import annotations
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+import threading
+import time
+from collections import OrderedDict
+from types import ModuleType
+from requests import Response, Session
+from requests.structures import CaseInsensitiveDict
+
+__all__ = ("ResponseCache",)
+
+# 缓存并在重新验证时使用的响应头
+_KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class _Entry:
+    __slots__ = ("status_code", "content", "headers", "encoding", "expires_at")
+
+    def __init__(self, response: Response, expires_at: float):
+        self.status_code: int = response.status_code
+        self.content: bytes = response.content
+        self.headers: Dict[str, str] = {key: response.headers[key] for key in _KEPT_HEADERS
+                                        if key in response.headers}
+        self.encoding: Optional[str] = response.encoding
+        self.expires_at: float = expires_at
+
+    def to_response(self, url: str) -> Response:
+        response = Response()
+        response.status_code = self.status_code
+        response._content = self.content  # pylint: disable=protected-access
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        response.url = url
+        return response
+
+
+class ResponseCache:
+    """带有过期时间和 LRU 淘汰的 GET 响应缓存，可以在多个会话之间共享
+
+    缓存以地址（含参数）为键，不区分发出请求的会话及其认证信息，因此只应用于无需认证、不因用户而异的资源；
+    需要认证的资源命中缓存时不会返回 401，会掩盖会话的过期。
+    只有状态码为 200 的响应会被缓存；缓存过期后，若响应带有 ``ETag`` 或 ``Last-Modified``，
+    则发出条件请求，服务器返回 304 时沿用缓存的内容。
+
+    >>> cache = ResponseCache(ttls={"https://my.cqu.edu.cn/api/timetable/optionFinder/": 24 * 3600})
+    >>> resp = cache.get(requests, "https://my.cqu.edu.cn/api/timetable/optionFinder/session?blankOption=false")
+
+    :param ttls: 地址前缀到缓存时长（秒）的映射，地址匹配多个前缀时使用最长的那个
+    :type ttls: Optional[Mapping[str, float]], optional
+    :param default_ttl: 不匹配 ``ttls`` 中任何前缀的地址的缓存时长（秒），默认为 600
+    :type default_ttl: float, optional
+    :param maxsize: 最多缓存的响应数，默认为 128
+    :type maxsize: int, optional
+    :param max_bytes: 缓存的响应内容的总字节数上限，默认为 4 MiB
+    :type max_bytes: int, optional
+    """
+
+    def __init__(self,
+                 ttls: Optional[Mapping[str, float]] = None,
+                 default_ttl: float = 600,
+                 maxsize: int = 128,
+                 max_bytes: int = 4 << 20):
+        self.ttls: Dict[str, float] = dict(ttls or {})
+        self.default_ttl: float = default_ttl
+        self.maxsize: int = maxsize
+        self.max_bytes: int = max_bytes
+        self._entries: OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], _Entry] = OrderedDict()
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+    def ttl_for(self, url: str) -> float:
+        """获取某一地址的缓存时长（秒）
+
+        :param url: 地址
+        :type url: str
+        :rtype: float
+        """
+        prefixes = [prefix for prefix in self.ttls if url.startswith(prefix)]
+        return self.ttls[max(prefixes, key=len)] if prefixes else self.default_ttl
+
+    def get(self, http: Union[Session, ModuleType], url: str,
+            params: Optional[Mapping[str, Any]] = None, ttl: Optional[float] = None) -> Response:
+        """以 GET 获取某一地址，缓存未过期时直接返回缓存的响应而不发出请求
+
+        :param http: 用于发出请求的会话（或 :mod:`requests` 模块本身）
+        :type http: Union[Session, ModuleType]
+        :param url: 地址
+        :type url: str
+        :param params: 查询参数
+        :type params: Optional[Mapping[str, Any]], optional
+        :param ttl: 缓存时长（秒），默认由 :meth:`ttl_for` 决定
+        :type ttl: Optional[float], optional
+        :return: 响应，可能是由缓存构造的
+        :rtype: Response
+        """
+        key = (url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        now = time.time()
+        if entry is not None and entry.expires_at > now:
+            return entry.to_response(url)
+
+        headers = {}
+        if entry is not None:
+            if "ETag" in entry.headers:
+                headers["If-None-Match"] = entry.headers["ETag"]
+            if "Last-Modified" in entry.headers:
+                headers["If-Modified-Since"] = entry.headers["Last-Modified"]
+        response = http.get(url, params=params, headers=headers)
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        if entry is not None and headers and response.status_code == 304:
+            with self._lock:
+                # 请求期间该条缓存可能已被淘汰或被其他线程替换，此时不再延长它
+                if self._entries.get(key) is entry:
+                    entry.expires_at = time.time() + ttl
+                    self._entries.move_to_end(key)
+            return entry.to_response(url)
+        if response.status_code == 200 and "no-store" not in response.headers.get("Cache-Control", ""):
+            self._store(key, _Entry(response, time.time() + ttl))
+        return response
+
+    def _store(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], entry: _Entry) -> None:
+        size = len(entry.content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.content)
+            self._entries[key] = entry
+            self._size += size
+            while len(self._entries) > self.maxsize or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+
+    def invalidate(self, url_prefix: str = "") -> None:
+        """删除地址以 ``url_prefix`` 开头的缓存，默认删除全部缓存
+
+        :param url_prefix: 地址前缀
+        :type url_prefix: str, optional
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0].startswith(url_prefix)]:
+                self._size -= len(self._entries.pop(key).content)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -3,21 +3,39 @@
 """
 from __future__ import annotations
 
-import requests
 from requests import Session
 import json
-from typing import Any, Dict, Optional, Tuple, List, Union, ClassVar
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, List, Union, ClassVar, Iterable, Iterator
+from weakref import WeakKeyDictionary
 from ._lib_wrapper.dataclass import dataclass
+from .connection import get_default_session, new_session
+from .instrument import report
+from .utils.concurrent import imap_unordered
 from html.parser import HTMLParser
 
 __all__ = ("EnergyFees",)
 
 LOGIN_URL = 'http://authserver.cqu.edu.cn/authserver/login?service=http://card.cqu.edu.cn:7280/ias/prelogin?sysid=FWDT'
+HALL_TICKET_URL = 'http://card.cqu.edu.cn/cassyno/index'
+TICKET_URL = 'http://card.cqu.edu.cn/Page/Page'
+SYNJONES_AUTH_URL = 'http://card.cqu.edu.cn:8080/blade-auth/token/fwdt'
+FEE_DATA_URL = 'http://card.cqu.edu.cn:8080/charge/feeitem/getThirdData'
 
 # 缴费大厅页面的不同缴费项目的id不同，虎溪和老校区不同
 FEE_ITEM_ID = {'Huxi': '182',
                'Old': '181'}
 
+# synjones-auth 的缓存时长（秒），缓存的值被服务器拒绝时也会重新获取
+SYNJONES_AUTH_TTL = 1800
+_synjones_auth_cache: WeakKeyDictionary[Session, Tuple[str, float]] = WeakKeyDictionary()
+_synjones_auth_lock = threading.Lock()
+# 每个会话一把锁，同一会话同时只进行一次获取 synjones-auth 的请求链
+_synjones_auth_refresh_locks: WeakKeyDictionary[Session, threading.Lock] = WeakKeyDictionary()
+# synjones-auth 失效时查询水电费返回的 msg（状态码为 200），状态码为 401 时也视为失效
+SYNJONES_AUTH_REJECTED_MSGS = ("未登录",)
+
 
 class NetworkError(Exception):
     """
@@ -45,6 +63,12 @@ class FeeAcquisitionFailed(Exception):
         super().__init__("获取水电费发生异常，返回状态：" + error_msg)
 
 
+class SynjonesAuthRejected(FeeAcquisitionFailed, NetworkError):
+    """
+    当 synjones-auth 被服务器拒绝（如已失效）时抛出，同时是 :class:`FeeAcquisitionFailed` 和 :class:`NetworkError` 的子类
+    """
+
+
 class CardPageParser(HTMLParser):
     def __init__(self):
         super().__init__()
@@ -60,7 +84,67 @@ class CardPageParser(HTMLParser):
                     break
 
 
-def get_fees_info_raw(session: Session, isHuxi: bool, room: str):
+def _cached_synjones_auth(session: Session, stale: Optional[str]) -> Optional[str]:
+    with _synjones_auth_lock:
+        cached = _synjones_auth_cache.get(session)
+    if cached is not None and cached[1] > time.time() and cached[0] != stale:
+        return cached[0]
+    return None
+
+
+def _synjones_auth(session: Session, refresh: bool = False, stale: Optional[str] = None) -> Tuple[str, bool]:
+    # 返回 synjones-auth 及其是否是刚获取的，缓存的值等于 stale 时也重新获取
+    if not refresh:
+        cached = _cached_synjones_auth(session, stale)
+        if cached is not None:
+            return cached, False
+    with _synjones_auth_lock:
+        lock = _synjones_auth_refresh_locks.get(session)
+        if lock is None:
+            lock = _synjones_auth_refresh_locks[session] = threading.Lock()
+    with lock:
+        # 等待期间其他线程可能已经重新获取过
+        if not refresh:
+            cached = _cached_synjones_auth(session, stale)
+            if cached is not None:
+                return cached, False
+        return _fetch_synjones_auth(session), True
+
+
+def _fetch_synjones_auth(session: Session) -> str:
+    res = report("card.login", session.get(LOGIN_URL))
+
+    # 获取ssoticketid
+    parser = CardPageParser()
+    parser.feed(res.text)
+    ssoticket_id = parser.ssoticket_id
+    get_hall_ticket(session, ssoticket_id)
+    ticket = get_ticket(session)
+    synjones_auth = get_synjones_auth(ticket, session)
+    with _synjones_auth_lock:
+        _synjones_auth_cache[session] = (synjones_auth, time.time() + SYNJONES_AUTH_TTL)
+    return synjones_auth
+
+
+def get_session_synjones_auth(session: Session, refresh: bool = False) -> str:
+    """ 获取访问 card.cqu.edu.cn:8080 所需的 synjones-auth
+
+    获取需要依次访问四个页面，结果按会话缓存 :data:`SYNJONES_AUTH_TTL` 秒
+
+    :param session: 登录了统一身份认证（:func:`.auth.login`）的 requests 会话
+    :type session: Session
+    :param refresh: 是否忽略缓存重新获取，默认为 :obj:`False`
+    :type refresh: bool, optional
+    :raises NetworkError: 当访问相关网页时statue code不为200时抛出
+    :raises TicketGetError: 当未能从网页对应位置中获取到ticket时抛出
+    :raises ParseError: 当从返回数据解析所需值失败时抛出
+    :return: 可直接作为 ``synjones-auth`` cookie 的值
+    :rtype: str
+    """
+    return _synjones_auth(session, refresh)[0]
+
+
+def get_fees_info_raw(session: Session, isHuxi: bool, room: str, http: Optional[Session] = None):
     """ 从card.cqu.edu.cn获取水电费详情
 
     :param session: 登录了统一身份认证（:func:`.auth.login`）的 requests 会话
@@ -69,6 +153,8 @@ def get_fees_info_raw(session: Session, isHuxi: bool, room: str):
     :type isHuxi: bool
     :param room: 需要获取水电费详情的宿舍
     :type room: str
+    :param http: 查询水电费时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+    :type http: Optional[Session], optional
     :raises NetworkError: 当访问相关网页时statue code不为200时抛出
     :raises TicketGetError: 当未能从网页对应位置中获取到ticket时抛出
     :raises ParseError: 当从返回数据解析所需值失败时抛出
@@ -76,16 +162,16 @@ def get_fees_info_raw(session: Session, isHuxi: bool, room: str):
     :return: 反序列化获取水电费信息的json
     :rtype: dict
     """
-    res = session.get(LOGIN_URL)
-
-    # 获取ssoticketid
-    parser = CardPageParser()
-    parser.feed(res.text)
-    ssoticket_id = parser.ssoticket_id
-    get_hall_ticket(session, ssoticket_id)
-    ticket = get_ticket(session)
-    synjones_auth = get_synjones_auth(ticket)
-    return get_fee_data(synjones_auth, room, FEE_ITEM_ID['Huxi'] if isHuxi else FEE_ITEM_ID['Old'])
+    fee_item_id = FEE_ITEM_ID['Huxi'] if isHuxi else FEE_ITEM_ID['Old']
+    synjones_auth, fresh = _synjones_auth(session)
+    try:
+        return get_fee_data(synjones_auth, room, fee_item_id, http)
+    except SynjonesAuthRejected:
+        # 只有 synjones-auth 被拒绝时才重新获取，房间号无效等其他错误直接抛出
+        if fresh:
+            raise
+    # 缓存的 synjones-auth 可能已经失效，若其他线程已经重新获取过则直接使用
+    return get_fee_data(_synjones_auth(session, stale=synjones_auth)[0], room, fee_item_id, http)
 
 
 @dataclass
@@ -130,48 +216,111 @@ class EnergyFees:
         """
         return EnergyFees.from_dict(get_fees_info_raw(session, isHuxi, room)["map"]["showData"])
 
+    @staticmethod
+    def fetch_many(session: Session, isHuxi: bool, rooms: Iterable[str], concurrency: int = 8,
+                   http: Optional[Session] = None, return_exceptions: bool = False
+                   ) -> Iterator[Tuple[str, Union[EnergyFees, Exception]]]:
+        """并发获取多个宿舍的水电费信息，按完成的先后逐个产生结果
 
-# 获取hallticket
-def get_hall_ticket(session, ssoticket_id):
-    url = 'http://card.cqu.edu.cn/cassyno/index'
-    data = {
+        所有宿舍共用一次获取的 synjones-auth（参见 :func:`get_session_synjones_auth`），
+        ``rooms`` 被逐步消费，同时进行中的请求不超过 ``concurrency`` 个。
+
+        >>> for room, fees in EnergyFees.fetch_many(session, True, rooms, concurrency=16):
+        ...     if fees.balance < 10:
+        ...         alert(room)
+
+        :param session: 登录了统一身份认证（:func:`.auth.login`）的 requests 会话
+        :type session: Session
+        :param isHuxi: 房间号是否为虎溪校区的房间
+        :type isHuxi: bool
+        :param rooms: 需要获取水电费详情的宿舍
+        :type rooms: Iterable[str]
+        :param concurrency: 同时进行的请求数，默认为 8
+        :type concurrency: int, optional
+        :param http: 查询水电费时用于发出请求的会话，其连接池大小应不小于 ``concurrency``；
+                     默认创建一个连接池大小为 ``concurrency`` 的会话，并在结束后关闭
+        :type http: Optional[Session], optional
+        :param return_exceptions: 为 :obj:`True` 时，某个宿舍获取失败会产生（宿舍，异常）而不是抛出异常并停止，
+                                  默认为 :obj:`False`
+        :type return_exceptions: bool, optional
+        :raises NetworkError: 当访问相关网页时statue code不为200时抛出
+        :raises TicketGetError: 当未能从网页对应位置中获取到ticket时抛出
+        :raises ParseError: 当从返回数据解析所需值失败时抛出
+        :return: （宿舍，水电费信息）的迭代器
+        :rtype: Iterator[Tuple[str, Union[EnergyFees, Exception]]]
+        """
+        # 先获取好 synjones-auth，避免各个线程同时获取
+        get_session_synjones_auth(session)
+        own_http = http is None
+        if http is None:
+            http = new_session(pool_size=concurrency)
+
+        def fetch(room: str) -> EnergyFees:
+            return EnergyFees.from_dict(get_fees_info_raw(session, isHuxi, room, http)["map"]["showData"])
+        try:
+            yield from imap_unordered(fetch, rooms, concurrency, return_exceptions, "fees")
+        finally:
+            if own_http:
+                http.close()
+
+
+def hall_ticket_form(ssoticket_id):
+    return {
         'errorcode': '1',
-        'continueurl': 'http://card.cqu.edu.cn/cassyno/index',
+        'continueurl': HALL_TICKET_URL,
         'ssoticketid': ssoticket_id,
     }
-    r = session.post(url, data=data)
-    if r.status_code != 200:
-        raise NetworkError()
-    return session
 
 
-# 利用登录之后的cookie获取一卡通的关键ticket
-def get_ticket(session):
-    url = 'http://card.cqu.edu.cn/Page/Page'
-    data = {
+def ticket_form():
+    return {
         'EMenuName': '电费、网费',
         'MenuName': '电费、网费',
         'Url': 'http%3a%2f%2fcard.cqu.edu.cn%3a8080%2fblade-auth%2ftoken%2fthirdToToken%2ffwdt',
         'apptype': '4',
         'flowID': '10002'
     }
-    r = session.post(url, data=data)
+
+
+def fee_data_form(room, fee_item_id):
+    return {
+        'feeitemid': fee_item_id,
+        'json': 'true',
+        'level': '2',
+        'room': room,
+        'type': 'IEC',
+    }
+
+
+# 从页面中截取一卡通的关键ticket
+def parse_ticket(text):
+    ticket_start = text.find('ticket=')
+    if ticket_start > 0:
+        ticket_end = text.find("'", ticket_start)
+        return text[ticket_start + len('ticket='): ticket_end]
+    raise TicketGetError()
+
+
+# 获取hallticket
+def get_hall_ticket(session, ssoticket_id):
+    r = report("card.hall_ticket", session.post(HALL_TICKET_URL, data=hall_ticket_form(ssoticket_id)))
     if r.status_code != 200:
         raise NetworkError()
-    ticket_start = r.text.find('ticket=')
-    if ticket_start > 0:
-        ticket_end = r.text.find("'", ticket_start)
-        ticket = r.text[ticket_start + len('ticket='): ticket_end]
-        return ticket
-    else:
-        raise TicketGetError()
+    return session
+
+
+# 利用登录之后的cookie获取一卡通的关键ticket
+def get_ticket(session):
+    r = report("card.ticket", session.post(TICKET_URL, data=ticket_form()))
+    if r.status_code != 200:
+        raise NetworkError()
+    return parse_ticket(r.text)
 
 
 # 利用ticket获取一卡通关键cookie
-def get_synjones_auth(ticket):
-    url = 'http://card.cqu.edu.cn:8080/blade-auth/token/fwdt'
+def get_synjones_auth(ticket, http: Optional[Session] = None):
     data = {'ticket': ticket}
-    r = requests.post(url, data=data)
+    r = report("card.synjones_auth", (http or get_default_session()).post(SYNJONES_AUTH_URL, data=data))
     if r.status_code != 200:
         raise NetworkError()
     try:
@@ -184,22 +333,18 @@ def get_synjones_auth(ticket):
 
 
 # 利用关键cookie获取水电费dic
-def get_fee_data(synjones_auth, room, fee_item_id):
-    url = "http://card.cqu.edu.cn:8080/charge/feeitem/getThirdData"
-    data = {
-        'feeitemid': fee_item_id,
-        'json': 'true',
-        'level': '2',
-        'room': room,
-        'type': 'IEC',
-    }
+def get_fee_data(synjones_auth, room, fee_item_id, http: Optional[Session] = None):
     cookie = {'synjones-auth': synjones_auth}
-    r = requests.post(url, data=data, cookies=cookie)
+    r = report("card.fee_data", (http or get_default_session()).post(
+        FEE_DATA_URL, data=fee_data_form(room, fee_item_id), cookies=cookie))
+    if r.status_code == 401:
+        raise SynjonesAuthRejected(str(r.status_code))
     if r.status_code != 200:
         raise NetworkError()
     dic = json.loads(r.text)
     if dic['msg'] == 'success':
         return dic
+    elif dic['msg'] in SYNJONES_AUTH_REJECTED_MSGS:
+        raise SynjonesAuthRejected(dic['msg'])
     else:
         raise FeeAcquisitionFailed(dic['msg'])
-
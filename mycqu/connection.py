@@ -0,0 +1,125 @@
+"""不依赖登录状态的请求（如以 authorization 查询成绩、查询水电费、获取考表）所共用的连接池
+
+这些请求原先直接使用 :func:`requests.get` 或 :func:`requests.post`，每次都会建立并关闭一个新的 TCP（和 TLS）连接；
+现在它们默认使用 :func:`get_default_session` 返回的会话，同一主机的连接会被保持并复用。
+
+>>> from mycqu import connection
+>>> connection.configure(pool_size=32, timeout=(3, 10))  # 在发出请求前调整连接池大小和超时
+>>> Score.fetch(authorization)                          # 使用共享的连接池
+>>> Score.fetch(authorization, http=my_session)         # 或者传入自己的会话
+
+这些会话默认还会重试失败的请求，并在某一主机持续出错时熔断，参见 :mod:`.resilience`；
+请求经过 :func:`.scheduler.get_default_scheduler` 按主机限速和按优先级排队，参见 :mod:`.scheduler`。
+"""
+from __future__ import annotations
+from typing import Any, Optional, Tuple, Union
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from .resilience import ResilientAdapter
+from .scheduler import SchedulingAdapter
+
+__all__ = ("DEFAULT_POOL_SIZE", "DEFAULT_TIMEOUT", "TimeoutHTTPAdapter",
+           "new_session", "get_default_session", "set_default_session", "configure")
+
+DEFAULT_POOL_SIZE: int = 10
+"""每个主机保持的连接数"""
+DEFAULT_TIMEOUT: Tuple[float, float] = (5, 30)
+"""（连接超时，读取超时），单位为秒"""
+
+Timeout = Union[float, Tuple[float, float], None]
+
+_default_session: Optional[Session] = None
+_default_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """为没有指定超时的请求使用默认超时的 :class:`requests.adapters.HTTPAdapter`
+
+    :param timeout: 默认超时，默认为 :data:`DEFAULT_TIMEOUT`
+    :type timeout: Union[float, Tuple[float, float], None], optional
+    :param kwargs: 传给 :class:`requests.adapters.HTTPAdapter` 的其他参数，如 ``pool_maxsize``
+    """
+
+    def __init__(self, timeout: Timeout = DEFAULT_TIMEOUT, **kwargs: Any):
+        self.timeout: Timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request: PreparedRequest, timeout: Timeout = None, **kwargs: Any) -> Response:  # type: ignore
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+
+def new_session(pool_size: int = DEFAULT_POOL_SIZE, timeout: Timeout = DEFAULT_TIMEOUT,
+                resilient: bool = True, scheduled: bool = True) -> Session:
+    """创建一个带有连接池和默认超时、不保存 cookie 的会话
+
+    会话不保存响应设置的 cookie，因此可以被不同帐号的请求共用。
+
+    :param pool_size: 每个主机保持的连接数，也是同一主机上能同时进行的请求数，默认为 :data:`DEFAULT_POOL_SIZE`
+    :type pool_size: int, optional
+    :param timeout: 默认超时，默认为 :data:`DEFAULT_TIMEOUT`
+    :type timeout: Union[float, Tuple[float, float], None], optional
+    :param resilient: 是否以 :class:`.resilience.ResilientAdapter` 的默认策略重试和熔断，默认为 :obj:`True`
+    :type resilient: bool, optional
+    :param scheduled: 是否经过 :func:`.scheduler.get_default_scheduler` 排队，默认为 :obj:`True`
+    :type scheduled: bool, optional
+    :rtype: Session
+    """
+    session = Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter: BaseAdapter = TimeoutHTTPAdapter(timeout, pool_maxsize=pool_size)
+    # 熔断时直接失败而不排队，每次重试各自排队
+    if scheduled:
+        adapter = SchedulingAdapter(adapter)
+    if resilient:
+        adapter = ResilientAdapter(adapter)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_default_session() -> Session:
+    """获取共享的会话，第一次调用时以默认参数创建
+
+    :rtype: Session
+    """
+    global _default_session  # pylint: disable=global-statement
+    if _default_session is None:
+        with _default_lock:
+            if _default_session is None:
+                _default_session = new_session()
+    return _default_session
+
+
+def set_default_session(session: Optional[Session]) -> None:
+    """替换共享的会话，原来的会话会被关闭
+
+    :param session: 新的会话，为 :obj:`None` 时下次使用时重新以默认参数创建
+    :type session: Optional[Session]
+    """
+    global _default_session  # pylint: disable=global-statement
+    with _default_lock:
+        old, _default_session = _default_session, session
+    if old is not None and old is not session:
+        old.close()
+
+
+def configure(pool_size: int = DEFAULT_POOL_SIZE, timeout: Timeout = DEFAULT_TIMEOUT,
+              resilient: bool = True, scheduled: bool = True) -> Session:
+    """以新的参数重新创建共享的会话，参见 :func:`new_session`
+
+    :param pool_size: 每个主机保持的连接数，默认为 :data:`DEFAULT_POOL_SIZE`
+    :type pool_size: int, optional
+    :param timeout: 默认超时，默认为 :data:`DEFAULT_TIMEOUT`
+    :type timeout: Union[float, Tuple[float, float], None], optional
+    :param resilient: 是否重试和熔断，默认为 :obj:`True`
+    :type resilient: bool, optional
+    :param scheduled: 是否经过默认的调度器排队，默认为 :obj:`True`
+    :type scheduled: bool, optional
+    :return: 新的共享会话
+    :rtype: Session
+    """
+    session = new_session(pool_size, timeout, resilient, scheduled)
+    set_default_session(session)
+    return session
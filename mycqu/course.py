@@ -1,24 +1,44 @@
 """课程相关的模块
 """
 from __future__ import annotations
-from typing import Any, Dict, Optional, Tuple, List, Union, ClassVar
+from typing import Any, Dict, Iterable, Optional, Tuple, List, Union, ClassVar
 # from pydantic.dataclasses import dataclass
 import re
-from datetime import date
-from functools import lru_cache
-from requests import Session, get
-from ._lib_wrapper.dataclass import dataclass
-from .utils.datetimes import parse_period_str, parse_weeks_str, parse_weekday_str, date_from_str
+import threading
+from bisect import bisect_left
+from datetime import date, datetime
+from functools import wraps
+from requests import Session, Response
+from ._lib_wrapper.dataclass import dataclass, construct
+from .cache import ResponseCache
+from .connection import get_default_session
+from .instrument import report, parsing
+from .utils.concurrent import imap_unordered
+from .utils.datetimes import parse_period_str, parse_weeks_str, parse_weekday_str, date_from_str, TIMEZONE
 from .mycqu import MycquUnauthorized
 
 
-__all__ = ("CQUSession", "CQUSessionInfo",
+__all__ = ("CQUSession", "CQUSessionInfo", "CQUSessionResolver",
            "CourseTimetable", "CourseDayTime", "Course")
 
 CQUSESSIONS_URL = "https://my.cqu.edu.cn/api/timetable/optionFinder/session?blankOption=false"
 CUR_SESSION_URL = "https://my.cqu.edu.cn/api/resourceapi/session/cur-active-session"
 ALL_SESSIONSINFO_URL = "https://my.cqu.edu.cn/api/resourceapi/session/list"
 TIMETABLE_URL = "https://my.cqu.edu.cn/api/timetable/class/timetable/student/table-detail"
+# 批量获取课表时每个请求包含的学工号数量
+TIMETABLE_CHUNK_SIZE = 50
+# 学期列表一年只变化几次，且无需认证、不因用户而异，默认在所有会话之间共享缓存；
+# 学期信息的 api 需要认证，缓存会掩盖会话的过期（命中时不会返回 401），默认不缓存
+SESSION_CACHE_TTLS: Dict[str, float] = {
+    CQUSESSIONS_URL: 24 * 3600,
+    ALL_SESSIONSINFO_URL: 24 * 3600,
+    CUR_SESSION_URL: 3600,
+}
+SESSION_CACHE = ResponseCache(ttls=SESSION_CACHE_TTLS)
+# 驻留的学期实例，以（年份，是否为秋季学期）、学期 id 和学期字符串为键
+_SESSIONS: Dict[Tuple[int, bool], CQUSession] = {}
+_SESSION_IDS: Dict[int, CQUSession] = {}
+_SESSIONS_BY_STR: Dict[str, CQUSession] = {}
 
 
 def get_course_raw(session: Session, code: str, cqu_session: Optional[Union[CQUSession, str]] = None):
@@ -28,24 +48,93 @@ def get_course_raw(session: Session, code: str, cqu_session: Optional[Union[CQUS
     :type session: Session
     :param code: 学生或教师的学工号
     :type code: str
-    :param cqu_session: 需要获取课表的学期，留空获取当前年级的课表
+    :param cqu_session: 需要获取课表的学期，留空则获取由 :data:`SESSION_RESOLVER` 确定的当前学期的课表
     :type cqu_session: Optional[Union[CQUSession, str]], optional
     :raises MycquUnauthorized: 若会话未在 my.cqu.edu.cn 进行认证
     :return: 反序列化获取课表的json
     :rtype: List[CourseTimetable]
     """
+    return _post_timetable(session, [code], _resolve_session(session, cqu_session))
+
+
+def get_courses_raw(session: Session, codes: Iterable[str],
+                    cqu_session: Optional[Union[CQUSession, str]] = None,
+                    chunk_size: int = TIMETABLE_CHUNK_SIZE,
+                    code_key: Optional[str] = None,
+                    concurrency: int = 8) -> Dict[str, List[Dict[str, Any]]]:
+    """从 my.cqu.edu.cn 上获取多名学生或老师的课表
+
+    默认逐个学工号并发请求，同时进行的请求不超过 ``concurrency`` 个，学期只确定一次。
+
+    课表接口可以在一个请求中接受多个学工号，但返回的课表中没有已知的、记录其所属学工号的字段；指定了 ``code_key``
+    （调用者确认返回的课表中带有的该字段）时，每个请求包含至多 ``chunk_size`` 个学工号，返回的课表按该字段拆分回各个学工号。
+    若某一批返回的课表中有缺少该字段的，该批及本次调用中剩余的学工号改为逐个请求，以保证结果的归属正确。
+
+    :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话，
+                    其连接池大小应不小于 ``concurrency``
+    :type session: Session
+    :param codes: 学生或教师的学工号
+    :type codes: Iterable[str]
+    :param cqu_session: 需要获取课表的学期，留空则获取由 :data:`SESSION_RESOLVER` 确定的当前学期的课表
+    :type cqu_session: Optional[Union[CQUSession, str]], optional
+    :param chunk_size: 指定了 ``code_key`` 时每个请求包含的学工号数量，默认为 :data:`TIMETABLE_CHUNK_SIZE`
+    :type chunk_size: int, optional
+    :param code_key: 课表中记录所属学工号的字段，默认为 :obj:`None` 即逐个学工号请求
+    :type code_key: Optional[str], optional
+    :param concurrency: 逐个学工号请求时同时进行的请求数，默认为 8
+    :type concurrency: int, optional
+    :raises ValueError: ``chunk_size`` 不是正数
+    :raises MycquUnauthorized: 若会话未在 my.cqu.edu.cn 进行认证
+    :return: 学工号到反序列化的课表 json 列表的映射
+    :rtype: Dict[str, List[Dict[str, Any]]]
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size should be positive, but {chunk_size} is got")
+    resolved = _resolve_session(session, cqu_session)
+    codes = list(dict.fromkeys(codes))
+    result: Dict[str, List[Dict[str, Any]]] = {code: [] for code in codes}
+    unbatched: List[str] = list(codes) if code_key is None else []
+    if code_key is not None:
+        for start in range(0, len(codes), chunk_size):
+            chunk = codes[start:start + chunk_size]
+            if unbatched or len(chunk) == 1:
+                unbatched.extend(chunk)
+                continue
+            timetables = _post_timetable(session, chunk, resolved)
+            owners = [str(timetable.get(code_key)) for timetable in timetables]
+            if all(owner in result for owner in owners):
+                for owner, timetable in zip(owners, timetables):
+                    result[owner].append(timetable)
+            else:
+                unbatched.extend(chunk)
+    for code, timetables in imap_unordered(lambda code: _post_timetable(session, [code], resolved),
+                                           unbatched, concurrency, thread_name_prefix="course"):
+        result[code] = timetables  # type: ignore
+    return result
+
+
+def _resolve_session(session: Session, cqu_session: Optional[Union[CQUSession, str]]) -> CQUSession:
     if cqu_session is None:
-        cqu_session = CQUSessionInfo.fetch(session).session
+        cqu_session = SESSION_RESOLVER.resolve(session).session
     elif isinstance(cqu_session, str):
         cqu_session = CQUSession.from_str(cqu_session)
     assert isinstance(cqu_session, CQUSession)
-    resp = session.post(TIMETABLE_URL,
-                        params={"sessionId": cqu_session.get_id()},
-                        json=[code],
-                        )
+    return cqu_session
+
+
+def _get(http, url: str, cache: Optional[ResponseCache], operation: str) -> Response:
+    return report(operation, http.get(url) if cache is None else cache.get(http, url))
+
+
+def _post_timetable(session: Session, codes: List[str], cqu_session: CQUSession) -> List[Dict[str, Any]]:
+    resp = report("course.timetable", session.post(TIMETABLE_URL,
+                                                   params={"sessionId": cqu_session.get_id()},
+                                                   json=codes,
+                                                   ))
     if resp.status_code == 401:
         raise MycquUnauthorized()
-    return resp.json()['classTimetableVOList']
+    with parsing("course.timetable.decode"):
+        return resp.json()['classTimetableVOList']
 
 
 @dataclass(order=True, frozen=True)
@@ -60,13 +149,33 @@ class CQUSession:
     _SPECIAL_IDS: ClassVar[Tuple[int, ...]] = (
         239259, 102, 101, 103, 1028, 1029, 1030, 1032)  # 2015 ~ 2018
 
-    @lru_cache(maxsize=32)  # type: ignore
-    def __new__(cls, year: int, is_autumn: bool): # pylint: disable=unused-argument
-        return super(CQUSession, cls).__new__(cls)
+    def __new__(cls, year: int, is_autumn: bool):
+        # 每个学期只有一个实例，相同的学期总是返回同一个对象
+        key = (int(year), bool(is_autumn))
+        instance = _SESSIONS.get(key)
+        if instance is None:
+            instance = super(CQUSession, cls).__new__(cls)
+            session_id = CQUSession._compute_id(*key)
+            object.__setattr__(instance, "_id", session_id)
+            instance = _SESSIONS.setdefault(key, instance)
+            _SESSION_IDS.setdefault(session_id, instance)
+        return instance
+
+    def __reduce__(self):
+        return CQUSession, (self.year, self.is_autumn)
 
     def __str__(self):
         return str(self.year) + ('秋' if self.is_autumn else '春')
 
+    @staticmethod
+    def _compute_id(year: int, is_autumn: bool) -> int:
+        if year >= 2019:
+            return (year - 1503) * 2 + int(is_autumn) + 1
+        elif 2015 <= year <= 2018:
+            return CQUSession._SPECIAL_IDS[(year - 2015) * 2 + int(is_autumn)]
+        else:
+            return (2015 - year) * 2 - int(is_autumn)
+
     def get_id(self) -> int:
         """获取该学期在 my.cqu.edu.cn 中的 id
 
@@ -76,12 +185,26 @@ class CQUSession:
         :return: 学期的 id
         :rtype: int
         """
-        if self.year >= 2019:
-            return (self.year - 1503) * 2 + int(self.is_autumn) + 1
-        elif 2015 <= self.year <= 2018:
-            return self._SPECIAL_IDS[(self.year - 2015) * 2 + int(self.is_autumn)]
-        else:
-            return (2015 - self.year) * 2 - int(self.is_autumn)
+        return self._id  # type: ignore # pylint: disable=no-member
+
+    @staticmethod
+    def from_id(session_id: int) -> CQUSession:
+        """从 my.cqu.edu.cn 中的学期 id 获取学期，是 :meth:`get_id` 的逆运算
+
+        >>> CQUSession.from_id(1038)
+        CQUSession(year=2021, is_autumn=True)
+
+        :param session_id: 学期的 id
+        :type session_id: int
+        :raises ValueError: 不是 2000 年以来的学期的 id 时抛出
+        :rtype: CQUSession
+        """
+        session = _SESSION_IDS.get(session_id)
+        if session is not None:
+            return session
+        if session_id >= CQUSession._compute_id(2019, False):
+            return CQUSession((session_id - 1) // 2 + 1503, (session_id - 1) % 2 == 1)
+        raise ValueError(f"{session_id} is not a session id")
 
     @staticmethod
     def from_str(string: str) -> CQUSession:
@@ -98,28 +221,52 @@ class CQUSession:
         :return: 对应的学期
         :rtype: CQUSession
         """
+        session = _SESSIONS_BY_STR.get(string)
+        if session is not None:
+            return session
         match = CQUSession.SESSION_RE.match(string)
         if match:
+            # 只有预先创建的学期字符串被缓存，不因任意输入而增长
             return CQUSession(
-                year=match[1],
+                year=int(match[1]),
                 is_autumn=match[2] == "秋"
             )
         else:
             raise ValueError(f"string {string} is not a session")
 
     @staticmethod
-    def fetch() -> List[CQUSession]:
+    def fetch(cache: Optional[ResponseCache] = SESSION_CACHE) -> List[CQUSession]:
         """从 my.cqu.edu.cn 上获取各个学期
 
+        :param cache: 响应缓存，默认为各会话共享的 :data:`SESSION_CACHE`，为 :obj:`None` 时不使用缓存
+        :type cache: Optional[ResponseCache], optional
         :return: 各个学期组成的列表
         :rtype: List[CQUSession]
         """
         session_list = []
-        for session in get(CQUSESSIONS_URL).json():
+        for session in _get(get_default_session(), CQUSESSIONS_URL, cache, "course.sessions").json():
             session_list.append(CQUSession.from_str(session["name"]))
         return session_list
 
 
+def _init_once(init):
+    @wraps(init)
+    def __init__(self, *args, **kwargs):
+        # 驻留的实例已经初始化过时，不能再用未经校验的参数覆盖其字段
+        if not self.__dict__.get("__pydantic_initialised__"):
+            init(self, *args, **kwargs)
+    return __init__
+
+
+CQUSession.__init__ = _init_once(CQUSession.__init__)  # type: ignore
+# 预先创建 2000 年至明年的所有学期
+for _year in range(2000, date.today().year + 2):
+    for _is_autumn in (False, True):
+        _session = CQUSession(_year, _is_autumn)
+        _SESSIONS_BY_STR[str(_session)] = _SESSIONS_BY_STR[f"{_year}年{'秋' if _is_autumn else '春'}"] = _session
+del _year, _is_autumn, _session
+
+
 @dataclass
 class CQUSessionInfo:
     """某学期的一些额外信息
@@ -148,15 +295,18 @@ class CQUSessionInfo:
         )
 
     @staticmethod
-    def fetch_all(session: Session) -> List[CQUSessionInfo]:
+    def fetch_all(session: Session, cache: Optional[ResponseCache] = None) -> List[CQUSessionInfo]:
         """获取所有学期信息
 
         :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话
         :type session: Session
+        :param cache: 响应缓存，如 :data:`SESSION_CACHE`；缓存不区分会话的认证信息，命中时不会检测会话是否已经过期，
+                      默认为 :obj:`None` 即不使用缓存
+        :type cache: Optional[ResponseCache], optional
         :return: 按时间降序排序的学期（最新学期可能尚未到来，其信息准确度也无法保障！）
         :rtype: List[CQUSessionInfo]
         """
-        resp = session.get(ALL_SESSIONSINFO_URL)
+        resp = _get(session, ALL_SESSIONSINFO_URL, cache, "course.session_list")
         if resp.status_code == 401:
             raise MycquUnauthorized()
         cqusesions: List[CQUSessionInfo] = []
@@ -167,21 +317,105 @@ class CQUSessionInfo:
         return cqusesions
 
     @staticmethod
-    def fetch(session: Session) -> CQUSessionInfo:
+    def fetch(session: Session, cache: Optional[ResponseCache] = None) -> CQUSessionInfo:
         """从 my.cqu.edu.cn 上获取当前学期的学期信息，需要登录并认证了 mycqu 的会话
 
         :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话
         :type session: Session
+        :param cache: 响应缓存，如 :data:`SESSION_CACHE`；缓存不区分会话的认证信息，命中时不会检测会话是否已经过期，
+                      默认为 :obj:`None` 即不使用缓存
+        :type cache: Optional[ResponseCache], optional
         :raises MycquUnauthorized: 若会话未在 my.cqu.edu.cn 认证
         :return: 本学期信息对象
         :rtype: CQUSessionInfo
         """
-        resp = session.get(CUR_SESSION_URL)
+        resp = _get(session, CUR_SESSION_URL, cache, "course.session_info")
         if resp.status_code == 401:
             raise MycquUnauthorized()
         return CQUSessionInfo.from_dict(resp.json()["data"])
 
 
+class CQUSessionResolver:
+    """在本地根据日期确定学期，代替每次都请求当前学期的 api
+
+    保存一份按时间排序的 :meth:`CQUSessionInfo.fetch_all` 结果，以二分查找确定日期所在的学期；
+    只有日期超过了已知最后一个学期的结束日期时才重新获取。学期信息不因用户而异，可以在多个会话之间共享。
+
+    >>> SESSION_RESOLVER.resolve(session)
+    CQUSessionInfo(session=CQUSession(year=2021, is_autumn=True), ...)
+    """
+
+    def __init__(self):
+        self._infos: List[CQUSessionInfo] = []
+        self._end_dates: List[date] = []
+        self._exhausted_on: Optional[date] = None
+        self._lock = threading.Lock()
+
+    def update(self, infos: Iterable[CQUSessionInfo], day: Optional[date] = None) -> None:
+        """替换已知的学期信息
+
+        :param infos: 学期信息，顺序任意
+        :type infos: Iterable[CQUSessionInfo]
+        :param day: 为该日期而获取了学期信息，若其仍晚于所有学期，则当天不再重新获取
+        :type day: Optional[date], optional
+        """
+        ordered = sorted(infos, key=lambda info: info.end_date)
+        with self._lock:
+            self._infos = ordered
+            self._end_dates = [info.end_date for info in ordered]
+            self._exhausted_on = day if day is not None and \
+                (not ordered or day > ordered[-1].end_date) else None
+
+    def needs_refresh(self, day: date) -> bool:
+        """判断是否需要为确定该日期所在的学期而重新获取学期信息，即日期晚于已知的所有学期，且当天尚未重新获取过
+
+        :param day: 日期
+        :type day: date
+        :rtype: bool
+        """
+        with self._lock:
+            return (not self._end_dates or day > self._end_dates[-1]) and \
+                (self._exhausted_on is None or day > self._exhausted_on)
+
+    def lookup(self, day: date) -> Optional[CQUSessionInfo]:
+        """在已知的学期信息中查找日期所在的学期，不发出请求
+
+        :param day: 日期
+        :type day: date
+        :return: 包含该日期的学期；日期在两个学期之间的假期时为下一个学期；日期晚于已知的所有学期时为 :obj:`None`
+        :rtype: Optional[CQUSessionInfo]
+        """
+        with self._lock:
+            index = bisect_left(self._end_dates, day)
+            return self._infos[index] if index < len(self._infos) else None
+
+    def resolve(self, session: Session, day: Optional[date] = None) -> CQUSessionInfo:
+        """确定日期所在的学期，需要时用会话获取学期信息
+
+        :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话
+        :type session: Session
+        :param day: 日期，默认为今天
+        :type day: Optional[date], optional
+        :raises MycquUnauthorized: 需要获取学期信息而会话未在 my.cqu.edu.cn 认证时抛出
+        :return: 包含该日期的学期，日期在两个学期之间的假期时为下一个学期
+        :rtype: CQUSessionInfo
+        """
+        day = day or datetime.now(TIMEZONE).date()
+        if self.needs_refresh(day):
+            self.update(CQUSessionInfo.fetch_all(session), day)
+        info = self.lookup(day)
+        # 最新的学期可能还没有公布日期
+        return info if info is not None else CQUSessionInfo.fetch(session)
+
+    def clear(self) -> None:
+        """清除已知的学期信息"""
+        self.update(())
+
+
+# 各会话共享的学期解析器，在获取课表等不指定学期时使用
+SESSION_RESOLVER = CQUSessionResolver()
+
+
 @dataclass
 class CourseDayTime:
     """课程一次的星期和节次
@@ -194,16 +428,19 @@ class CourseDayTime:
     """
 
     @staticmethod
-    def from_dict(data: Dict[str, Any]) -> Optional[CourseDayTime]:
+    def from_dict(data: Dict[str, Any], trusted: bool = False) -> Optional[CourseDayTime]:
         """从反序列化的（一个）课表 json 中获取课程的星期和节次
 
         :param data: 反序列化成字典的课表 json
         :type data: Dict[str, Any]
+        :param trusted: 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型，默认为 :obj:`False`
+        :type trusted: bool, optional
         :return: 若其中有课程的星期和节次则返回相应对象，否则返回 :obj:`None`
         :rtype: Optional[CourseDayTime]
         """
         if data.get("periodFormat") and data.get("weekDayFormat"):
-            return CourseDayTime(
+            return construct(
+                CourseDayTime, trusted,
                 weekday=parse_weekday_str(data["weekDayFormat"]),
                 period=parse_period_str(data["periodFormat"])
             )
@@ -231,13 +468,16 @@ class Course:
 
     @staticmethod
     def from_dict(data: Dict[str, Any],
-                  session: Optional[Union[str, CQUSession]] = None) -> Course:
+                  session: Optional[Union[str, CQUSession]] = None,
+                  trusted: bool = False) -> Course:
         """从反序列化的（一个）课表或考表 json 中返回课程
 
         :param data: 反序列化成字典的课表或考表 json
         :type data: Dict[str, Any]
         :param session: 学期字符串或学期对象，留空则尝试从 ``data`` 中获取
         :type session: Optional[Union[str, CQUSession]], optional
+        :param trusted: 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型，默认为 :obj:`False`
+        :type trusted: bool, optional
         :return: 对应的课程对象
         :rtype: Course
         """
@@ -246,7 +486,8 @@ class Course:
         if isinstance(session, str):
             session = CQUSession.from_str(session)
         assert isinstance(session, CQUSession) or session is None
-        return Course(
+        return construct(
+            Course, trusted,
             name=data["courseName"],
             code=data["courseCode"],
             course_num=data.get("classNbr"),
@@ -277,40 +518,81 @@ class CourseTimetable:
     """是否真实地占用整周（如军训和某些实习是真实地占用、思修实践是“虚拟地占用”）"""
 
     @staticmethod
-    def from_dict(data: Dict[str, Any]) -> CourseTimetable:
+    def from_dict(data: Dict[str, Any], trusted: bool = False) -> CourseTimetable:
         """从反序列化的一个课表 json 中获取课表
 
         :param data: 反序列化成字典的课表 json
         :type data: Dict[str, Any]
+        :param trusted: 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型，默认为 :obj:`False`
+        :type trusted: bool, optional
         :return: 课表对象
         :rtype: CourseTimetable
         """
-        return CourseTimetable(
-            course=Course.from_dict(data),
+        return construct(
+            CourseTimetable, trusted,
+            course=Course.from_dict(data, trusted=trusted),
             stu_num=data["selectedStuNum"],
             classroom=data["roomName"],
             weeks=parse_weeks_str(data.get("weeks")
                                   or data.get("teachingWeekFormat")),  # type: ignore
-            day_time=CourseDayTime.from_dict(data),
+            day_time=CourseDayTime.from_dict(data, trusted),
             whole_week=bool(data["wholeWeekOccupy"])
         )
 
     @staticmethod
-    def fetch(session: Session, code: str, cqu_session: Optional[Union[CQUSession, str]] = None)\
-            -> List[CourseTimetable]:
+    def fetch(session: Session, code: str, cqu_session: Optional[Union[CQUSession, str]] = None,
+              trusted: bool = False) -> List[CourseTimetable]:
         """从 my.cqu.edu.cn 上获取学生或老师的课表
 
         :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话
         :type session: Session
         :param code: 学生或教师的学工号
         :type code: str
-        :param cqu_session: 需要获取课表的学期，留空获取当前年级的课表
+        :param cqu_session: 需要获取课表的学期，留空则获取由 :data:`SESSION_RESOLVER` 确定的当前学期的课表
         :type cqu_session: Optional[Union[CQUSession, str]], optional
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`，默认为 :obj:`False`
+        :type trusted: bool, optional
         :raises MycquUnauthorized: 若会话未在 my.cqu.edu.cn 进行认证
         :return: 获取的课表对象的列表
         :rtype: List[CourseTimetable]
         """
         resp = get_course_raw(session, code, cqu_session)
-        return [CourseTimetable.from_dict(timetable) for timetable in resp
-                if timetable["teachingWeekFormat"]
-                ]
+        with parsing("course.timetable.from_dict"):
+            return [CourseTimetable.from_dict(timetable, trusted) for timetable in resp
+                    if timetable["teachingWeekFormat"]
+                    ]
+
+    @staticmethod
+    def fetch_many(session: Session, codes: Iterable[str],
+                   cqu_session: Optional[Union[CQUSession, str]] = None,
+                   chunk_size: int = TIMETABLE_CHUNK_SIZE,
+                   code_key: Optional[str] = None,
+                   concurrency: int = 8,
+                   trusted: bool = False) -> Dict[str, List[CourseTimetable]]:
+        """从 my.cqu.edu.cn 上获取多名学生或老师的课表，参见 :func:`get_courses_raw`
+
+        :param session: 登录了统一身份认证（:func:`.auth.login`）并在 mycqu 进行了认证（:func:`.mycqu.access_mycqu`）的 requests 会话，
+                        其连接池大小应不小于 ``concurrency``
+        :type session: Session
+        :param codes: 学生或教师的学工号
+        :type codes: Iterable[str]
+        :param cqu_session: 需要获取课表的学期，留空则获取由 :data:`SESSION_RESOLVER` 确定的当前学期的课表
+        :type cqu_session: Optional[Union[CQUSession, str]], optional
+        :param chunk_size: 指定了 ``code_key`` 时每个请求包含的学工号数量，默认为 :data:`TIMETABLE_CHUNK_SIZE`
+        :type chunk_size: int, optional
+        :param code_key: 课表中记录所属学工号的字段，默认为 :obj:`None` 即逐个学工号请求
+        :type code_key: Optional[str], optional
+        :param concurrency: 逐个学工号请求时同时进行的请求数，默认为 8
+        :type concurrency: int, optional
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`，默认为 :obj:`False`
+        :type trusted: bool, optional
+        :raises ValueError: ``chunk_size`` 不是正数
+        :raises MycquUnauthorized: 若会话未在 my.cqu.edu.cn 进行认证
+        :return: 学工号到课表对象列表的映射
+        :rtype: Dict[str, List[CourseTimetable]]
+        """
+        raw = get_courses_raw(session, codes, cqu_session, chunk_size, code_key, concurrency)
+        with parsing("course.timetable.from_dict"):
+            return {code: [CourseTimetable.from_dict(timetable, trusted) for timetable in timetables
+                           if timetable["teachingWeekFormat"]]
+                    for code, timetables in raw.items()}
@@ -1,37 +1,96 @@
 """考试相关的模块
 """
 from __future__ import annotations
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Tuple, Union
 from datetime import date, time
+from functools import lru_cache
 import requests
+from .connection import get_default_session, new_session
 from .course import Course
+from .instrument import report, parsing
+from .utils.concurrent import imap_unordered
 from .utils.datetimes import date_from_str, time_from_str
 # from pydantic.dataclasses import dataclass
-from ._lib_wrapper.dataclass import dataclass
+from ._lib_wrapper.dataclass import dataclass, construct
 from ._lib_wrapper.encrypt import pad, aes_ecb_encryptor
 
 __all__ = ("Exam",)
 
 __exam_encryptor = aes_ecb_encryptor("cquisse123456789".encode())
 EXAM_LIST_URL = "https://my.cqu.edu.cn/api/exam/examTask/get-student-exam-list-outside"
+# 缓存的加密学号个数，足以容纳一个年级
+ENCRYPTED_ID_CACHE_SIZE = 8192
 
 
-def get_exam_raw(student_id: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
+@lru_cache(maxsize=ENCRYPTED_ID_CACHE_SIZE)
+def encrypt_student_id(student_id: str) -> str:
+    """加密学号，作为获取考表时的 ``studentId`` 参数
+
+    :param student_id: 学号
+    :type student_id: str
+    :return: 加密后的学号
+    :rtype: str
+    """
+    return __exam_encryptor(pad(student_id.encode())).hex().upper()
+
+
+def get_exam_raw(student_id: str, session: Optional[requests.Session] = None,
+                 page: Optional[int] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
     """获取考表的原始 json 数据（被反序列化为 python 字典对象）
 
     :param student_id: 学号
     :type student_id: str
-    :param session: 用于请求的 requests session
+    :param session: 用于请求的 requests session，默认为 :func:`.connection.get_default_session`
     :type session: requests.Session, optional
+    :param page: 分页的页码（从 0 开始），默认不指定
+    :type page: Optional[int], optional
+    :param page_size: 分页的每页考试数，默认不指定
+    :type page_size: Optional[int], optional
     :return: 反序列化后的课表 json 数据
     :rtype: Dict[str, Any]
     """
-    return (session or requests).get(EXAM_LIST_URL,
-                                     params={"studentId":
-                                             __exam_encryptor(
-                                                 pad(student_id.encode())).hex().upper()
-                                             }
-                                     ).json()
+    params: Dict[str, Any] = {"studentId": encrypt_student_id(student_id)}
+    if page is not None:
+        params["page"] = page
+    if page_size is not None:
+        params["size"] = page_size
+    resp = report("exam.list", (session or get_default_session()).get(EXAM_LIST_URL, params=params))
+    with parsing("exam.decode"):
+        return resp.json()
+
+
+def iter_exam_raw(student_id: str, session: Optional[requests.Session] = None,
+                  page_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """逐个产生考表中每次考试的原始 json 数据
+
+    考表的 ``data`` 是一个分页对象，当其元数据（``last``、``totalPages``）表明还有后续页时，逐页请求，
+    每次只持有一页的数据。请求的页数不超过第一页给出的 ``totalPages``，服务器返回的页码没有前进时停止。
+
+    :param student_id: 学号
+    :type student_id: str
+    :param session: 用于请求的 requests session，默认为 :func:`.connection.get_default_session`
+    :type session: requests.Session, optional
+    :param page_size: 每页的考试数，默认由服务器决定
+    :type page_size: Optional[int], optional
+    :return: 每次考试的原始 json 数据的迭代器
+    :rtype: Iterator[Dict[str, Any]]
+    """
+    page = 0
+    total_pages: Optional[int] = None
+    while True:
+        data = get_exam_raw(student_id, session,
+                            page=page or None, page_size=page_size)["data"]
+        number = data.get("number", page)
+        if number < page:
+            # 服务器忽略了页码，返回的是已经产生过的页
+            return
+        yield from data["content"]
+        if total_pages is None:
+            # 以第一页的总页数为准，防止服务器不断声称还有后续页
+            total_pages = data.get("totalPages", 1)
+        if data.get("last", True) or number + 1 >= total_pages or not data["content"]:
+            return
+        page = number + 1
 
 
 @dataclass
@@ -44,15 +103,18 @@ class Invigilator:
     """监考员所在学院（可能是简称，如 :obj:`"数统"`）"""
 
     @staticmethod
-    def from_dict(data: Dict[str, Optional[str]]) -> Invigilator:
+    def from_dict(data: Dict[str, Optional[str]], trusted: bool = False) -> Invigilator:
         """从反序列化后的 json 数据中一名正/副监考员的数据中生成 :class:`Invigilator` 对象。
 
         :param data: 反序列化后的 json 数据中的一次考试数据
         :type data: Dict[str, Optional[str]]
+        :param trusted: 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型，默认为 :obj:`False`
+        :type trusted: bool, optional
         :return: 对应的 :class:`Invigilator` 对象
         :rtype: Invigilator
         """
-        return Invigilator(
+        return construct(
+            Invigilator, trusted,
             name=data["instructor"],  # type: ignore
             dept=data["instDeptShortName"]  # type: ignore
         )
@@ -96,16 +158,19 @@ class Exam:
     """副监考员"""
 
     @staticmethod
-    def from_dict(data: Dict[str, Any]) -> Exam:
+    def from_dict(data: Dict[str, Any], trusted: bool = False) -> Exam:
         """从反序列化后的 json 数据中的一次考试数据生成 :class:`Exam` 对象
 
         :param data: 反序列化后的 json 数据中的一次考试数据
         :type data: Dict[str, Any]
+        :param trusted: 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型，默认为 :obj:`False`
+        :type trusted: bool, optional
         :return: 对应的 :class:`Exam` 对象
         :rtype: [type]
         """
-        course = Course.from_dict(data)
-        return Exam(
+        course = Course.from_dict(data, trusted=trusted)
+        return construct(
+            Exam, trusted,
             course=course,
             batch=data["batchName"],
             batch_id=data["batchId"],
@@ -120,20 +185,81 @@ class Exam:
             stu_id=data["studentId"],
             seat_num=data["seatNum"],
             stu_num=data["examStuNum"],
-            chief_invi=[Invigilator.from_dict(invi)
+            chief_invi=[Invigilator.from_dict(invi, trusted)
                         for invi in data["simpleChiefinvigilatorVOS"]],
-            asst_invi=data["simpleAssistantInviVOS"] and [Invigilator.from_dict(invi)
+            asst_invi=data["simpleAssistantInviVOS"] and [Invigilator.from_dict(invi, trusted)
                                                           for invi in data["simpleAssistantInviVOS"]]
         )
 
     @staticmethod
-    def fetch(student_id: str) -> List[Exam]:
+    def fetch(student_id: str, trusted: bool = False, session: Optional[requests.Session] = None) -> List[Exam]:
         """从 my.cqu.edu.cn 上获取指定学生的考表
 
         :param student_id: 学生学号
         :type student_id: str
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`，默认为 :obj:`False`
+        :type trusted: bool, optional
+        :param session: 用于请求的 requests session，默认为 :func:`.connection.get_default_session`
+        :type session: requests.Session, optional
         :return: 本学期的考表
         :rtype: List[Exam]
         """
-        return [Exam.from_dict(exam)
-                for exam in get_exam_raw(student_id)["data"]["content"]]
+        return list(Exam.iter_fetch(student_id, trusted, session))
+
+    @staticmethod
+    def iter_fetch(student_id: str, trusted: bool = False, session: Optional[requests.Session] = None,
+                   page_size: Optional[int] = None) -> Iterator[Exam]:
+        """从 my.cqu.edu.cn 上逐个获取指定学生的考试，考表分页时按需请求后续页，参见 :func:`iter_exam_raw`
+
+        :param student_id: 学生学号
+        :type student_id: str
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`，默认为 :obj:`False`
+        :type trusted: bool, optional
+        :param session: 用于请求的 requests session，默认为 :func:`.connection.get_default_session`
+        :type session: requests.Session, optional
+        :param page_size: 每页的考试数，默认由服务器决定
+        :type page_size: Optional[int], optional
+        :return: 本学期考试的迭代器
+        :rtype: Iterator[Exam]
+        """
+        for exam in iter_exam_raw(student_id, session, page_size):
+            with parsing("exam.from_dict"):
+                parsed = Exam.from_dict(exam, trusted)
+            yield parsed
+
+    @staticmethod
+    def fetch_many(student_ids: Iterable[str], concurrency: int = 8,
+                   session: Optional[requests.Session] = None, trusted: bool = False,
+                   return_exceptions: bool = False
+                   ) -> Iterator[Tuple[str, Union[List[Exam], Exception]]]:
+        """并发获取多名学生的考表，按完成的先后逐个产生结果
+
+        ``student_ids`` 被逐步消费，同时进行中的请求不超过 ``concurrency`` 个，因此可以传入很长的（甚至无限的）迭代器。
+
+        >>> for student_id, exams in Exam.fetch_many(student_ids, concurrency=16):
+        ...     save(student_id, exams)
+
+        :param student_ids: 学生学号
+        :type student_ids: Iterable[str]
+        :param concurrency: 同时进行的请求数，默认为 8
+        :type concurrency: int, optional
+        :param session: 用于请求的 requests session，其连接池大小应不小于 ``concurrency``；
+                        默认创建一个连接池大小为 ``concurrency`` 的会话，并在结束后关闭
+        :type session: requests.Session, optional
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`，默认为 :obj:`False`
+        :type trusted: bool, optional
+        :param return_exceptions: 为 :obj:`True` 时，某名学生的考表获取失败会产生（学号，异常）而不是抛出异常并停止，
+                                  默认为 :obj:`False`
+        :type return_exceptions: bool, optional
+        :return: （学号，本学期的考表）的迭代器
+        :rtype: Iterator[Tuple[str, Union[List[Exam], Exception]]]
+        """
+        own_session = session is None
+        if session is None:
+            session = new_session(pool_size=concurrency)
+        try:
+            yield from imap_unordered(lambda student_id: Exam.fetch(student_id, trusted, session),
+                                      student_ids, concurrency, return_exceptions, "exam")
+        finally:
+            if own_session:
+                session.close()
@@ -0,0 +1,225 @@
+"""由成绩 :class:`.score.Score` 在本地计算绩点、加权平均分和学分
+
+:class:`ScoreTable` 把多名学生的成绩展开为按列存储的数组，再按学生或（学生，学期）分组求和，
+安装了 `numpy <https://numpy.org>`_ 时分组求和由 :func:`numpy.bincount` 完成。
+
+成绩可能是数字，也可能是等级（优、良等），等级按 :data:`GRADE_SCORES` 折算为百分制后与数字成绩一同处理；
+合格、不合格等两级制成绩只计入通过/未通过和获得的学分，不计入绩点和加权平均分。
+"""
+from __future__ import annotations
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+from bisect import bisect_right
+from ._lib_wrapper.dataclass import dataclass, construct
+from .course import CQUSession
+from .score import Score
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+__all__ = ("GRADE_SCORES", "PASS_FAIL_GRADES", "GPA_SCALE", "PASSING_SCORE", "ScoreSummary", "ScoreTable", "summarize")
+
+GRADE_SCORES: Dict[str, float] = {"优": 95, "良": 85, "中": 75, "及格": 65, "不及格": 0}
+"""五级制成绩折算的百分制成绩"""
+PASS_FAIL_GRADES: Dict[str, bool] = {"合格": True, "通过": True, "不合格": False, "不通过": False}
+"""两级制成绩及其是否通过"""
+GPA_SCALE: Tuple[Tuple[float, float], ...] = ((60, 1.0), (64, 1.5), (68, 2.0), (72, 2.3), (75, 2.7),
+                                              (78, 3.0), (82, 3.3), (85, 3.7), (90, 4.0))
+"""百分制成绩到绩点的对照表，每项为（最低分数，绩点），按分数升序排列，低于最低一档为 0"""
+PASSING_SCORE: float = 60
+"""及格的最低百分制成绩"""
+
+# 每条成绩折算后的结果：（百分制成绩，绩点，是否计入绩点，是否通过）
+_Converted = Tuple[float, float, bool, bool]
+
+
+@dataclass
+class ScoreSummary:
+    """一组成绩的统计结果
+    """
+    gpa: Optional[float]
+    """学分加权的平均绩点，没有计入绩点的成绩时为 :obj:`None`"""
+    average: Optional[float]
+    """学分加权的平均百分制成绩，没有计入绩点的成绩时为 :obj:`None`"""
+    credits: float
+    """通过的课程的学分之和"""
+    gpa_credits: float
+    """计入绩点的课程的学分之和"""
+    passed: int
+    """通过的成绩数"""
+    failed: int
+    """未通过的成绩数"""
+
+
+class _Converter:
+    def __init__(self, scale: Sequence[Tuple[float, float]], grades: Mapping[str, float],
+                 pass_fail: Mapping[str, bool]):
+        self._thresholds: List[float] = [threshold for threshold, _ in scale]
+        self._points: List[float] = [0.0] + [points for _, points in scale]
+        self._grades = grades
+        self._pass_fail = pass_fail
+        # 成绩字符串的种类很少，折算结果按字符串缓存
+        self._memo: Dict[str, Optional[_Converted]] = {}
+
+    def __call__(self, score: str) -> Optional[_Converted]:
+        try:
+            return self._memo[score]
+        except KeyError:
+            pass
+        converted: Optional[_Converted] = None
+        if score in self._pass_fail:
+            converted = (0.0, 0.0, False, self._pass_fail[score])
+        else:
+            try:
+                value = float(self._grades[score] if score in self._grades else score)
+            except ValueError:
+                pass
+            else:
+                converted = (value, self._points[bisect_right(self._thresholds, value)], True,
+                             value >= PASSING_SCORE)
+        self._memo[score] = converted
+        return converted
+
+
+class ScoreTable:
+    """多名学生的成绩，按列存储以便批量统计
+
+    >>> table = ScoreTable({"2018xxxx": Score.fetch(session_a), "2019xxxx": Score.fetch(session_b)})
+    >>> table.by_student()["2018xxxx"].gpa
+    3.52
+    >>> table.by_session()["2018xxxx"][CQUSession(2019, True)].credits
+    24.5
+
+    成绩为 :obj:`None` 或无法识别的成绩被忽略；同一课程的多次成绩（如初修和重修）各自计入。
+
+    :param scores: 学生（学号或其他可哈希的标识）到其成绩的映射
+    :type scores: Mapping[Hashable, Iterable[Score]]
+    :param scale: 百分制成绩到绩点的对照表，默认为 :data:`GPA_SCALE`
+    :type scale: Sequence[Tuple[float, float]], optional
+    :param grades: 等级制成绩折算的百分制成绩，默认为 :data:`GRADE_SCORES`
+    :type grades: Mapping[str, float], optional
+    :param pass_fail: 两级制成绩及其是否通过，默认为 :data:`PASS_FAIL_GRADES`
+    :type pass_fail: Mapping[str, bool], optional
+    """
+
+    def __init__(self, scores: Mapping[Hashable, Iterable[Score]],
+                 scale: Sequence[Tuple[float, float]] = GPA_SCALE,
+                 grades: Mapping[str, float] = GRADE_SCORES,
+                 pass_fail: Mapping[str, bool] = PASS_FAIL_GRADES):
+        convert = _Converter(scale, grades, pass_fail)
+        self.students: List[Hashable] = list(scores)
+        """学生，下标与 :attr:`student` 中的值对应"""
+        self.sessions: List[CQUSession] = []
+        """出现过的学期，下标与 :attr:`session` 中的值对应"""
+        session_index: Dict[CQUSession, int] = {}
+        self.student: List[int] = []
+        """每条成绩所属学生的下标"""
+        self.session: List[int] = []
+        """每条成绩所属学期的下标"""
+        self.credit: List[float] = []
+        """每条成绩的学分"""
+        self.value: List[float] = []
+        """每条成绩的百分制成绩，两级制成绩为 0"""
+        self.points: List[float] = []
+        """每条成绩的绩点，两级制成绩为 0"""
+        self.counted: List[bool] = []
+        """每条成绩是否计入绩点"""
+        self.passed: List[bool] = []
+        """每条成绩是否通过"""
+        for i, student in enumerate(self.students):
+            for score in scores[student]:
+                converted = None if score.score is None else convert(score.score)
+                if converted is None:
+                    continue
+                j = session_index.get(score.session)
+                if j is None:
+                    j = session_index[score.session] = len(self.sessions)
+                    self.sessions.append(score.session)
+                self.student.append(i)
+                self.session.append(j)
+                self.credit.append(score.course.credit or 0.0)
+                value, points, counted, passed = converted
+                self.value.append(value)
+                self.points.append(points)
+                self.counted.append(counted)
+                self.passed.append(passed)
+
+    def _aggregate(self, groups: Sequence[int], size: int) -> List[ScoreSummary]:
+        # 每组求和：计入绩点的学分、学分*绩点、学分*成绩、通过的学分、通过数、未通过数
+        if np is not None:
+            group = np.asarray(groups, dtype=np.intp)
+            credit = np.asarray(self.credit, dtype=np.float64)
+            counted = np.asarray(self.counted, dtype=bool)
+            passed = np.asarray(self.passed, dtype=bool)
+            weight = np.where(counted, credit, 0.0)
+            sums = zip(
+                np.bincount(group, weight, size).tolist(),
+                np.bincount(group, weight * np.asarray(self.points, dtype=np.float64), size).tolist(),
+                np.bincount(group, weight * np.asarray(self.value, dtype=np.float64), size).tolist(),
+                np.bincount(group, np.where(passed, credit, 0.0), size).tolist(),
+                np.bincount(group, passed, size).astype(np.int64).tolist(),
+                np.bincount(group, ~passed, size).astype(np.int64).tolist(),
+            )
+        else:
+            totals = [[0.0, 0.0, 0.0, 0.0, 0, 0] for _ in range(size)]
+            for g, credit, value, points, counted, passed in zip(
+                    groups, self.credit, self.value, self.points, self.counted, self.passed):
+                total = totals[g]
+                if counted:
+                    total[0] += credit
+                    total[1] += credit * points
+                    total[2] += credit * value
+                if passed:
+                    total[3] += credit
+                    total[4] += 1
+                else:
+                    total[5] += 1
+            sums = map(tuple, totals)  # type: ignore
+        return [
+            construct(ScoreSummary, True,
+                      gpa=weighted_points / gpa_credits if gpa_credits else None,
+                      average=weighted_value / gpa_credits if gpa_credits else None,
+                      credits=credits, gpa_credits=gpa_credits, passed=int(passed), failed=int(failed))
+            for gpa_credits, weighted_points, weighted_value, credits, passed, failed in sums
+        ]
+
+    def by_student(self) -> Dict[Hashable, ScoreSummary]:
+        """按学生统计
+
+        :return: 学生到其全部成绩的统计结果的映射
+        :rtype: Dict[Hashable, ScoreSummary]
+        """
+        return dict(zip(self.students, self._aggregate(self.student, len(self.students))))
+
+    def by_session(self) -> Dict[Hashable, Dict[CQUSession, ScoreSummary]]:
+        """按学生和学期统计
+
+        :return: 学生到（学期到该学期成绩的统计结果的映射）的映射，学期按时间排序，只含该学生有成绩的学期
+        :rtype: Dict[Hashable, Dict[CQUSession, ScoreSummary]]
+        """
+        width = len(self.sessions)
+        groups = [i * width + j for i, j in zip(self.student, self.session)]
+        summaries = self._aggregate(groups, len(self.students) * width)
+        present = set(groups)
+        # 学期 id 不随时间单调（2015 ~ 2018 年为特殊值，2015 年之前递减），按 CQUSession 本身排序
+        order = sorted(range(width), key=lambda j: self.sessions[j])
+        return {
+            student: {self.sessions[j]: summaries[i * width + j] for j in order if i * width + j in present}
+            for i, student in enumerate(self.students)
+        }
+
+    def __len__(self) -> int:
+        return len(self.student)
+
+
+def summarize(scores: Iterable[Score], **kwargs) -> ScoreSummary:
+    """统计一名学生的成绩
+
+    :param scores: 成绩
+    :type scores: Iterable[Score]
+    :param kwargs: 传给 :class:`ScoreTable` 的其他参数
+    :return: 统计结果
+    :rtype: ScoreSummary
+    """
+    return ScoreTable({None: scores}, **kwargs).by_student()[None]
@@ -0,0 +1,233 @@
+"""将课表和考表导出为 iCalendar（RFC 5545）日历
+
+导出以生成器的形式逐行产生，不会在内存中拼接整个日历；每个课表只生成一个带有 ``RRULE``
+（必要时带有 ``EXDATE``）的重复事件，而不是为每一次上课各生成一个事件。
+
+>>> with open("calendar.ics", "w", encoding="utf-8", newline="") as file:
+...     write_calendar(file, timetables=timetables, exams=exams, session_info=CQUSessionInfo.fetch(session))
+"""
+from __future__ import annotations
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from .course import CourseTimetable, CQUSessionInfo
+from .exam import Exam
+from .timetable import weeks_to_mask, mask_to_weeks
+
+__all__ = ("PERIOD_TIMES", "iter_timetable_events", "iter_exam_events", "iter_calendar", "write_calendar")
+
+TZID = "Asia/Shanghai"
+# 各节次的上下课时间，可以通过 ``period_times`` 参数覆盖
+PERIOD_TIMES: Dict[int, Tuple[time, time]] = {
+    1: (time(8, 30), time(9, 15)),
+    2: (time(9, 25), time(10, 10)),
+    3: (time(10, 30), time(11, 15)),
+    4: (time(11, 25), time(12, 10)),
+    5: (time(13, 30), time(14, 15)),
+    6: (time(14, 25), time(15, 10)),
+    7: (time(15, 20), time(16, 5)),
+    8: (time(16, 25), time(17, 10)),
+    9: (time(17, 20), time(18, 5)),
+    10: (time(19, 0), time(19, 45)),
+    11: (time(19, 55), time(20, 40)),
+    12: (time(20, 50), time(21, 35)),
+    13: (time(21, 45), time(22, 30)),
+}
+_VTIMEZONE = (
+    "BEGIN:VTIMEZONE",
+    f"TZID:{TZID}",
+    "BEGIN:STANDARD",
+    "DTSTART:19700101T000000",
+    "TZOFFSETFROM:+0800",
+    "TZOFFSETTO:+0800",
+    "TZNAME:CST",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+)
+
+
+def _escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    # 按 RFC 5545 3.1 节，每行不超过 75 个八位组，且不能截断 UTF-8 字符
+    if len(line.encode()) <= 75:
+        return line
+    parts: List[str] = []
+    current: List[str] = []
+    size = 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > limit:
+            parts.append("".join(current))
+            current, size, limit = [], 0, 74  # 续行开头的空格占一个八位组
+        current.append(char)
+        size += char_size
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def _local(day: date, at: time) -> str:
+    return datetime.combine(day, at.replace(tzinfo=None)).strftime("%Y%m%dT%H%M%S")
+
+
+def _recurrence(weeks: List[int], first_day: date, at: Optional[time]) -> List[str]:
+    """以尽量紧凑的 RRULE/EXDATE 描述给定的周次"""
+    if len(weeks) == 1:
+        return []
+    steps = {b - a for a, b in zip(weeks, weeks[1:])}
+    if len(steps) == 1:
+        return [f"RRULE:FREQ=WEEKLY;INTERVAL={steps.pop()};COUNT={len(weeks)}"]
+    lines = [f"RRULE:FREQ=WEEKLY;COUNT={weeks[-1] - weeks[0] + 1}"]
+    present = set(weeks)
+    excluded = [first_day + timedelta(weeks=week - weeks[0])
+                for week in range(weeks[0], weeks[-1] + 1) if week not in present]
+    if at is None:
+        lines.append("EXDATE;VALUE=DATE:" + ",".join(day.strftime("%Y%m%d") for day in excluded))
+    else:
+        lines.append(f"EXDATE;TZID={TZID}:" + ",".join(_local(day, at) for day in excluded))
+    return lines
+
+
+def _uid(*parts: object) -> str:
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest() + "@mycqu"
+
+
+def iter_timetable_events(timetables: Iterable[CourseTimetable],
+                          session_info: CQUSessionInfo,
+                          period_times: Optional[Dict[int, Tuple[time, time]]] = None,
+                          dtstamp: Optional[datetime] = None) -> Iterator[str]:
+    """逐行生成课表对应的 ``VEVENT``
+
+    第 1 周为 :attr:`.course.CQUSessionInfo.begin_date` 所在的那一周。整周占用的课表（:attr:`.course.CourseTimetable.whole_week`）
+    生成全天事件，既没有星期节次也不占用整周的课表被忽略。
+
+    :param timetables: 课表
+    :type timetables: Iterable[CourseTimetable]
+    :param session_info: 课表所在学期的信息
+    :type session_info: CQUSessionInfo
+    :param period_times: 各节次的上下课时间，默认为 :data:`PERIOD_TIMES`
+    :type period_times: Optional[Dict[int, Tuple[time, time]]], optional
+    :param dtstamp: 事件的 ``DTSTAMP``，默认为当前时间
+    :type dtstamp: Optional[datetime], optional
+    :return: 已折行的日历内容行（不含行尾的 CRLF）
+    :rtype: Iterator[str]
+    """
+    period_times = PERIOD_TIMES if period_times is None else period_times
+    stamp = (dtstamp or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    monday = session_info.begin_date - timedelta(days=session_info.begin_date.weekday())
+    for timetable in timetables:
+        weeks = mask_to_weeks(weeks_to_mask(timetable.weeks))
+        if not weeks:
+            continue
+        course = timetable.course
+        lines = ["BEGIN:VEVENT",
+                 f"UID:{_uid(session_info.session, course.code, course.course_num, timetable.weeks, timetable.day_time)}",
+                 f"DTSTAMP:{stamp}",
+                 f"SUMMARY:{_escape(course.name)}"]
+        if timetable.day_time is not None:
+            start_period, end_period = timetable.day_time.period
+            if start_period not in period_times or end_period not in period_times:
+                continue
+            first_day = monday + timedelta(weeks=weeks[0] - 1, days=timetable.day_time.weekday)
+            start = period_times[start_period][0]
+            lines.append(f"DTSTART;TZID={TZID}:{_local(first_day, start)}")
+            lines.append(f"DTEND;TZID={TZID}:{_local(first_day, period_times[end_period][1])}")
+            lines.extend(_recurrence(weeks, first_day, start))
+        elif timetable.whole_week:
+            first_day = monday + timedelta(weeks=weeks[0] - 1)
+            lines.append(f"DTSTART;VALUE=DATE:{first_day.strftime('%Y%m%d')}")
+            lines.append(f"DTEND;VALUE=DATE:{(first_day + timedelta(weeks=1)).strftime('%Y%m%d')}")
+            lines.extend(_recurrence(weeks, first_day, None))
+        else:
+            continue
+        if timetable.classroom:
+            lines.append(f"LOCATION:{_escape(timetable.classroom)}")
+        if course.instructor:
+            lines.append(f"DESCRIPTION:{_escape(course.instructor)}")
+        lines.append("END:VEVENT")
+        for line in lines:
+            yield _fold(line)
+
+
+def iter_exam_events(exams: Iterable[Exam], dtstamp: Optional[datetime] = None) -> Iterator[str]:
+    """逐行生成考试对应的 ``VEVENT``
+
+    :param exams: 考试
+    :type exams: Iterable[Exam]
+    :param dtstamp: 事件的 ``DTSTAMP``，默认为当前时间
+    :type dtstamp: Optional[datetime], optional
+    :return: 已折行的日历内容行（不含行尾的 CRLF）
+    :rtype: Iterator[str]
+    """
+    stamp = (dtstamp or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    for exam in exams:
+        lines = ("BEGIN:VEVENT",
+                 f"UID:{_uid(exam.stu_id, exam.course.code, exam.batch_id, exam.date)}",
+                 f"DTSTAMP:{stamp}",
+                 f"SUMMARY:{_escape('考试：' + exam.course.name)}",
+                 f"DTSTART;TZID={TZID}:{_local(exam.date, exam.start_time)}",
+                 f"DTEND;TZID={TZID}:{_local(exam.date, exam.end_time)}",
+                 f"LOCATION:{_escape(exam.room)}",
+                 f"DESCRIPTION:{_escape(f'{exam.batch}，座号 {exam.seat_num}')}",
+                 "END:VEVENT")
+        for line in lines:
+            yield _fold(line)
+
+
+def iter_calendar(timetables: Iterable[CourseTimetable] = (),
+                  exams: Iterable[Exam] = (),
+                  session_info: Optional[CQUSessionInfo] = None,
+                  name: Optional[str] = None,
+                  period_times: Optional[Dict[int, Tuple[time, time]]] = None,
+                  dtstamp: Optional[datetime] = None) -> Iterator[str]:
+    """逐行生成完整的 ``VCALENDAR``，每行带有行尾的 CRLF
+
+    :param timetables: 课表，非空时需要提供 ``session_info``
+    :type timetables: Iterable[CourseTimetable], optional
+    :param exams: 考试
+    :type exams: Iterable[Exam], optional
+    :param session_info: 课表所在学期的信息
+    :type session_info: Optional[CQUSessionInfo], optional
+    :param name: 日历名称（``X-WR-CALNAME``）
+    :type name: Optional[str], optional
+    :param period_times: 各节次的上下课时间，默认为 :data:`PERIOD_TIMES`
+    :type period_times: Optional[Dict[int, Tuple[time, time]]], optional
+    :param dtstamp: 事件的 ``DTSTAMP``，默认为当前时间
+    :type dtstamp: Optional[datetime], optional
+    :raises ValueError: 提供了课表但没有提供 ``session_info``
+    :rtype: Iterator[str]
+    """
+    dtstamp = dtstamp or datetime.now(timezone.utc)
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield "PRODID:-//pymycqu//mycqu.ical//ZH\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    if name is not None:
+        yield _fold(f"X-WR-CALNAME:{_escape(name)}") + "\r\n"
+    for line in _VTIMEZONE:
+        yield line + "\r\n"
+    timetables = iter(timetables)
+    first = next(timetables, None)
+    if first is not None:
+        if session_info is None:
+            raise ValueError("session_info is needed to export timetables")
+        yield from (line + "\r\n" for line in
+                    iter_timetable_events((first,), session_info, period_times, dtstamp))
+        yield from (line + "\r\n" for line in
+                    iter_timetable_events(timetables, session_info, period_times, dtstamp))
+    yield from (line + "\r\n" for line in iter_exam_events(exams, dtstamp))
+    yield "END:VCALENDAR\r\n"
+
+
+def write_calendar(file: IO[str], **kwargs) -> None:
+    """将 :func:`iter_calendar` 生成的日历逐行写入文件，参数与 :func:`iter_calendar` 相同
+
+    :param file: 以文本模式打开的文件，应当以 ``newline=""`` 打开以保留 CRLF
+    :type file: IO[str]
+    """
+    for line in iter_calendar(**kwargs):
+        file.write(line)
@@ -0,0 +1,332 @@
+"""请求与解析的观测
+
+库中发出的每个请求和每个解析阶段都会通知注册了的观察者（:class:`Observer`），
+事件带有逻辑操作名（如 :obj:`"login.post"`、:obj:`"mycqu.token"`、:obj:`"card.fee_data"`、:obj:`"score.from_dict"`），
+观察者据此统计各个环节的耗时。没有注册观察者时，通知只是一次判断，几乎没有开销。
+
+>>> from mycqu import instrument
+>>> stats = instrument.Aggregator()
+>>> with instrument.observing(stats):
+...     login(session, username, password)
+...     access_mycqu(session)
+>>> stats.summary()["login.post"].latency_avg
+0.083
+
+:class:`Histogram` 以 Prometheus 的文本格式导出延迟的直方图，可以直接作为 ``/metrics`` 的响应内容。
+
+观察者在发出请求或完成解析的线程中被同步调用，需要是线程安全的，且不应耗时过久；观察者抛出的异常会向上传播。
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from ._lib_wrapper.dataclass import dataclass, construct
+
+__all__ = ("RequestEvent", "ParseEvent", "Observer", "add_observer", "remove_observer", "observing",
+           "report", "parsing", "OperationStats", "Aggregator", "Histogram", "DEFAULT_BUCKETS")
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+""":class:`Histogram` 默认的桶上界（秒），与 Prometheus 客户端的默认值相同"""
+
+# 以元组保存，注册和注销时整体替换，通知时无需加锁
+_observers: Tuple[Observer, ...] = ()
+_observers_lock = threading.Lock()
+
+
+@dataclass
+class RequestEvent:
+    """一次请求（重定向的每一跳各是一次请求）
+    """
+    operation: str
+    """逻辑操作名，如 :obj:`"login.post"`"""
+    method: str
+    """请求方法"""
+    host: str
+    """主机名"""
+    status: int
+    """状态码"""
+    bytes: int
+    """响应内容的字节数"""
+    latency: float
+    """从发出请求到收到响应的时间（秒）"""
+
+
+@dataclass
+class ParseEvent:
+    """一个解析阶段，如 json 反序列化或由字典构建对象
+    """
+    operation: str
+    """逻辑操作名，如 :obj:`"score.from_dict"`"""
+    duration: float
+    """耗时（秒）"""
+
+
+class Observer:
+    """观察者的基类，按需覆盖其中的方法
+    """
+
+    def on_request(self, event: RequestEvent) -> None:
+        """完成一次请求时调用
+
+        :param event: 请求事件
+        :type event: RequestEvent
+        """
+
+    def on_parse(self, event: ParseEvent) -> None:
+        """完成一个解析阶段时调用
+
+        :param event: 解析事件
+        :type event: ParseEvent
+        """
+
+
+def add_observer(observer: Observer) -> None:
+    """注册观察者
+
+    :param observer: 观察者
+    :type observer: Observer
+    """
+    global _observers  # pylint: disable=global-statement
+    with _observers_lock:
+        _observers = _observers + (observer,)
+
+
+def remove_observer(observer: Observer) -> None:
+    """注销观察者，未注册时什么也不做
+
+    :param observer: 观察者
+    :type observer: Observer
+    """
+    global _observers  # pylint: disable=global-statement
+    with _observers_lock:
+        _observers = tuple(registered for registered in _observers if registered is not observer)
+
+
+@contextmanager
+def observing(observer: Observer) -> Iterator[Observer]:
+    """在 ``with`` 块中注册观察者
+
+    :param observer: 观察者
+    :type observer: Observer
+    """
+    add_observer(observer)
+    try:
+        yield observer
+    finally:
+        remove_observer(observer)
+
+
+def _request_event(operation: str, response: Any) -> RequestEvent:
+    request = response.request
+    url = response.url
+    host = url.host if hasattr(url, "host") else urlsplit(url).hostname or ""
+    return construct(RequestEvent, True,
+                     operation=operation, method=request.method, host=host, status=response.status_code,
+                     bytes=len(response.content), latency=response.elapsed.total_seconds())
+
+
+def report(operation: str, response: Any, history: bool = True) -> Any:
+    """向观察者报告一次请求
+
+    由缓存构造、没有对应请求的响应（见 :class:`.cache.ResponseCache`）不会被报告。
+
+    :param operation: 逻辑操作名
+    :type operation: str
+    :param response: :mod:`requests` 或 :mod:`httpx` 的响应
+    :type response: Union[requests.Response, httpx.Response]
+    :param history: 是否将 ``response`` 中自动跟随的重定向（``response.history``）也各报告一次，默认为 :obj:`True`
+    :type history: bool, optional
+    :return: 传入的 ``response``
+    """
+    observers = _observers
+    if observers and getattr(response, "_request", response.__dict__.get("request")) is not None:
+        for hop in (*response.history, response) if history else (response,):
+            event = _request_event(operation, hop)
+            for observer in observers:
+                observer.on_request(event)
+    return response
+
+
+class parsing:  # pylint: disable=invalid-name
+    """向观察者报告 ``with`` 块的耗时，作为一个解析阶段
+
+    >>> with parsing("score.from_dict"):
+    ...     scores = [Score.from_dict(data) for data in raw]
+
+    :param operation: 逻辑操作名
+    :type operation: str
+    """
+    __slots__ = ("operation", "_observers", "_start")
+
+    def __init__(self, operation: str):
+        self.operation: str = operation
+        self._observers: Tuple[Observer, ...] = ()
+        self._start: float = 0
+
+    def __enter__(self) -> parsing:
+        self._observers = _observers
+        if self._observers:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._observers and exc_info[0] is None:
+            event = construct(ParseEvent, True, operation=self.operation,
+                              duration=time.perf_counter() - self._start)
+            for observer in self._observers:
+                observer.on_parse(event)
+
+
+@dataclass
+class OperationStats:
+    """某一逻辑操作的统计
+    """
+    requests: int
+    """请求数"""
+    errors: int
+    """状态码不小于 400 的请求数"""
+    bytes: int
+    """响应内容的总字节数"""
+    latency_total: float
+    """请求的总耗时（秒）"""
+    latency_max: float
+    """最长的请求耗时（秒）"""
+    parses: int
+    """解析次数"""
+    parse_total: float
+    """解析的总耗时（秒）"""
+
+    @property
+    def latency_avg(self) -> Optional[float]:
+        """平均请求耗时（秒），没有请求时为 :obj:`None`"""
+        return self.latency_total / self.requests if self.requests else None
+
+    @property
+    def parse_avg(self) -> Optional[float]:
+        """平均解析耗时（秒），没有解析时为 :obj:`None`"""
+        return self.parse_total / self.parses if self.parses else None
+
+
+class Aggregator(Observer):
+    """在进程内按逻辑操作汇总请求数、错误数、字节数和耗时
+    """
+
+    def __init__(self):
+        # 每个操作：请求数、错误数、字节数、总耗时、最长耗时、解析次数、解析总耗时
+        self._stats: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, operation: str) -> List[Any]:
+        entry = self._stats.get(operation)
+        if entry is None:
+            entry = self._stats[operation] = [0, 0, 0, 0.0, 0.0, 0, 0.0]
+        return entry
+
+    def on_request(self, event: RequestEvent) -> None:
+        with self._lock:
+            entry = self._entry(event.operation)
+            entry[0] += 1
+            entry[1] += event.status >= 400
+            entry[2] += event.bytes
+            entry[3] += event.latency
+            entry[4] = max(entry[4], event.latency)
+
+    def on_parse(self, event: ParseEvent) -> None:
+        with self._lock:
+            entry = self._entry(event.operation)
+            entry[5] += 1
+            entry[6] += event.duration
+
+    def summary(self) -> Dict[str, OperationStats]:
+        """获取各个逻辑操作的统计
+
+        :return: 逻辑操作名到统计的映射，按操作名排序
+        :rtype: Dict[str, OperationStats]
+        """
+        with self._lock:
+            items = sorted((operation, tuple(entry)) for operation, entry in self._stats.items())
+        return {operation: construct(OperationStats, True, requests=requests, errors=errors, bytes=size,
+                                     latency_total=latency_total, latency_max=latency_max,
+                                     parses=parses, parse_total=parse_total)
+                for operation, (requests, errors, size, latency_total, latency_max, parses, parse_total) in items}
+
+    def reset(self) -> None:
+        """清空统计"""
+        with self._lock:
+            self._stats.clear()
+
+
+class Histogram(Observer):
+    """按逻辑操作统计请求耗时和解析耗时的直方图，以 Prometheus 的文本格式导出
+
+    >>> histogram = Histogram()
+    >>> instrument.add_observer(histogram)
+    >>> print(histogram.render())
+    # TYPE mycqu_request_duration_seconds histogram
+    mycqu_request_duration_seconds_bucket{operation="login.post",le="0.005"} 0
+    ...
+
+    :param buckets: 桶的上界（秒），升序，默认为 :data:`DEFAULT_BUCKETS`
+    :type buckets: Sequence[float], optional
+    :param prefix: 指标名的前缀，默认为 :obj:`"mycqu"`
+    :type prefix: str, optional
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = "mycqu"):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.prefix: str = prefix
+        # 指标名 -> 标签 -> [各个桶（不累计）的计数..., 超出最大上界的计数, 总和]
+        self._series: Dict[str, Dict[Tuple[Tuple[str, str], ...], List[float]]] = {
+            "request_duration_seconds": {}, "parse_duration_seconds": {}}
+        self._lock = threading.Lock()
+
+    def _observe(self, metric: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        with self._lock:
+            series = self._series[metric].get(labels)
+            if series is None:
+                series = self._series[metric][labels] = [0.0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def on_request(self, event: RequestEvent) -> None:
+        self._observe("request_duration_seconds",
+                      (("operation", event.operation), ("host", event.host), ("status", str(event.status))),
+                      event.latency)
+
+    def on_parse(self, event: ParseEvent) -> None:
+        self._observe("parse_duration_seconds", (("operation", event.operation),), event.duration)
+
+    def render(self) -> str:
+        """以 Prometheus 的文本格式导出
+
+        :rtype: str
+        """
+        lines: List[str] = []
+        with self._lock:
+            snapshot = {metric: {labels: list(series) for labels, series in serieses.items()}
+                        for metric, serieses in self._series.items()}
+        for metric, serieses in snapshot.items():
+            name = f"{self.prefix}_{metric}"
+            lines.append(f"# TYPE {name} histogram")
+            for labels, series in sorted(serieses.items()):
+                label_str = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series):
+                    cumulative += int(count)
+                    lines.append(f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label_str}}} {series[-1]}")
+                lines.append(f"{name}_count{{{label_str}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """清空统计"""
+        with self._lock:
+            for serieses in self._series.values():
+                serieses.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -1,16 +1,31 @@
 """my.cqu.edu.cn 认证相关的模块
 """
-from typing import Dict
+from __future__ import annotations
+from typing import Any, Dict, Optional
 import re
-from requests import Session
-from .auth import access_sso_service
-__all__ = ("access_mycqu",)
+import threading
+import time
+import weakref
+from requests import Session, Response, cookies
+from ._lib_wrapper.dataclass import dataclass
+from .auth import access_sso_service, UnknownAuthserverException, _detached
+from .instrument import report
+__all__ = ("access_mycqu", "MycquToken")
 
 MYCQU_TOKEN_INDEX_URL = "https://my.cqu.edu.cn/enroll/token-index"
 MYCQU_TOKEN_URL = "https://my.cqu.edu.cn/authserver/oauth/token"
 MYCQU_AUTHORIZE_URL = f"https://my.cqu.edu.cn/authserver/oauth/authorize?client_id=enroll-prod&response_type=code&scope=all&state=&redirect_uri={MYCQU_TOKEN_INDEX_URL}"
 MYCQU_SERVICE_URL = "https://my.cqu.edu.cn/authserver/authentication/cas"
+MYCQU_API_URL = "https://my.cqu.edu.cn/api/"
 CODE_RE = re.compile(r"\?code=([^&]+)&")
+# 认证信息在过期前多少秒即视为需要刷新
+TOKEN_EXPIRY_MARGIN = 60
+
+_TOKENS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_HOOKED: weakref.WeakSet = weakref.WeakSet()
+# 每个会话一把锁，一个帐号的刷新不会阻塞其他帐号
+_REFRESH_LOCKS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_REFRESH_LOCKS_LOCK = threading.Lock()
 
 
 class MycquUnauthorized(Exception):
@@ -18,11 +33,51 @@ class MycquUnauthorized(Exception):
         super().__init__("Unanthorized in mycqu, auth.login firstly and then mycqu.access_mycqu")
 
 
-def get_oauth_token(session: Session) -> str:
+@dataclass
+class MycquToken:
+    """my.cqu.edu.cn 的认证信息
+    """
+    authorization: str
+    """请求头 ``Authorization`` 的值，如 :obj:`"Bearer xxx"`"""
+    expires_at: Optional[float]
+    """过期时间戳，未知则为 :obj:`None`"""
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any], now: Optional[float] = None) -> MycquToken:
+        """从反序列化的 oauth token 响应中获取认证信息
+
+        :param data: json 反序列化得到的字典
+        :type data: Dict[str, Any]
+        :param now: 获取响应的时间戳，默认为 :func:`time.time`
+        :type now: Optional[float], optional
+        :rtype: MycquToken
+        """
+        expires_in = data.get("expires_in")
+        return MycquToken(
+            authorization="Bearer " + data['access_token'],
+            expires_at=None if expires_in is None else
+            (time.time() if now is None else now) + float(expires_in)
+        )
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """判断认证信息是否仍然可用（距离过期还有超过 :data:`TOKEN_EXPIRY_MARGIN` 秒），过期时间未知时视为可用
+
+        :param now: 当前时间戳，默认为 :func:`time.time`
+        :type now: Optional[float], optional
+        :rtype: bool
+        """
+        if self.expires_at is None:
+            return True
+        return self.expires_at - TOKEN_EXPIRY_MARGIN > (time.time() if now is None else now)
+
+
+def fetch_oauth_token(session: Session) -> MycquToken:
     # from https://github.com/CQULHW/CQUQueryGrade
-    resp = session.get(MYCQU_AUTHORIZE_URL, allow_redirects=False)
-    match = CODE_RE.search(resp.headers['Location'])
-    assert match
+    resp = report("mycqu.authorize", session.get(MYCQU_AUTHORIZE_URL, allow_redirects=False))
+    match = CODE_RE.search(resp.headers.get('Location', ''))
+    if not match:
+        raise UnknownAuthserverException(
+            f"status code {resp.status_code} is got when authorizing mycqu, but no code is found")
     token_data = {
         'client_id': 'enroll-prod',
         'client_secret': 'app-a-1234',
@@ -30,24 +85,117 @@ def get_oauth_token(session: Session) -> str:
         'redirect_uri': MYCQU_TOKEN_INDEX_URL,
         'grant_type': 'authorization_code'
     }
-    access_token = session.post(MYCQU_TOKEN_URL, data=token_data)
-    return "Bearer " + access_token.json()['access_token']
+    now = time.time()
+    access_token = report("mycqu.token", session.post(MYCQU_TOKEN_URL, data=token_data))
+    if access_token.status_code != 200:
+        raise UnknownAuthserverException(
+            f"status code {access_token.status_code} is got when fetching mycqu oauth token")
+    return MycquToken.from_dict(access_token.json(), now)
+
+
+def get_oauth_token(session: Session) -> str:
+    return fetch_oauth_token(session).authorization
 
 
-def access_mycqu(session: Session, add_to_header: bool = True) -> Dict[str, str]:
+def get_cached_token(session: Session) -> Optional[MycquToken]:
+    """获取会话中缓存的 mycqu 认证信息
+
+    :param session: 会话
+    :type session: Session
+    :return: 缓存的认证信息，没有则为 :obj:`None`
+    :rtype: Optional[MycquToken]
+    """
+    return _TOKENS.get(session)
+
+
+def set_cached_token(session: Session, token: Optional[MycquToken]) -> None:
+    """设置（或在 ``token`` 为 :obj:`None` 时清除）会话中缓存的 mycqu 认证信息
+
+    :param session: 会话
+    :type session: Session
+    :param token: 认证信息
+    :type token: Optional[MycquToken]
+    """
+    if token is None:
+        _TOKENS.pop(session, None)
+    else:
+        _TOKENS[session] = token
+
+
+def _refresh_lock(session: Session) -> threading.Lock:
+    lock = _REFRESH_LOCKS.get(session)
+    if lock is None:
+        with _REFRESH_LOCKS_LOCK:
+            lock = _REFRESH_LOCKS.setdefault(session, threading.Lock())
+    return lock
+
+
+def _install_refresh_hook(session: Session) -> None:
+    if session in _HOOKED:
+        return
+    session_ref = weakref.ref(session)
+
+    def refresh_on_unauthorized(response: Response, *args, **kwargs):
+        session = session_ref()
+        request = response.request
+        if session is None or response.status_code != 401 or \
+                not response.url.startswith(MYCQU_API_URL) or \
+                getattr(request, "_mycqu_refreshed", False):
+            return None
+        token = _TOKENS.get(session)
+        if token is None or request.headers.get("Authorization") != token.authorization:
+            return None
+        with _refresh_lock(session):
+            current = _TOKENS.get(session)
+            # 其他线程可能已经刷新过
+            if current is token or current is None:
+                authorization = access_mycqu(session, force=True)["Authorization"]
+            else:
+                authorization = current.authorization
+        retry = request.copy()
+        retry.headers["Authorization"] = authorization
+        retry._mycqu_refreshed = True  # type: ignore # pylint: disable=protected-access
+        response.close()
+        return session.send(retry, **kwargs)
+
+    session.hooks["response"].append(refresh_on_unauthorized)
+    _HOOKED.add(session)
+
+
+def access_mycqu(session: Session, add_to_header: bool = True, force: bool = False,
+                 auto_refresh: bool = True) -> Dict[str, str]:
     """用登陆了统一身份认证的会话在 my.cqu.edu.cn 进行认证
 
+    认证信息会连同其过期时间缓存在会话中，在其过期前再次调用时直接返回而不发出任何请求。
+
     :param session: 登陆了统一身份认证的会话
     :type session: Session
     :param add_to_header: 是否将 mycqu 的认证信息写入会话属性，默认为 :obj:`True`
     :type add_to_header: bool, optional
+    :param force: 是否忽略缓存的认证信息重新认证，默认为 :obj:`False`
+    :type force: bool, optional
+    :param auto_refresh: 当 ``add_to_header`` 为 :obj:`True` 时，是否在 my.cqu.edu.cn 的 api 返回 401 时自动重新认证并重试一次，
+                         默认为 :obj:`True`
+    :type auto_refresh: bool, optional
     :return: mycqu 认证信息的请求头，当 ``add_to_header`` 参数为 :obj:`True` 时无需手动使用该返回值
     :rtype: Dict[str, str]
     """
-    if "Authorization" in session.headers:
-        del session.headers["Authorization"]
-    access_sso_service(session, MYCQU_SERVICE_URL)
-    token = get_oauth_token(session)
+    token = _TOKENS.get(session)
+    if not force and token is not None and token.is_fresh() and \
+            (not add_to_header or session.headers.get("Authorization") == token.authorization):
+        # 缓存可能来自 store.restore_session，此时还没有安装刷新的钩子
+        if add_to_header and auto_refresh:
+            _install_refresh_hook(session)
+        return {"Authorization": token.authorization}
+    # 在副本上认证，不改动其他线程可能正在使用的会话的请求头，期间它们的请求仍然带着原来的认证信息
+    detached = _detached(session)
+    detached.headers.pop("Authorization", None)
+    access_sso_service(detached, MYCQU_SERVICE_URL)
+    token = fetch_oauth_token(detached)
+    cookies.merge_cookies(session.cookies, detached.cookies)
+    _TOKENS[session] = token
     if add_to_header:
-        session.headers["Authorization"] = token
-    return {"Authorization": token}
+        session.headers["Authorization"] = token.authorization
+        if auto_refresh:
+            _install_refresh_hook(session)
+    return {"Authorization": token.authorization}
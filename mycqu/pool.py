@@ -0,0 +1,370 @@
+"""多帐号会话池，负责登录、过期检测与后台重新登录
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, Optional
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from requests import Session
+from ._lib_wrapper.dataclass import dataclass
+from .auth import login, NotLogined, NeedCaptcha, IncorrectLoginCredentials
+from .mycqu import access_mycqu, MycquUnauthorized
+from .store import SessionStore, dump_session, restore_session
+
+__all__ = ("SessionPool", "SessionHealth", "LeaseTimeout", "PoolClosed")
+
+_STATE_NEW = "new"
+_STATE_LOGGING_IN = "logging_in"
+_STATE_READY = "ready"
+_STATE_EXPIRED = "expired"
+_STATE_FAILED = "failed"
+
+# 这些错误无法通过重试解决，需要调用者更新凭据或处理验证码
+_PERMANENT_ERRORS = (IncorrectLoginCredentials, NeedCaptcha)
+
+
+class LeaseTimeout(Exception):
+    """等待会话登录超时时抛出
+    """
+
+    def __init__(self, username: str):
+        super().__init__(f"timeout when waiting session of {username} to be logined")
+        self.username: str = username
+        """对应的帐号"""
+
+
+class PoolClosed(Exception):
+    """会话池已经关闭时借出会话，或等待登录期间会话池被关闭时抛出
+    """
+
+    def __init__(self):
+        super().__init__("session pool is closed")
+
+
+@dataclass
+class SessionHealth:
+    """会话池中某一帐号会话的状态快照
+    """
+    username: str
+    """帐号"""
+    state: str
+    """状态，取值为 :obj:`"new"`、:obj:`"logging_in"`、:obj:`"ready"`、:obj:`"expired"`、:obj:`"failed"`"""
+    logins: int
+    """成功登录的次数"""
+    failures: int
+    """登录失败的次数"""
+    last_login: Optional[float]
+    """最近一次成功登录的时间戳，未登录过则为 :obj:`None`"""
+    last_error: Optional[str]
+    """最近一次登录失败的错误信息，最近一次登录成功则为 :obj:`None`"""
+
+
+class _Entry:
+    def __init__(self, username: str, password: str):
+        self.username: str = username
+        self.password: str = password
+        self.session: Optional[Session] = None
+        self.generation: int = 0
+        self.state: str = _STATE_NEW
+        self.ready: threading.Event = threading.Event()
+        self.future: Optional[Future] = None
+        self.error: Optional[BaseException] = None
+        self.logins: int = 0
+        self.failures: int = 0
+        self.last_login: Optional[float] = None
+
+
+class SessionPool:
+    """以帐号为键的会话池
+
+    会话池在后台线程中完成统一身份认证登录（以及可选的 mycqu 认证），并把登录好的会话借给调用者。
+    在借出期间抛出 :class:`.auth.NotLogined` 或 :class:`.mycqu.MycquUnauthorized` 时，会话会被标记为过期，
+    并在后台重新登录；重新登录得到的是新的会话对象，不会影响仍在使用旧会话的调用者。
+
+    >>> pool = SessionPool(max_logins=4)
+    >>> pool.add("统一身份认证号", "统一身份认证密码")
+    >>> with pool.lease("统一身份认证号") as session:
+    ...     CourseTimetable.fetch(session, "201xxxxx")
+
+    :param max_logins: 同时进行的登录数量上限
+    :type max_logins: int, optional
+    :param mycqu: 登录后是否在 my.cqu.edu.cn 进行认证（:func:`.mycqu.access_mycqu`），默认为 :obj:`True`
+    :type mycqu: bool, optional
+    :param max_age: 会话登录后经过多少秒在后台主动重新登录，默认为 :obj:`None` 即只在检测到过期时重新登录
+    :type max_age: Optional[float], optional
+    :param session_factory: 创建新会话的函数，默认为 :class:`requests.Session`
+    :type session_factory: Callable[[], Session], optional
+    :param login_kwargs: 传给 :func:`.auth.login` 的额外参数
+    :type login_kwargs: Optional[Dict[str, Any]], optional
+    :param store: 持久化登录状态的存储，登录成功后写入，见 :meth:`restore`；默认为 :obj:`None` 即不持久化
+    :type store: Optional[SessionStore], optional
+    :param store_max_age: 从存储中恢复时，保存后最多经过多少秒的登录状态仍被采用，默认为 :obj:`None` 即不限制
+    :type store_max_age: Optional[float], optional
+    """
+
+    def __init__(self,
+                 max_logins: int = 4,
+                 mycqu: bool = True,
+                 max_age: Optional[float] = None,
+                 session_factory: Callable[[], Session] = Session,
+                 login_kwargs: Optional[Dict[str, Any]] = None,
+                 store: Optional[SessionStore] = None,
+                 store_max_age: Optional[float] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_logins,
+                                            thread_name_prefix="mycqu-login")
+        self._mycqu: bool = mycqu
+        self._max_age: Optional[float] = max_age
+        self._session_factory: Callable[[], Session] = session_factory
+        self._login_kwargs: Dict[str, Any] = login_kwargs or {}
+        self._store: Optional[SessionStore] = store
+        self._store_max_age: Optional[float] = store_max_age
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._closed: bool = False
+
+    def __enter__(self) -> SessionPool:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, username: str, password: str, login_now: bool = False) -> None:
+        """向会话池中添加帐号，已有该帐号时更新其密码并在下次借出时重新登录
+
+        :param username: 统一身份认证号或学工号
+        :type username: str
+        :param password: 统一身份认证密码
+        :type password: str
+        :param login_now: 是否立即在后台开始登录，默认为 :obj:`False` 即在第一次借出时登录
+        :type login_now: bool, optional
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                entry = self._entries[username] = _Entry(username, password)
+            elif entry.password != password:
+                entry.password = password
+                if entry.state != _STATE_LOGGING_IN:
+                    entry.state = _STATE_EXPIRED
+            if login_now:
+                self._schedule(entry)
+
+    def remove(self, username: str) -> None:
+        """从会话池中移除帐号，正在借出的会话仍可继续使用
+
+        正在进行的登录完成时其会话会被直接关闭，正在等待该帐号登录的 :meth:`lease` 抛出 :class:`KeyError`。
+
+        :param username: 帐号
+        :type username: str
+        """
+        with self._lock:
+            entry = self._entries.pop(username, None)
+            if entry is not None:
+                self._abandon(entry, KeyError(username))
+
+    def warm_up(self) -> None:
+        """在后台为所有尚未登录或已过期的帐号开始登录
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.state in (_STATE_NEW, _STATE_EXPIRED):
+                    self._schedule(entry)
+
+    def restore(self) -> int:
+        """从存储中恢复尚未登录的帐号的登录状态，不进行任何网络请求
+
+        恢复的登录状态若实际上已经失效，会在借出使用时被检测到并重新登录。
+
+        :return: 恢复的帐号数量
+        :rtype: int
+        """
+        if self._store is None:
+            return 0
+        now = time.time()
+        restored = 0
+        stored_sessions = self._store.load_all()
+        with self._lock:
+            for username, stored in stored_sessions.items():
+                entry = self._entries.get(username)
+                if entry is None or entry.state != _STATE_NEW or \
+                        not stored.is_fresh(self._store_max_age, now):
+                    continue
+                entry.session = restore_session(stored, self._session_factory())
+                entry.generation += 1
+                entry.last_login = stored.saved_at
+                entry.state = _STATE_READY
+                entry.ready.set()
+                restored += 1
+        return restored
+
+    def invalidate(self, username: str, generation: Optional[int] = None) -> None:
+        """将帐号的会话标记为过期并在后台重新登录
+
+        :param username: 帐号
+        :type username: str
+        :param generation: 借出会话时的登录代次，若会话已经被重新登录过则忽略本次标记；
+                           默认为 :obj:`None` 即无条件标记
+        :type generation: Optional[int], optional
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry.state == _STATE_LOGGING_IN:
+                return
+            if generation is not None and generation != entry.generation:
+                return
+            entry.state = _STATE_EXPIRED
+            entry.session = None
+            self._schedule(entry)
+        if self._store is not None:
+            self._store.delete(username)
+
+    def health(self, username: str) -> SessionHealth:
+        """获取某一帐号会话的状态
+
+        :param username: 帐号
+        :type username: str
+        :raises KeyError: 会话池中没有该帐号
+        :rtype: SessionHealth
+        """
+        with self._lock:
+            return self._health(self._entries[username])
+
+    def health_all(self) -> Dict[str, SessionHealth]:
+        """获取所有帐号会话的状态
+
+        :rtype: Dict[str, SessionHealth]
+        """
+        with self._lock:
+            return {username: self._health(entry) for username, entry in self._entries.items()}
+
+    @contextmanager
+    def lease(self, username: str, timeout: Optional[float] = None) -> Iterator[Session]:
+        """借出某一帐号已登录的会话，在 ``with`` 语句中使用
+
+        :param username: 帐号
+        :type username: str
+        :param timeout: 等待登录完成的最长时间（单位秒），默认为 :obj:`None` 即一直等待
+        :type timeout: Optional[float], optional
+        :raises KeyError: 会话池中没有该帐号，或等待登录期间帐号被移除
+        :raises LeaseTimeout: 等待登录超时
+        :raises PoolClosed: 会话池已经关闭，或等待登录期间会话池被关闭
+        :raises IncorrectLoginCredentials: 帐号密码有误，需要用 :meth:`add` 更新密码
+        :raises NeedCaptcha: 登录需要验证码
+        :return: 已登录的会话
+        :rtype: Iterator[Session]
+        """
+        with self._lock:
+            if self._closed:
+                raise PoolClosed()
+            entry = self._entries[username]
+            if entry.state in (_STATE_NEW, _STATE_EXPIRED) or \
+                    (entry.state == _STATE_FAILED and not isinstance(entry.error, _PERMANENT_ERRORS)):
+                self._schedule(entry)
+            elif entry.state == _STATE_READY and self._max_age is not None and \
+                    entry.last_login is not None and time.time() - entry.last_login > self._max_age:
+                self._schedule(entry)
+        if entry.session is None:
+            if not entry.ready.wait(timeout):
+                raise LeaseTimeout(username)
+        with self._lock:
+            session, generation, error = entry.session, entry.generation, entry.error
+            failed = entry.state == _STATE_FAILED
+        if failed and error is not None:
+            raise error
+        assert session is not None
+        try:
+            yield session
+        except (NotLogined, MycquUnauthorized):
+            self.invalidate(username, generation)
+            raise
+
+    def close(self) -> None:
+        """停止后台登录并关闭所有会话
+
+        尚未开始的登录被取消，仍在进行的登录完成时其会话会被直接关闭，正在等待登录的 :meth:`lease` 抛出 :class:`PoolClosed`。
+        """
+        with self._lock:
+            self._closed = True
+            for entry in self._entries.values():
+                self._abandon(entry, PoolClosed())
+                if entry.session is not None:
+                    entry.session.close()
+            self._entries.clear()
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _health(entry: _Entry) -> SessionHealth:
+        return SessionHealth(
+            username=entry.username,
+            state=entry.state,
+            logins=entry.logins,
+            failures=entry.failures,
+            last_login=entry.last_login,
+            last_error=None if entry.error is None else repr(entry.error)
+        )
+
+    def _abandon(self, entry: _Entry, error: BaseException) -> None:
+        # 调用时需持有 self._lock；取消尚未开始的登录并唤醒等待者，进行中的登录完成时由 _login 关闭其会话
+        if entry.future is not None:
+            entry.future.cancel()
+        if entry.state == _STATE_LOGGING_IN or entry.session is None:
+            entry.error = error
+            entry.state = _STATE_FAILED
+        entry.ready.set()
+
+    def _abandoned(self, entry: _Entry) -> bool:
+        # 调用时需持有 self._lock
+        return self._closed or self._entries.get(entry.username) is not entry
+
+    def _schedule(self, entry: _Entry) -> None:
+        # 调用时需持有 self._lock
+        if self._closed:
+            return
+        if entry.future is not None and not entry.future.done():
+            return
+        if entry.session is None:
+            entry.ready.clear()
+        entry.state = _STATE_LOGGING_IN
+        entry.future = self._executor.submit(self._login, entry)
+
+    def _login(self, entry: _Entry) -> None:
+        with self._lock:
+            if self._abandoned(entry):
+                return
+        session = self._session_factory()
+        try:
+            login(session, entry.username, entry.password, **self._login_kwargs)
+            if self._mycqu:
+                access_mycqu(session)
+        except Exception as exc:  # pylint: disable=broad-except
+            session.close()
+            with self._lock:
+                if self._abandoned(entry):
+                    return
+                entry.failures += 1
+                entry.error = exc
+                # 主动刷新失败时旧会话仍然可用
+                entry.state = _STATE_FAILED if entry.session is None else _STATE_READY
+                entry.ready.set()
+            return
+        with self._lock:
+            if self._abandoned(entry):
+                # 会话池已经关闭或帐号已被移除，不再放回
+                session.close()
+                return
+            entry.session = session
+            entry.generation += 1
+            entry.logins += 1
+            entry.last_login = time.time()
+            entry.error = None
+            entry.state = _STATE_READY
+            entry.ready.set()
+        if self._store is not None:
+            self._store.save(dump_session(session, entry.username))
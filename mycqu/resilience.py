@@ -0,0 +1,402 @@
+"""重试、退避与熔断
+
+选课、出成绩等时段学校的服务器经常过载，请求超时或返回 502/503/504。:class:`ResilientAdapter` 包装一个
+:mod:`requests` 适配器，按请求地址选用重试策略（:class:`RetryPolicy`），以带随机抖动的指数退避重试可以安全重试的请求；
+同时由 :class:`CircuitBreaker` 按主机（authserver、sso、my.cqu、card 等）统计连续失败，失败过多时熔断，
+在冷却期内对该主机的请求直接抛出 :class:`CircuitOpenError`，而不是占用线程等待整个超时。
+
+:func:`.connection.new_session` 创建的会话（包括 :func:`.connection.get_default_session`）默认已经使用了它；
+自己创建的会话（如用于登录的会话）可以用 :func:`install` 启用：
+
+>>> from requests import Session
+>>> from mycqu import auth, resilience
+>>> session = resilience.install(Session())
+>>> auth.login(session, username, password)
+
+异步接口（:mod:`.aio`）可以使用 :class:`AsyncResilientTransport` 作为 :class:`httpx.AsyncClient` 的 ``transport``，
+它与同步接口共用同一个 :class:`CircuitBreaker`。
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, ConnectTimeout, ReadTimeout
+from urllib3.exceptions import NewConnectionError
+from ._lib_wrapper.dataclass import dataclass
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+__all__ = ("RetryPolicy", "DEFAULT_POLICY", "NO_RETRY", "DEFAULT_POLICIES", "CircuitOpenError", "CircuitBreaker",
+           "get_default_breaker", "ResilientAdapter", "install")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略
+
+    第 ``n`` 次重试（从 0 开始）前等待 ``[0, min(backoff_max, backoff * 2 ** n)]`` 间均匀分布的随机时间，
+    多个客户端同时失败时不会在同一时刻一起重试。
+    """
+    retries: int = 2
+    """最多重试的次数"""
+    backoff: float = 0.5
+    """退避的基数（秒）"""
+    backoff_max: float = 8
+    """单次退避的上限（秒），也是服从 ``Retry-After`` 响应头时等待的上限"""
+    statuses: Tuple[int, ...] = (502, 503, 504)
+    """需要重试的状态码"""
+    methods: Tuple[str, ...] = ("GET", "HEAD", "OPTIONS")
+    """可以在服务器收到请求后重试的请求方法；未能建立连接的请求总是可以重试"""
+    respect_retry_after: bool = True
+    """是否服从响应中的 ``Retry-After`` 响应头"""
+
+    def delay(self, attempt: int, response: Optional[Any] = None) -> float:
+        """第 ``attempt`` 次重试（从 0 开始）前需要等待的时间
+
+        :param attempt: 重试的序号
+        :type attempt: int
+        :param response: 触发重试的响应，没有（请求出错）则为 :obj:`None`
+        :type response: Union[requests.Response, httpx.Response, None], optional
+        :return: 等待的时间（秒）
+        :rtype: float
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        if self.respect_retry_after and response is not None:
+            retry_after = _retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+DEFAULT_POLICY = RetryPolicy()
+"""默认的重试策略"""
+NO_RETRY = RetryPolicy(retries=0)
+"""不重试"""
+DEFAULT_POLICIES: Tuple[Tuple[str, RetryPolicy], ...] = (
+    # 校园卡的 synjones-auth 令牌和水电费查询（见 card.SYNJONES_AUTH_URL 和 card.FEE_DATA_URL）虽然是 POST，但只是查询，可以重试
+    ("http://card.cqu.edu.cn:8080/", RetryPolicy(methods=("GET", "HEAD", "OPTIONS", "POST"))),
+)
+"""默认的（地址前缀，重试策略），不匹配任何前缀的请求使用 :data:`DEFAULT_POLICY`
+
+登录表单、oauth code 换取认证信息等 POST 请求不能重复提交，只在未能建立连接时重试。
+"""
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _not_connected(error: BaseException) -> bool:
+    # 连接超时、连接被拒绝、域名解析失败等未能建立连接的错误，此时服务器没有收到请求
+    if isinstance(error, ConnectTimeout):
+        return True
+    seen = set()
+    cause: Optional[BaseException] = error
+    while cause is not None and id(cause) not in seen:
+        seen.add(id(cause))
+        if isinstance(cause, NewConnectionError):
+            return True
+        # requests 将 urllib3 的 MaxRetryError 作为第一个参数，其 reason 是实际的错误
+        reason = cause.args[0] if cause.args and isinstance(cause.args[0], BaseException) else None
+        reason = getattr(reason, "reason", reason)
+        if isinstance(reason, NewConnectionError):
+            return True
+        cause = cause.__cause__ or cause.__context__
+    return False
+
+
+def _select(policies: Sequence[Tuple[str, RetryPolicy]], default: RetryPolicy, url: str) -> RetryPolicy:
+    for prefix, policy in policies:
+        if url.startswith(prefix):
+            return policy
+    return default
+
+
+class CircuitOpenError(RequestsConnectionError):
+    """对某一主机的熔断尚未恢复时，对该主机的请求直接抛出
+
+    是 :class:`requests.ConnectionError` 的子类，原先捕获连接错误的代码无需修改。
+    """
+
+    def __init__(self, host: str, retry_after: float, **kwargs: Any):
+        super().__init__(f"circuit for {host} is open, retry after {retry_after:.1f}s", **kwargs)
+        self.host: str = host
+        """主机名"""
+        self.retry_after: float = retry_after
+        """距离熔断恢复（允许试探请求）的时间（秒）"""
+
+
+class CircuitBreaker:
+    """按主机熔断
+
+    对某一主机连续 ``failure_threshold`` 次请求失败（连接错误、超时或 5xx 响应）后进入打开状态，
+    ``recovery_timeout`` 秒内对它的请求直接抛出 :class:`CircuitOpenError`；之后进入半开状态，只放行一个试探请求，
+    试探成功则恢复，失败则再次打开。
+
+    :param failure_threshold: 打开前连续失败的次数，默认为 5
+    :type failure_threshold: int, optional
+    :param recovery_timeout: 打开后经过多久（秒）允许试探请求，默认为 30
+    :type recovery_timeout: float, optional
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.failure_threshold: int = failure_threshold
+        self.recovery_timeout: float = recovery_timeout
+        # 主机 -> [状态, 连续失败次数, 打开的时间]
+        self._hosts: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def before_request(self, host: str) -> None:
+        """在向 ``host`` 发出请求前调用，熔断时抛出 :class:`CircuitOpenError`
+
+        :param host: 主机名
+        :type host: str
+        :raises CircuitOpenError: 熔断尚未恢复，或半开状态下已有试探请求
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or entry[0] == STATE_CLOSED:
+                return
+            now = time.monotonic()
+            # 半开状态下的试探请求超过 recovery_timeout 仍没有结果（如抛出了其他异常）时，再放行一个
+            if now - entry[2] >= self.recovery_timeout:
+                entry[0] = STATE_HALF_OPEN
+                entry[2] = now
+                return
+            retry_after = max(0.0, entry[2] + self.recovery_timeout - now)
+        raise CircuitOpenError(host, retry_after)
+
+    def record_success(self, host: str) -> None:
+        """记录对 ``host`` 的一次成功请求
+
+        :param host: 主机名
+        :type host: str
+        """
+        if host in self._hosts:
+            with self._lock:
+                self._hosts.pop(host, None)
+
+    def record_failure(self, host: str) -> None:
+        """记录对 ``host`` 的一次失败请求
+
+        :param host: 主机名
+        :type host: str
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = [STATE_CLOSED, 0, 0.0]
+            entry[1] += 1
+            if entry[0] == STATE_HALF_OPEN or entry[1] >= self.failure_threshold:
+                entry[0] = STATE_OPEN
+                entry[2] = time.monotonic()
+
+    def state(self, host: str) -> str:
+        """获取对 ``host`` 的熔断状态
+
+        :param host: 主机名
+        :type host: str
+        :return: :obj:`"closed"`、:obj:`"open"` 或 :obj:`"half-open"`
+        :rtype: str
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                return STATE_CLOSED
+            if entry[0] == STATE_OPEN and time.monotonic() - entry[2] >= self.recovery_timeout:
+                return STATE_HALF_OPEN
+            return entry[0]
+
+    def reset(self, host: Optional[str] = None) -> None:
+        """恢复对 ``host`` 的熔断状态
+
+        :param host: 主机名，默认恢复所有主机
+        :type host: Optional[str], optional
+        """
+        with self._lock:
+            if host is None:
+                self._hosts.clear()
+            else:
+                self._hosts.pop(host, None)
+
+
+_default_breaker = CircuitBreaker()
+
+
+def get_default_breaker() -> CircuitBreaker:
+    """获取默认共用的 :class:`CircuitBreaker`
+
+    :rtype: CircuitBreaker
+    """
+    return _default_breaker
+
+
+class ResilientAdapter(BaseAdapter):
+    """为请求加上重试和熔断的 :mod:`requests` 适配器，实际的请求由被包装的适配器发出
+
+    达到重试次数或重试期间该主机被熔断时，最后一次的响应被原样返回，或最后一次的异常被抛出。
+
+    :param adapter: 被包装的适配器，默认为 :class:`requests.adapters.HTTPAdapter`
+    :type adapter: Optional[requests.adapters.BaseAdapter], optional
+    :param policies: （地址前缀，重试策略），按顺序匹配，默认为 :data:`DEFAULT_POLICIES`
+    :type policies: Sequence[Tuple[str, RetryPolicy]], optional
+    :param default: 不匹配任何前缀的请求所用的重试策略，默认为 :data:`DEFAULT_POLICY`
+    :type default: RetryPolicy, optional
+    :param breaker: 熔断器，默认为 :func:`get_default_breaker`，为 :obj:`None` 时也使用默认的熔断器
+    :type breaker: Optional[CircuitBreaker], optional
+    """
+
+    def __init__(self, adapter: Optional[BaseAdapter] = None,
+                 policies: Sequence[Tuple[str, RetryPolicy]] = DEFAULT_POLICIES,
+                 default: RetryPolicy = DEFAULT_POLICY,
+                 breaker: Optional[CircuitBreaker] = None):
+        super().__init__()
+        self.adapter: BaseAdapter = HTTPAdapter() if adapter is None else adapter
+        self.policies: Tuple[Tuple[str, RetryPolicy], ...] = tuple(policies)
+        self.default: RetryPolicy = default
+        self.breaker: CircuitBreaker = _default_breaker if breaker is None else breaker
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:  # type: ignore # pylint: disable=arguments-differ
+        policy = _select(self.policies, self.default, request.url or "")
+        host = urlsplit(request.url).hostname or ""
+        breaker = self.breaker
+        attempt = 0
+        while True:
+            breaker.before_request(host)
+            try:
+                response = self.adapter.send(request, **kwargs)
+            except (RequestsConnectionError, ReadTimeout) as error:
+                breaker.record_failure(host)
+                # 未能建立连接时服务器没有收到请求，任何方法都可以重试；重试期间熔断的，不再重试
+                if attempt >= policy.retries or breaker.state(host) == STATE_OPEN or \
+                        not (_not_connected(error) or request.method in policy.methods):
+                    raise
+                time.sleep(policy.delay(attempt))
+            else:
+                if response.status_code < 500:
+                    breaker.record_success(host)
+                    return response
+                breaker.record_failure(host)
+                if attempt >= policy.retries or breaker.state(host) == STATE_OPEN or \
+                        response.status_code not in policy.statuses or request.method not in policy.methods:
+                    return response
+                delay = policy.delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def install(session: Session, policies: Sequence[Tuple[str, RetryPolicy]] = DEFAULT_POLICIES,
+            default: RetryPolicy = DEFAULT_POLICY, breaker: Optional[CircuitBreaker] = None) -> Session:
+    """用 :class:`ResilientAdapter` 包装会话中已挂载的所有适配器，已经包装过的适配器不会被重复包装
+
+    :param session: 会话
+    :type session: Session
+    :param policies: （地址前缀，重试策略），默认为 :data:`DEFAULT_POLICIES`
+    :type policies: Sequence[Tuple[str, RetryPolicy]], optional
+    :param default: 不匹配任何前缀的请求所用的重试策略，默认为 :data:`DEFAULT_POLICY`
+    :type default: RetryPolicy, optional
+    :param breaker: 熔断器，默认为 :func:`get_default_breaker`
+    :type breaker: Optional[CircuitBreaker], optional
+    :return: 传入的会话
+    :rtype: Session
+    """
+    wrapped: Dict[int, BaseAdapter] = {}
+    for prefix, adapter in list(session.adapters.items()):
+        if isinstance(adapter, ResilientAdapter):
+            continue
+        # 同一适配器可能挂载在多个前缀上，包装后仍然共用
+        if id(adapter) not in wrapped:
+            wrapped[id(adapter)] = ResilientAdapter(adapter, policies, default, breaker)
+        session.mount(prefix, wrapped[id(adapter)])
+    return session
+
+
+if httpx is not None:
+    __all__ += ("AsyncResilientTransport",)
+
+    class AsyncResilientTransport(httpx.AsyncBaseTransport):
+        """为请求加上重试和熔断的 :class:`httpx.AsyncClient` transport，参见 :class:`ResilientAdapter`
+
+        >>> async with httpx.AsyncClient(transport=AsyncResilientTransport()) as client:
+        ...     await aio.login(client, username, password)
+
+        :param transport: 被包装的 transport，默认为 :class:`httpx.AsyncHTTPTransport`
+        :type transport: Optional[httpx.AsyncBaseTransport], optional
+        :param policies: （地址前缀，重试策略），默认为 :data:`DEFAULT_POLICIES`
+        :type policies: Sequence[Tuple[str, RetryPolicy]], optional
+        :param default: 不匹配任何前缀的请求所用的重试策略，默认为 :data:`DEFAULT_POLICY`
+        :type default: RetryPolicy, optional
+        :param breaker: 熔断器，默认为 :func:`get_default_breaker`
+        :type breaker: Optional[CircuitBreaker], optional
+        """
+
+        def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                     policies: Sequence[Tuple[str, RetryPolicy]] = DEFAULT_POLICIES,
+                     default: RetryPolicy = DEFAULT_POLICY,
+                     breaker: Optional[CircuitBreaker] = None):
+            self.transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport() if transport is None else transport
+            self.policies: Tuple[Tuple[str, RetryPolicy], ...] = tuple(policies)
+            self.default: RetryPolicy = default
+            self.breaker: CircuitBreaker = _default_breaker if breaker is None else breaker
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            policy = _select(self.policies, self.default, str(request.url))
+            host = request.url.host
+            breaker = self.breaker
+            attempt = 0
+            while True:
+                try:
+                    breaker.before_request(host)
+                except CircuitOpenError as error:
+                    raise httpx.ConnectError(str(error), request=request) from error
+                try:
+                    response = await self.transport.handle_async_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.ReadError,
+                        httpx.RemoteProtocolError) as error:
+                    breaker.record_failure(host)
+                    if attempt >= policy.retries or breaker.state(host) == STATE_OPEN or \
+                            not (isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)) or
+                                 request.method in policy.methods):
+                        raise
+                    await asyncio.sleep(policy.delay(attempt))
+                else:
+                    if response.status_code < 500:
+                        breaker.record_success(host)
+                        return response
+                    breaker.record_failure(host)
+                    if attempt >= policy.retries or breaker.state(host) == STATE_OPEN or \
+                            response.status_code not in policy.statuses or request.method not in policy.methods:
+                        return response
+                    delay = policy.delay(attempt, response)
+                    await response.aclose()
+                    await asyncio.sleep(delay)
+                attempt += 1
+
+        async def aclose(self) -> None:
+            await self.transport.aclose()
@@ -0,0 +1,460 @@
+"""按主机限速、按优先级排队的请求调度
+
+批量刷新课表、成绩和水电费时，请求数很容易超出学校服务器能承受的范围。:class:`Scheduler` 为每个主机维护一个令牌桶
+（:class:`TokenBucket`），请求在取得令牌后才会发出；令牌不足时请求排队，队列按优先级（:data:`INTERACTIVE`、
+:data:`NORMAL`、:data:`BACKGROUND`）而不是先后顺序出队，因此用户交互触发的请求可以越过后台批量任务的请求。
+
+优先级由上下文决定，在 :func:`priority` 的 ``with`` 块中发出的请求都使用该优先级；本库的 ``fetch_many`` 等在线程池中并发请求的接口
+会把调用者的优先级带到工作线程中：
+
+>>> from mycqu import scheduler
+>>> scheduler.get_default_scheduler().set_limit("card.cqu.edu.cn", rate=5, burst=10)
+>>> with scheduler.priority(scheduler.BACKGROUND):
+...     EnergyFees.fetch_many(session, True, rooms)
+>>> scheduler.get_default_scheduler().stats()["card.cqu.edu.cn"].queued
+42
+
+:func:`.connection.new_session` 创建的会话（包括 :func:`.connection.get_default_session`）默认经过 :func:`get_default_scheduler`；
+自己创建的会话可以用 :func:`install` 接入，:mod:`.aio` 使用 :class:`AsyncSchedulingTransport`。没有设置限速的主机上，
+请求只被计数，不会等待。
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+import asyncio
+import threading
+import time
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from ._lib_wrapper.dataclass import dataclass, construct
+from .instrument import _escape
+from .resilience import ResilientAdapter
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+__all__ = ("INTERACTIVE", "NORMAL", "BACKGROUND", "PRIORITY_NAMES", "priority", "current_priority",
+           "TokenBucket", "HostStats", "Scheduler", "get_default_scheduler", "SchedulingAdapter", "install")
+
+INTERACTIVE: int = 0
+"""用户交互触发的请求，最先出队"""
+NORMAL: int = 1
+"""默认的优先级"""
+BACKGROUND: int = 2
+"""后台批量任务的请求，最后出队"""
+PRIORITY_NAMES: Dict[int, str] = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+"""优先级的名称，用于导出的指标"""
+
+_priority: ContextVar[int] = ContextVar("mycqu_priority", default=NORMAL)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[int]:
+    """让 ``with`` 块中发出的请求使用优先级 ``level``
+
+    :param level: 优先级，数值越小越先出队，如 :data:`INTERACTIVE`、:data:`BACKGROUND`
+    :type level: int
+    """
+    token = _priority.set(level)
+    try:
+        yield level
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """获取当前上下文的优先级
+
+    :rtype: int
+    """
+    return _priority.get()
+
+
+class TokenBucket:
+    """令牌桶，不是线程安全的，由 :class:`Scheduler` 在锁内使用
+
+    :param rate: 每秒补充的令牌数
+    :type rate: float
+    :param burst: 桶的容量，即允许的突发请求数，默认为 ``max(1, rate)``
+    :type burst: Optional[float], optional
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate should be positive")
+        self.rate: float = rate
+        self.burst: float = max(1.0, rate) if burst is None else burst
+        self.tokens: float = self.burst
+        self.updated: float = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def take(self, now: float) -> float:
+        """尝试取出一个令牌
+
+        :param now: 当前的 :func:`time.monotonic`
+        :type now: float
+        :return: 取出成功时为 0，否则为还需等待的时间（秒）
+        :rtype: float
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def wait_time(self, now: float) -> float:
+        """距离有令牌可取还需等待的时间（秒），不取出令牌
+
+        :param now: 当前的 :func:`time.monotonic`
+        :type now: float
+        :rtype: float
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+@dataclass
+class HostStats:
+    """某一主机的调度状态快照
+    """
+    rate: Optional[float]
+    """每秒允许的请求数，不限速则为 :obj:`None`"""
+    burst: Optional[float]
+    """允许的突发请求数，不限速则为 :obj:`None`"""
+    queued: int
+    """正在排队的请求数"""
+    queued_by_priority: Dict[int, int]
+    """各个优先级正在排队的请求数"""
+    in_flight: int
+    """已经出队、尚未完成的请求数"""
+    admitted: int
+    """累计出队的请求数"""
+    wait_total: float
+    """出队的请求累计的排队时间（秒）"""
+    wait_max: float
+    """最长的排队时间（秒）"""
+
+    @property
+    def wait_avg(self) -> Optional[float]:
+        """平均排队时间（秒），没有出队的请求时为 :obj:`None`"""
+        return self.wait_total / self.admitted if self.admitted else None
+
+
+class _Host:
+    __slots__ = ("bucket", "cond", "waiting", "seq", "in_flight", "admitted", "wait_total", "wait_max")
+
+    def __init__(self, bucket: Optional[TokenBucket]):
+        self.bucket: Optional[TokenBucket] = bucket
+        self.cond = threading.Condition(threading.Lock())
+        # 排队的请求（优先级，序号），保持升序，队首先出队
+        self.waiting: List[Tuple[int, int]] = []
+        self.seq: int = 0
+        self.in_flight: int = 0
+        self.admitted: int = 0
+        self.wait_total: float = 0.0
+        self.wait_max: float = 0.0
+
+    def enqueue(self, level: int) -> Tuple[int, int]:
+        self.seq += 1
+        ticket = (level, self.seq)
+        insort(self.waiting, ticket)
+        return ticket
+
+    def cancel(self, ticket: Tuple[int, int]) -> None:
+        i = bisect_left(self.waiting, ticket)
+        if i < len(self.waiting) and self.waiting[i] == ticket:
+            del self.waiting[i]
+            self.cond.notify_all()
+
+    def poll(self, ticket: Tuple[int, int], now: float) -> Optional[float]:
+        # 出队时返回 0，是队首但没有令牌时返回需要等待的时间，不是队首时返回 None
+        if self.bucket is not None:
+            if self.waiting[0] != ticket:
+                return None
+            delay = self.bucket.take(now)
+            if delay:
+                return delay
+        self.cancel(ticket)
+        return 0.0
+
+    def admit(self, waited: float) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+
+
+class Scheduler:
+    """按主机限速、按优先级排队的调度器
+
+    :param limits: 主机名到（每秒请求数，突发请求数）的映射，突发请求数可以为 :obj:`None`，参见 :class:`TokenBucket`
+    :type limits: Optional[Mapping[str, Tuple[float, Optional[float]]]], optional
+    """
+
+    def __init__(self, limits: Optional[Mapping[str, Tuple[float, Optional[float]]]] = None):
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+        for host, (rate, burst) in (limits or {}).items():
+            self.set_limit(host, rate, burst)
+
+    def _host(self, host: str) -> _Host:
+        entry = self._hosts.get(host)
+        if entry is None:
+            with self._lock:
+                entry = self._hosts.get(host)
+                if entry is None:
+                    entry = self._hosts[host] = _Host(None)
+        return entry
+
+    def set_limit(self, host: str, rate: Optional[float], burst: Optional[float] = None) -> None:
+        """设置对 ``host`` 的限速
+
+        :param host: 主机名
+        :type host: str
+        :param rate: 每秒允许的请求数，为 :obj:`None` 时取消限速
+        :type rate: Optional[float]
+        :param burst: 允许的突发请求数，默认为 ``max(1, rate)``
+        :type burst: Optional[float], optional
+        """
+        entry = self._host(host)
+        with entry.cond:
+            entry.bucket = None if rate is None else TokenBucket(rate, burst)
+            entry.cond.notify_all()
+
+    def acquire(self, host: str, level: Optional[int] = None) -> float:
+        """排队直到可以向 ``host`` 发出请求，之后需要调用 :meth:`release`
+
+        :param host: 主机名
+        :type host: str
+        :param level: 优先级，默认为 :func:`current_priority`
+        :type level: Optional[int], optional
+        :return: 排队的时间（秒）
+        :rtype: float
+        """
+        entry = self._host(host)
+        with entry.cond:
+            if entry.bucket is None:
+                entry.admit(0.0)
+                return 0.0
+            start = time.monotonic()
+            ticket = entry.enqueue(current_priority() if level is None else level)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = entry.poll(ticket, now)
+                    if delay == 0:
+                        break
+                    entry.cond.wait(delay)
+            except BaseException:
+                entry.cancel(ticket)
+                raise
+            waited = now - start
+            entry.admit(waited)
+            return waited
+
+    async def acquire_async(self, host: str, level: Optional[int] = None) -> float:
+        """:meth:`acquire` 的异步版本，排队时不阻塞事件循环
+
+        :param host: 主机名
+        :type host: str
+        :param level: 优先级，默认为 :func:`current_priority`
+        :type level: Optional[int], optional
+        :return: 排队的时间（秒）
+        :rtype: float
+        """
+        entry = self._host(host)
+        with entry.cond:
+            if entry.bucket is None:
+                entry.admit(0.0)
+                return 0.0
+            start = time.monotonic()
+            ticket = entry.enqueue(current_priority() if level is None else level)
+        try:
+            while True:
+                with entry.cond:
+                    now = time.monotonic()
+                    delay = entry.poll(ticket, now)
+                    if delay == 0:
+                        waited = now - start
+                        entry.admit(waited)
+                        return waited
+                    if delay is None:
+                        # 不是队首，收不到 Condition 的通知，等到下一个令牌时再检查
+                        delay = max(entry.bucket.wait_time(now) if entry.bucket is not None else 0.0, 0.001)
+                await asyncio.sleep(delay)
+        except BaseException:
+            with entry.cond:
+                entry.cancel(ticket)
+            raise
+
+    def release(self, host: str) -> None:
+        """向 ``host`` 的请求完成后调用
+
+        :param host: 主机名
+        :type host: str
+        """
+        entry = self._host(host)
+        with entry.cond:
+            entry.in_flight -= 1
+
+    @contextmanager
+    def slot(self, host: str, level: Optional[int] = None) -> Iterator[float]:
+        """在 ``with`` 块中占用向 ``host`` 发出请求的机会，参见 :meth:`acquire`
+
+        :param host: 主机名
+        :type host: str
+        :param level: 优先级，默认为 :func:`current_priority`
+        :type level: Optional[int], optional
+        """
+        waited = self.acquire(host, level)
+        try:
+            yield waited
+        finally:
+            self.release(host)
+
+    def stats(self) -> Dict[str, HostStats]:
+        """获取各个主机的调度状态
+
+        :return: 主机名到调度状态的映射，按主机名排序
+        :rtype: Dict[str, HostStats]
+        """
+        with self._lock:
+            hosts = sorted(self._hosts.items())
+        result: Dict[str, HostStats] = {}
+        for host, entry in hosts:
+            with entry.cond:
+                by_priority: Dict[int, int] = {}
+                for level, _ in entry.waiting:
+                    by_priority[level] = by_priority.get(level, 0) + 1
+                bucket = entry.bucket
+                result[host] = construct(
+                    HostStats, True,
+                    rate=None if bucket is None else bucket.rate, burst=None if bucket is None else bucket.burst,
+                    queued=len(entry.waiting), queued_by_priority=by_priority, in_flight=entry.in_flight,
+                    admitted=entry.admitted, wait_total=entry.wait_total, wait_max=entry.wait_max)
+        return result
+
+    def render(self, prefix: str = "mycqu") -> str:
+        """以 Prometheus 的文本格式导出各个主机的队列长度、进行中的请求数和累计排队时间
+
+        :param prefix: 指标名的前缀，默认为 :obj:`"mycqu"`
+        :type prefix: str, optional
+        :rtype: str
+        """
+        stats = self.stats()
+        lines = [f"# TYPE {prefix}_scheduler_queued gauge"]
+        for host, host_stats in stats.items():
+            for level in sorted(set(PRIORITY_NAMES) | set(host_stats.queued_by_priority)):
+                name = PRIORITY_NAMES.get(level, str(level))
+                lines.append(f'{prefix}_scheduler_queued{{host="{_escape(host)}",priority="{_escape(name)}"}} '
+                             f'{host_stats.queued_by_priority.get(level, 0)}')
+        for metric, kind, attr in (("in_flight", "gauge", "in_flight"),
+                                   ("admitted_total", "counter", "admitted"),
+                                   ("wait_seconds_total", "counter", "wait_total")):
+            lines.append(f"# TYPE {prefix}_scheduler_{metric} {kind}")
+            for host, host_stats in stats.items():
+                lines.append(f'{prefix}_scheduler_{metric}{{host="{_escape(host)}"}} {getattr(host_stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+
+_default_scheduler = Scheduler()
+
+
+def get_default_scheduler() -> Scheduler:
+    """获取默认共用的 :class:`Scheduler`，初始时不对任何主机限速
+
+    :rtype: Scheduler
+    """
+    return _default_scheduler
+
+
+class SchedulingAdapter(BaseAdapter):
+    """经过 :class:`Scheduler` 排队后再发出请求的 :mod:`requests` 适配器，实际的请求由被包装的适配器发出
+
+    :param adapter: 被包装的适配器，默认为 :class:`requests.adapters.HTTPAdapter`
+    :type adapter: Optional[requests.adapters.BaseAdapter], optional
+    :param scheduler: 调度器，默认为 :func:`get_default_scheduler`
+    :type scheduler: Optional[Scheduler], optional
+    """
+
+    def __init__(self, adapter: Optional[BaseAdapter] = None, scheduler: Optional[Scheduler] = None):
+        super().__init__()
+        self.adapter: BaseAdapter = HTTPAdapter() if adapter is None else adapter
+        self.scheduler: Scheduler = _default_scheduler if scheduler is None else scheduler
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:  # type: ignore # pylint: disable=arguments-differ
+        with self.scheduler.slot(urlsplit(request.url).hostname or ""):
+            return self.adapter.send(request, **kwargs)
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def install(session: Session, scheduler: Optional[Scheduler] = None) -> Session:
+    """用 :class:`SchedulingAdapter` 包装会话中已挂载的所有适配器
+
+    :class:`.resilience.ResilientAdapter` 包装的适配器会在其内部包装，使得熔断时直接失败而不排队，每次重试则各自排队。
+
+    :param session: 会话
+    :type session: Session
+    :param scheduler: 调度器，默认为 :func:`get_default_scheduler`
+    :type scheduler: Optional[Scheduler], optional
+    :return: 传入的会话
+    :rtype: Session
+    """
+    seen = set()
+    for prefix, adapter in list(session.adapters.items()):
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        if isinstance(adapter, ResilientAdapter):
+            if not isinstance(adapter.adapter, SchedulingAdapter):
+                adapter.adapter = SchedulingAdapter(adapter.adapter, scheduler)
+        elif not isinstance(adapter, SchedulingAdapter):
+            wrapped = SchedulingAdapter(adapter, scheduler)
+            for other, mounted in list(session.adapters.items()):
+                if mounted is adapter:
+                    session.mount(other, wrapped)
+            seen.add(id(wrapped))
+    return session
+
+
+if httpx is not None:
+    __all__ += ("AsyncSchedulingTransport",)
+
+    class AsyncSchedulingTransport(httpx.AsyncBaseTransport):
+        """经过 :class:`Scheduler` 排队后再发出请求的 :class:`httpx.AsyncClient` transport，与同步接口共用调度器
+
+        与 :class:`.resilience.AsyncResilientTransport` 同时使用时，应由后者包装前者。
+
+        :param transport: 被包装的 transport，默认为 :class:`httpx.AsyncHTTPTransport`
+        :type transport: Optional[httpx.AsyncBaseTransport], optional
+        :param scheduler: 调度器，默认为 :func:`get_default_scheduler`
+        :type scheduler: Optional[Scheduler], optional
+        """
+
+        def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                     scheduler: Optional[Scheduler] = None):
+            self.transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport() if transport is None else transport
+            self.scheduler: Scheduler = _default_scheduler if scheduler is None else scheduler
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            host = request.url.host
+            await self.scheduler.acquire_async(host)
+            try:
+                return await self.transport.handle_async_request(request)
+            finally:
+                self.scheduler.release(host)
+
+        async def aclose(self) -> None:
+            await self.transport.aclose()
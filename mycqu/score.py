@@ -3,14 +3,23 @@
 """
 from __future__ import annotations
 import json
-from typing import Dict, Any, Union, Optional, List
+from typing import Dict, Any, Union, Optional, List, Tuple
 import requests
 from requests import Session
-from ._lib_wrapper.dataclass import dataclass
+from ._lib_wrapper.dataclass import dataclass, construct
 from .course import Course, CQUSession
+from .connection import get_default_session
+from .instrument import report, parsing
 from .mycqu import MycquUnauthorized
 
-__all__ = ("Score", "GpaRanking")
+__all__ = ("Score", "GpaRanking", "ScoreDiff", "ScoreTracker")
+
+SCORE_URL = 'https://my.cqu.edu.cn/api/sam/score/student/score'
+GPA_RANKING_URL = 'https://my.cqu.edu.cn/api/sam/score/student/studentGpaRanking'
+SCORE_HEADERS = {
+    'Referer': 'https://my.cqu.edu.cn/sam/home',
+    'User-Agent': 'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.0; Trident/4.0)',
+}
 
 
 class CQUWebsiteError(Exception):
@@ -18,27 +27,25 @@ class CQUWebsiteError(Exception):
         super().__init__('CQU website return error: ' + error_msg)
 
 
-def get_score_raw(auth: Union[Session, str]):
+def get_score_raw(auth: Union[Session, str], http: Optional[Session] = None):
     """
     获取学生原始成绩
     :param auth: 登陆后获取的authorization或者调用过mycqu.access_mycqu的session
     :type auth: Union[Session, str]
+    :param http: ``auth`` 为 authorization 时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+    :type http: Optional[Session], optional
     :return: 反序列化获取的score列表
     :rtype: Dict
     """
     if isinstance(auth, requests.Session):
-        res = auth.get('https://my.cqu.edu.cn/api/sam/score/student/score')
+        res = auth.get(SCORE_URL)
     else:
-        authorization = auth
-        headers = {
-            'Referer': 'https://my.cqu.edu.cn/sam/home',
-            'User-Agent': 'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.0; Trident/4.0)',
-            'Authorization': authorization
-        }
-        res = requests.get(
-            'https://my.cqu.edu.cn/api/sam/score/student/score', headers=headers)
+        headers = {**SCORE_HEADERS, 'Authorization': auth}
+        res = (http or get_default_session()).get(SCORE_URL, headers=headers)
+    report("score.fetch", res)
 
-    content = json.loads(res.content)
+    with parsing("score.decode"):
+        content = json.loads(res.content)
     if content['status'] == 'error':
         raise CQUWebsiteError(content['msg'])
     if res.status_code == 401:
@@ -46,26 +53,23 @@ def get_score_raw(auth: Union[Session, str]):
     return content['data']
 
 
-def get_gpa_ranking_raw(auth: Union[Session, str]):
+def get_gpa_ranking_raw(auth: Union[Session, str], http: Optional[Session] = None):
     """
     获取学生绩点排名
 
     :param auth: 登陆后获取的authorization或者调用过mycqu.access_mycqu的session
     :type auth: Union[Session, str]
+    :param http: ``auth`` 为 authorization 时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+    :type http: Optional[Session], optional
     :return: 反序列化获取的绩点、排名
     :rtype: Dict
     """
     if isinstance(auth, requests.Session):
-        res = auth.get('https://my.cqu.edu.cn/api/sam/score/student/studentGpaRanking')
+        res = auth.get(GPA_RANKING_URL)
     else:
-        authorization = auth
-        headers = {
-            'Referer': 'https://my.cqu.edu.cn/sam/home',
-            'User-Agent': 'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.0; Trident/4.0)',
-            'Authorization': authorization
-        }
-        res = requests.get(
-            'https://my.cqu.edu.cn/api/sam/score/student/studentGpaRanking', headers=headers)
+        headers = {**SCORE_HEADERS, 'Authorization': auth}
+        res = (http or get_default_session()).get(GPA_RANKING_URL, headers=headers)
+    report("score.gpa_ranking", res)
 
     content = json.loads(res.content)
     if content['status'] == 'error':
@@ -92,38 +96,46 @@ class Score:
     """必修/选修"""
 
     @staticmethod
-    def from_dict(data: Dict[str, Any]) -> Score:
+    def from_dict(data: Dict[str, Any], trusted: bool = False) -> Score:
         """
         从反序列化的字典生成Score对象
 
         @param: data
         @type: dict
+        @param: trusted 是否信任输入数据而跳过 pydantic 校验以加快构建，此时各字段的值需已是声明的类型
+        @type: bool
         @return: 返回成绩对象
         @rtype: Score
         """
-        return Score(
+        return construct(
+            Score, trusted,
             session=CQUSession.from_str(data["sessionName"]),
-            course=Course.from_dict(data),
+            course=Course.from_dict(data, trusted=trusted),
             score=data['effectiveScoreShow'],
             study_nature=data['studyNature'],
             course_nature=data['courseNature']
         )
 
     @staticmethod
-    def fetch(auth: Union[str, Session]) -> List[Score]:
+    def fetch(auth: Union[str, Session], trusted: bool = False, http: Optional[Session] = None) -> List[Score]:
         """
         从网站获取成绩信息
         :param auth: 登陆后获取的 authorization 或者调用过 :func:`.mycqu.access_mycqu` 的 Session
         :type auth: Union[Session, str]
+        :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`from_dict`
+        :type trusted: bool, optional
+        :param http: ``auth`` 为 authorization 时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+        :type http: Optional[Session], optional
         :return: 返回成绩对象
         :rtype: List[Score]
         :raises CQUWebsiteError: 查询时教务网报错
         """
-        temp = get_score_raw(auth)
+        temp = get_score_raw(auth, http)
         score = []
-        for courses in temp.values():
-            for course in courses['stuScoreHomePgVoS']:
-                score.append(Score.from_dict(course))
+        with parsing("score.from_dict"):
+            for courses in temp.values():
+                for course in courses['stuScoreHomePgVoS']:
+                    score.append(Score.from_dict(course, trusted))
         return score
 
 
@@ -159,14 +171,123 @@ class GpaRanking:
         )
 
     @staticmethod
-    def fetch(auth: Union[str, Session]) -> GpaRanking:
+    def fetch(auth: Union[str, Session], http: Optional[Session] = None) -> GpaRanking:
         """
         从网站获取绩点排名信息
 
         :param auth: 登陆后获取的 authorization 或者调用过 :func:`.mycqu.access_mycqu` 的 Session
         :type auth: Union[Session, str]
+        :param http: ``auth`` 为 authorization 时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+        :type http: Optional[Session], optional
         :return: 返回绩点排名对象
         :rtype: GpaRanking
         :raises CQUWebsiteError: 查询时教务网报错
         """
-        return GpaRanking.from_dict(get_gpa_ranking_raw(auth))
+        return GpaRanking.from_dict(get_gpa_ranking_raw(auth, http))
+
+
+@dataclass
+class ScoreDiff:
+    """
+    两次获取成绩之间的变化
+    """
+    added: List[Score]
+    """新出现的成绩"""
+    changed: List[Tuple[Score, Score]]
+    """发生变化的成绩，每个元素为（原成绩，新成绩）"""
+    removed: List[Score]
+    """消失的成绩"""
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def _fingerprint(block: Dict[str, Any]) -> int:
+    rows = block['stuScoreHomePgVoS']
+    try:
+        return hash(tuple([tuple(row.items()) for row in rows]))
+    except TypeError:  # 含有列表、字典等不可哈希的值
+        return hash(json.dumps(rows, sort_keys=True, ensure_ascii=False))
+
+
+def _keyed(scores: List[Score]) -> Dict[Tuple[str, str, int], Score]:
+    # 同一学期同一课程可能有多条（如初修和重修），以出现的次序区分
+    keyed: Dict[Tuple[str, str, int], Score] = {}
+    for score in scores:
+        nth = 0
+        while (score.course.code, score.study_nature, nth) in keyed:
+            nth += 1
+        keyed[(score.course.code, score.study_nature, nth)] = score
+    return keyed
+
+
+class ScoreTracker:
+    """
+    增量地跟踪一名学生的成绩
+
+    对 :func:`get_score_raw` 返回的每个学期的 ``stuScoreHomePgVoS`` 计算指纹，只有指纹变化了的学期才被解析为
+    :class:`Score` 对象并与上次的结果比较。第一次更新时所有成绩都视为新出现的成绩。
+
+    >>> tracker = ScoreTracker()
+    >>> tracker.poll(session)  # 第一次，所有成绩都在 added 中
+    >>> diff = tracker.poll(session)
+    >>> for score in diff.added:
+    ...     notify(score)
+
+    :param trusted: 是否跳过 pydantic 校验以加快构建，参见 :meth:`Score.from_dict`，默认为 :obj:`False`
+    :type trusted: bool, optional
+    """
+
+    def __init__(self, trusted: bool = False):
+        self.trusted: bool = trusted
+        self._fingerprints: Dict[str, int] = {}
+        self._scores: Dict[str, Dict[Tuple[str, str, int], Score]] = {}
+
+    @property
+    def scores(self) -> List[Score]:
+        """当前已知的全部成绩"""
+        return [score for scores in self._scores.values() for score in scores.values()]
+
+    def update(self, data: Dict[str, Any]) -> ScoreDiff:
+        """用 :func:`get_score_raw` 返回的数据更新，返回与上次相比的变化
+
+        :param data: :func:`get_score_raw` 返回的数据
+        :type data: Dict[str, Any]
+        :return: 成绩的变化
+        :rtype: ScoreDiff
+        """
+        added: List[Score] = []
+        changed: List[Tuple[Score, Score]] = []
+        removed: List[Score] = []
+        for session_name in [name for name in self._scores if name not in data]:
+            removed.extend(self._scores.pop(session_name).values())
+            del self._fingerprints[session_name]
+        for session_name, block in data.items():
+            fingerprint = _fingerprint(block)
+            if self._fingerprints.get(session_name) == fingerprint:
+                continue
+            with parsing("score.from_dict"):
+                new = _keyed([Score.from_dict(course, self.trusted) for course in block['stuScoreHomePgVoS']])
+            old = self._scores.get(session_name, {})
+            for key, score in new.items():
+                if key not in old:
+                    added.append(score)
+                elif old[key] != score:
+                    changed.append((old[key], score))
+            removed.extend(score for key, score in old.items() if key not in new)
+            self._scores[session_name] = new
+            self._fingerprints[session_name] = fingerprint
+        return construct(ScoreDiff, True, added=added, changed=changed, removed=removed)
+
+    def poll(self, auth: Union[str, Session], http: Optional[Session] = None) -> ScoreDiff:
+        """获取成绩并更新，返回与上次相比的变化
+
+        :param auth: 登陆后获取的 authorization 或者调用过 :func:`.mycqu.access_mycqu` 的 Session
+        :type auth: Union[Session, str]
+        :param http: ``auth`` 为 authorization 时用于发出请求的会话，默认为 :func:`.connection.get_default_session`
+        :type http: Optional[Session], optional
+        :return: 成绩的变化
+        :rtype: ScoreDiff
+        :raises CQUWebsiteError: 查询时教务网报错
+        """
+        return self.update(get_score_raw(auth, http))
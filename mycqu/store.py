@@ -0,0 +1,260 @@
+"""登录状态的持久化存储，使进程重启后无需重新登录
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+import dataclasses
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from requests import Session
+from requests.cookies import create_cookie
+from ._lib_wrapper.dataclass import dataclass
+from .mycqu import MycquToken, get_cached_token, set_cached_token, _install_refresh_hook
+
+__all__ = ("StoredCookie", "StoredSession", "SessionStore", "FileSessionStore", "SQLiteSessionStore",
+           "dump_session", "restore_session")
+
+
+@dataclass
+class StoredCookie:
+    """保存的一个 cookie
+    """
+    name: str
+    """名称"""
+    value: Optional[str]
+    """值"""
+    domain: str
+    """域名"""
+    path: str
+    """路径"""
+    secure: bool
+    """是否只在 https 中发送"""
+    expires: Optional[int]
+    """过期时间戳，会话 cookie 为 :obj:`None`"""
+
+
+@dataclass
+class StoredSession:
+    """保存的一个帐号的登录状态，包括统一身份认证（含 ``keep_longer`` 的 rememberMe）的 cookies 和 mycqu 的认证信息
+    """
+    username: str
+    """帐号"""
+    cookies: List[StoredCookie]
+    """会话中的 cookies"""
+    authorization: Optional[str]
+    """mycqu 认证信息（:func:`.mycqu.access_mycqu` 写入请求头的 ``Authorization``），没有则为 :obj:`None`"""
+    token_expires_at: Optional[float]
+    """mycqu 认证信息的过期时间戳，未知则为 :obj:`None`"""
+    saved_at: float
+    """保存时的时间戳"""
+
+    def is_fresh(self, max_age: Optional[float] = None, now: Optional[float] = None) -> bool:
+        """判断保存的登录状态是否仍可能有效
+
+        :param max_age: 保存后最多经过多少秒仍视为有效，默认为 :obj:`None` 即不限制
+        :type max_age: Optional[float], optional
+        :param now: 当前时间戳，默认为 :func:`time.time`
+        :type now: Optional[float], optional
+        :return: mycqu 认证信息未过期、保存时间未超过 ``max_age`` 且存在未过期的 cookie 时为 :obj:`True`
+        :rtype: bool
+        """
+        now = time.time() if now is None else now
+        if self.token_expires_at is not None and self.token_expires_at <= now:
+            return False
+        if max_age is not None and self.saved_at + max_age <= now:
+            return False
+        return any(cookie.expires is None or cookie.expires > now for cookie in self.cookies)
+
+    def to_json(self) -> str:
+        """序列化为 json 字符串
+
+        :rtype: str
+        """
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False)
+
+    @staticmethod
+    def from_json(string: str) -> StoredSession:
+        """从 :meth:`to_json` 得到的字符串中恢复
+
+        :param string: json 字符串
+        :type string: str
+        :rtype: StoredSession
+        """
+        return StoredSession(**json.loads(string))
+
+
+def dump_session(session: Session, username: str, token_expires_at: Optional[float] = None) -> StoredSession:
+    """导出会话的登录状态
+
+    :param session: 登录了统一身份认证的会话
+    :type session: Session
+    :param username: 帐号
+    :type username: str
+    :param token_expires_at: mycqu 认证信息的过期时间戳，默认为 :obj:`None` 即使用 :func:`.mycqu.access_mycqu` 缓存的过期时间
+    :type token_expires_at: Optional[float], optional
+    :rtype: StoredSession
+    """
+    authorization = session.headers.get("Authorization")
+    token = get_cached_token(session)
+    if token_expires_at is None and token is not None and token.authorization == authorization:
+        token_expires_at = token.expires_at
+    return StoredSession(
+        username=username,
+        cookies=[StoredCookie(name=cookie.name,
+                              value=cookie.value,
+                              domain=cookie.domain,
+                              path=cookie.path,
+                              secure=cookie.secure,
+                              expires=cookie.expires)
+                 for cookie in session.cookies],
+        authorization=authorization if isinstance(authorization, str) else None,
+        token_expires_at=token_expires_at if authorization else None,
+        saved_at=time.time()
+    )
+
+
+def restore_session(stored: StoredSession, session: Optional[Session] = None,
+                    auto_refresh: bool = True) -> Session:
+    """将保存的登录状态恢复到会话中，已过期的 cookie 会被丢弃，mycqu 认证信息会作为 :func:`.mycqu.access_mycqu` 的缓存
+
+    :param stored: 保存的登录状态
+    :type stored: StoredSession
+    :param session: 要恢复到的会话，默认为 :obj:`None` 即新建一个会话
+    :type session: Optional[Session], optional
+    :param auto_refresh: 恢复了 mycqu 认证信息时，是否在 my.cqu.edu.cn 的 api 返回 401 时自动重新认证并重试一次，
+                         参见 :func:`.mycqu.access_mycqu`，默认为 :obj:`True`
+    :type auto_refresh: bool, optional
+    :return: 恢复了登录状态的会话
+    :rtype: Session
+    """
+    session = Session() if session is None else session
+    now = time.time()
+    for cookie in stored.cookies:
+        if cookie.expires is not None and cookie.expires <= now:
+            continue
+        session.cookies.set_cookie(create_cookie(cookie.name, cookie.value,
+                                                 domain=cookie.domain,
+                                                 path=cookie.path,
+                                                 secure=cookie.secure,
+                                                 expires=cookie.expires))
+    if stored.authorization:
+        session.headers["Authorization"] = stored.authorization
+        set_cached_token(session, MycquToken(authorization=stored.authorization,
+                                             expires_at=stored.token_expires_at))
+        if auto_refresh:
+            _install_refresh_hook(session)
+    return session
+
+
+class SessionStore:
+    """登录状态存储的接口，自定义存储需实现 :meth:`load`、:meth:`load_all`、:meth:`save` 和 :meth:`delete`
+    """
+
+    def load(self, username: str) -> Optional[StoredSession]:
+        """读取某一帐号的登录状态，不存在则返回 :obj:`None`"""
+        raise NotImplementedError
+
+    def load_all(self) -> Dict[str, StoredSession]:
+        """读取所有帐号的登录状态"""
+        raise NotImplementedError
+
+    def save(self, stored: StoredSession) -> None:
+        """保存某一帐号的登录状态，覆盖已有的记录"""
+        raise NotImplementedError
+
+    def delete(self, username: str) -> None:
+        """删除某一帐号的登录状态"""
+        raise NotImplementedError
+
+
+class FileSessionStore(SessionStore):
+    """以单个 json 文件保存登录状态，读写时整体加载到内存中，适合帐号数量不多的情形
+
+    文件以原子替换的方式写入，权限为 ``0600``。
+
+    :param path: 文件路径
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self._path: str = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, StoredSession] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self._data = {username: StoredSession(**data)
+                              for username, data in json.load(file).items()}
+
+    def load(self, username: str) -> Optional[StoredSession]:
+        return self._data.get(username)
+
+    def load_all(self) -> Dict[str, StoredSession]:
+        return dict(self._data)
+
+    def save(self, stored: StoredSession) -> None:
+        with self._lock:
+            self._data[stored.username] = stored
+            self._flush()
+
+    def delete(self, username: str) -> None:
+        with self._lock:
+            if self._data.pop(username, None) is not None:
+                self._flush()
+
+    def _flush(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mycqu-sessions-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump({username: dataclasses.asdict(stored)
+                           for username, stored in self._data.items()},
+                          file, ensure_ascii=False)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class SQLiteSessionStore(SessionStore):
+    """以 SQLite 数据库保存登录状态，适合大量帐号的情形
+
+    :param path: 数据库文件路径
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS mycqu_sessions "
+                               "(username TEXT PRIMARY KEY, data TEXT NOT NULL, saved_at REAL NOT NULL)")
+
+    def load(self, username: str) -> Optional[StoredSession]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM mycqu_sessions WHERE username = ?",
+                                     (username,)).fetchone()
+        return None if row is None else StoredSession.from_json(row[0])
+
+    def load_all(self) -> Dict[str, StoredSession]:
+        with self._lock:
+            rows = self._conn.execute("SELECT username, data FROM mycqu_sessions").fetchall()
+        return {username: StoredSession.from_json(data) for username, data in rows}
+
+    def save(self, stored: StoredSession) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO mycqu_sessions (username, data, saved_at) "
+                               "VALUES (?, ?, ?)",
+                               (stored.username, stored.to_json(), stored.saved_at))
+
+    def delete(self, username: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM mycqu_sessions WHERE username = ?", (username,))
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
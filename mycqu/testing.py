@@ -0,0 +1,808 @@
+"""用于离线测试的本地替身服务器
+
+:class:`FakeCQUServer` 在本机启动一个 HTTP 服务器，模拟本库实际访问的各个流程：统一身份认证的登录页（含盐和
+``lt``/``execution``）、``needCaptcha.html`` 和验证码、单处登录冲突，:func:`.auth.access_sso_service` 处理的 SSO
+``adapter`` 页面，my.cqu.edu.cn 的 OAuth 认证和课表、考表、成绩等 api，以及校园卡查询水电费的 ticket 链。
+返回的数据是根据学工号确定性生成的虚构数据。
+
+通过 :meth:`FakeCQUServer.mount` 把重大各个域名的请求转发给该服务器，此后本库的接口可以原样调用：
+
+>>> from requests import Session
+>>> from mycqu import auth, mycqu, course
+>>> with FakeCQUServer(users={"20180001": "password"}, latency=0.05) as server:
+...     session = Session()
+...     server.mount(session)
+...     auth.login(session, "20180001", "password")
+...     mycqu.access_mycqu(session)
+...     course.CourseTimetable.fetch(session, "20180001")
+
+异步接口（:mod:`.aio`）可以使用 :meth:`FakeCQUServer.async_transport` 作为 :class:`httpx.AsyncClient` 的 ``transport``。
+不接受会话参数、直接使用 :mod:`requests` 模块级函数发出的请求（如 :meth:`.exam.Exam.fetch`）不会被转发。
+"""
+from __future__ import annotations
+from typing import Any, Callable, Collection, Counter, Dict, List, Mapping, Optional, Tuple, Union
+import collections
+import hashlib
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from base64 import b64decode
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit, urlunsplit
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar, extract_cookies_to_jar
+from ._lib_wrapper.encrypt import aes_ecb_decryptor
+from .auth import AUTHSERVER_URL, SSO_LOGIN_URL
+from .card import HALL_TICKET_URL, TICKET_URL, SYNJONES_AUTH_URL, FEE_DATA_URL
+from .course import CQUSession, CUR_SESSION_URL, ALL_SESSIONSINFO_URL, CQUSESSIONS_URL, TIMETABLE_URL
+from .exam import EXAM_LIST_URL
+from .mycqu import MYCQU_AUTHORIZE_URL, MYCQU_TOKEN_URL, MYCQU_SERVICE_URL
+from .score import SCORE_URL, GPA_RANKING_URL
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+__all__ = ("FakeCQUServer", "FakeServerAdapter")
+
+HOSTNAMES = ("authserver.cqu.edu.cn", "sso.cqu.edu.cn", "my.cqu.edu.cn", "card.cqu.edu.cn")
+SSO_CALLBACK_URL = "https://sso.cqu.edu.cn/callback?client_name=adapter"
+AUTHSERVER_INDEX_URL = "http://authserver.cqu.edu.cn/authserver/index.do"
+CARD_PRELOGIN_URL = "http://card.cqu.edu.cn:7280/ias/prelogin"
+EXAM_KEY = b"cquisse123456789"
+
+_COURSE_NAMES = ("高等数学", "大学物理", "线性代数", "数据结构", "大学英语", "程序设计", "概率论", "体育")
+_DEPTS = ("数学与统计学院", "物理学院", "计算机学院", "外国语学院", "体育学院")
+_WEEKDAYS = "一二三四五六日"
+_GRADES = ("优", "良", "中", "及格", "不及格", "合格")
+
+_LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>统一身份认证</title>
+<script type="text/javascript">var pwdDefaultEncryptSalt = "{salt}";</script>
+</head><body>
+<form id="casLoginForm" method="post" action="/authserver/login">
+<input id="username" name="username" value="">
+<input id="password" name="password" type="password" value="">
+<input type="hidden" name="lt" value="{lt}"/>
+<input type="hidden" name="dllt" value="userNamePasswordLogin"/>
+<input type="hidden" name="execution" value="{execution}"/>
+<input type="hidden" name="_eventId" value="submit"/>
+<input type="hidden" name="rmShown" value="1">
+{error}</form></body></html>"""
+_LOGIN_ERROR = '<span id="msg" class="login_auth_error">{message}</span>\n'
+_KICK_PAGE = """<!DOCTYPE html>
+<html><body><table class="kick_table"><tr><td>已在其他地方登录</td></tr></table>
+<form method="post" id="continue"><input type="hidden" name="execution" value="{kick}"/></form>
+<form method="post" id="cancel"><input type="hidden" name="execution" value="{cancel}"/></form>
+</body></html>"""
+_SSO_ADAPTER_PAGE = '<!DOCTYPE html>\n<html><body><div class="code">adapter</div></body></html>'
+_CARD_PRELOGIN_PAGE = ('<!DOCTYPE html>\n<html><body><form method="post" action="/cassyno/index">'
+                       '<input type="hidden" name="ssoticketid" value="{ticket}"/></form></body></html>')
+_CARD_TICKET_PAGE = ("<html><script>window.location.href="
+                     "'http://card.cqu.edu.cn:8080/blade-auth/token/thirdToToken/fwdt?ticket={ticket}'"
+                     "</script></html>")
+
+
+def _split(url: str) -> Tuple[str, str]:
+    parts = urlsplit(url)
+    return parts.hostname or "", parts.path
+
+
+def _unpad(data: bytes) -> bytes:
+    return data[:-data[-1]] if data and 0 < data[-1] <= 16 else data
+
+
+def _add_query(url: str, key: str, value: str) -> str:
+    return f"{url}{'&' if '?' in url else '?'}{key}={quote(value)}"
+
+
+class _Reply:
+    def __init__(self, status: int = 200, body: Union[str, bytes] = b"",
+                 content_type: str = "text/html;charset=UTF-8"):
+        self.status: int = status
+        self.body: bytes = body.encode() if isinstance(body, str) else body
+        self.headers: List[Tuple[str, str]] = [("Content-Type", content_type)]
+
+    @staticmethod
+    def json(data: Any, status: int = 200) -> _Reply:
+        return _Reply(status, json.dumps(data, ensure_ascii=False), "application/json;charset=UTF-8")
+
+    @staticmethod
+    def redirect(location: str) -> _Reply:
+        reply = _Reply(302)
+        reply.headers.append(("Location", location))
+        return reply
+
+    def set_cookie(self, name: str, value: str, path: str = "/") -> _Reply:
+        if value:
+            self.headers.append(("Set-Cookie", f"{name}={value}; Path={path}; HttpOnly"))
+        else:
+            self.headers.append(("Set-Cookie", f"{name}=; Path={path}; Max-Age=0"))
+        return self
+
+
+class _Exchange:
+    def __init__(self, handler: BaseHTTPRequestHandler, method: str):
+        parts = urlsplit(handler.path)
+        self.method: str = method
+        self.host: str = (handler.headers.get("Host") or "").split(":")[0]
+        self.path: str = parts.path
+        self.query: Dict[str, str] = {key: values[0] for key, values in
+                                      parse_qs(parts.query, keep_blank_values=True).items()}
+        self.headers = handler.headers
+        length = int(handler.headers.get("Content-Length") or 0)
+        self.body: bytes = handler.rfile.read(length) if length else b""
+        self.cookies: Dict[str, str] = {}
+        for cookie_header in handler.headers.get_all("Cookie") or ():
+            for item in cookie_header.split(";"):
+                name, _, value = item.strip().partition("=")
+                if name:
+                    self.cookies[name] = value.strip('"')
+
+    @property
+    def form(self) -> Dict[str, str]:
+        return {key: values[0] for key, values in
+                parse_qs(self.body.decode(), keep_blank_values=True).items()}
+
+    @property
+    def bearer(self) -> Optional[str]:
+        authorization = self.headers.get("Authorization") or ""
+        return authorization[7:] if authorization.startswith("Bearer ") else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _HTTPServer
+
+    def _handle(self, method: str):
+        reply = self.server.fake._dispatch(_Exchange(self, method))  # pylint: disable=protected-access
+        self.send_response(reply.status)
+        for key, value in reply.headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(reply.body)))
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(reply.body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._handle("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._handle("POST")
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], fake: FakeCQUServer):
+        super().__init__(address, _Handler)
+        self.fake: FakeCQUServer = fake
+
+    def handle_error(self, request, client_address):
+        # 客户端提前关闭连接（如重试前关闭了响应）不是服务器的错误
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServerAdapter(HTTPAdapter):
+    """将请求转发到 :class:`FakeCQUServer` 的 requests 适配器
+
+    请求被改写到本地服务器的地址，原本的域名放在 ``Host`` 请求头中；
+    返回的响应的 ``url``、``request`` 和 cookies 仍然对应原本的请求，因此重定向和 cookies 的处理与访问真实服务器时一致。
+
+    :param address: 本地服务器的地址和端口
+    :type address: Tuple[str, int]
+    """
+
+    def __init__(self, address: Tuple[str, int], **kwargs):
+        super().__init__(**kwargs)
+        self.address: Tuple[str, int] = address
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        parts = urlsplit(request.url)
+        local = request.copy()
+        local.url = urlunsplit(("http", "%s:%d" % self.address, parts.path or "/", parts.query, ""))
+        local.headers["Host"] = parts.netloc
+        kwargs["proxies"] = {}
+        response = super().send(local, **kwargs)
+        response.url = request.url
+        response.request = request
+        response.cookies = RequestsCookieJar()
+        extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+
+class FakeCQUServer:
+    """模拟重大各个系统的本地替身服务器，可以作为上下文管理器使用，进入时启动、退出时关闭
+
+    :param users: 允许登录的统一身份认证号及其密码，默认（:obj:`None`）接受任意用户名和密码
+    :type users: Optional[Mapping[str, str]], optional
+    :param need_captcha: 登录时是否需要验证码，默认为 :obj:`False`
+    :type need_captcha: bool, optional
+    :param captcha: 验证码的答案（验证码图片的内容也会包含它），默认为 :obj:`"abcd"`
+    :type captcha: str, optional
+    :param single_login: 启用了“单处登录”的用户，这些用户已经登录时再次登录会遇到 :class:`.auth.MultiSessionConflict`
+    :type single_login: Collection[str], optional
+    :param token_expires_in: 签发的 mycqu 认证信息的有效期（秒），默认为 7200
+    :type token_expires_in: int, optional
+    :param latency: 每个请求的额外延迟（秒），为二元组时在该范围内均匀随机，默认为 0
+    :type latency: Union[float, Tuple[float, float]], optional
+    :param error_rate: 每个请求直接返回 ``error_status`` 的概率，默认为 0
+    :type error_rate: float, optional
+    :param error_status: 注入的错误的状态码，默认为 503
+    :type error_status: int, optional
+    :param exam_page_size: 考表每页的考试数，默认不分页
+    :type exam_page_size: Optional[int], optional
+    :param today: 用于确定当前学期的日期，默认为运行时的日期
+    :type today: Optional[date], optional
+    :param seed: 延迟和错误注入所用随机数的种子
+    :type seed: Optional[int], optional
+    :param host: 监听的地址，默认为 :obj:`"127.0.0.1"`
+    :type host: str, optional
+    :param port: 监听的端口，默认为 0 即任意空闲端口
+    :type port: int, optional
+    """
+
+    def __init__(self,
+                 users: Optional[Mapping[str, str]] = None,
+                 need_captcha: bool = False,
+                 captcha: str = "abcd",
+                 single_login: Collection[str] = (),
+                 token_expires_in: int = 7200,
+                 latency: Union[float, Tuple[float, float]] = 0,
+                 error_rate: float = 0,
+                 error_status: int = 503,
+                 exam_page_size: Optional[int] = None,
+                 today: Optional[date] = None,
+                 seed: Optional[int] = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0):
+        self.users: Optional[Dict[str, str]] = None if users is None else dict(users)
+        self.need_captcha: bool = need_captcha
+        self.captcha: str = captcha
+        self.single_login: set = set(single_login)
+        self.token_expires_in: int = token_expires_in
+        self.latency: Union[float, Tuple[float, float]] = latency
+        self.error_rate: float = error_rate
+        self.error_status: int = error_status
+        self.exam_page_size: Optional[int] = exam_page_size
+        self.today: Optional[date] = today
+        self.hits: Counter[str] = collections.Counter()
+        """各个地址（不含参数）收到的请求数"""
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._injected: List[Tuple[int, int, Optional[str]]] = []
+        self._flows: Dict[str, Dict[str, Any]] = {}
+        self._tgts: Dict[str, str] = {}
+        self._kicks: Dict[str, Tuple[str, str, bool]] = {}
+        self._tickets: Dict[str, Tuple[str, str]] = {}
+        self._sso_pending: Dict[str, str] = {}
+        self._sso_tgcs: Dict[str, str] = {}
+        self._mycqu_sessions: Dict[str, str] = {}
+        self._codes: Dict[str, str] = {}
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._card: Dict[str, str] = {}
+        self._httpd = _HTTPServer((host, port), self)
+        self._thread: Optional[threading.Thread] = None
+        self._routes: Dict[Tuple[str, str], Callable[[_Exchange], _Reply]] = {
+            _split(AUTHSERVER_URL): self._authserver_login,
+            ("authserver.cqu.edu.cn", "/authserver/needCaptcha.html"): self._need_captcha,
+            ("authserver.cqu.edu.cn", "/authserver/captcha.html"): self._captcha_image,
+            ("authserver.cqu.edu.cn", "/authserver/logout"): self._authserver_logout,
+            _split(AUTHSERVER_INDEX_URL): lambda exchange: _Reply(200, "index"),
+            _split(SSO_LOGIN_URL): self._sso_login,
+            ("sso.cqu.edu.cn", "/clientredirect"): self._sso_client_redirect,
+            _split(SSO_CALLBACK_URL): self._sso_callback,
+            _split(MYCQU_SERVICE_URL): self._mycqu_cas,
+            _split(MYCQU_AUTHORIZE_URL): self._mycqu_authorize,
+            _split(MYCQU_TOKEN_URL): self._mycqu_token,
+            ("my.cqu.edu.cn", "/authserver/simple-user"): self._authorized(self._simple_user),
+            _split(CUR_SESSION_URL): self._authorized(self._cur_session),
+            _split(ALL_SESSIONSINFO_URL): self._authorized(self._session_list),
+            _split(CQUSESSIONS_URL): self._session_options,
+            _split(TIMETABLE_URL): self._authorized(self._timetable),
+            _split(SCORE_URL): self._authorized(self._score),
+            _split(GPA_RANKING_URL): self._authorized(self._gpa_ranking),
+            _split(EXAM_LIST_URL): self._exam_list,
+            _split(CARD_PRELOGIN_URL): self._card_prelogin,
+            _split(HALL_TICKET_URL): self._card_hall_ticket,
+            _split(TICKET_URL): self._card_ticket,
+            _split(SYNJONES_AUTH_URL): self._card_synjones_auth,
+            _split(FEE_DATA_URL): self._card_fee_data,
+        }
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """服务器实际监听的地址和端口"""
+        return self._httpd.server_address[:2]  # type: ignore
+
+    def start(self) -> FakeCQUServer:
+        """在后台线程中启动服务器"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                            name="FakeCQUServer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """关闭服务器"""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> FakeCQUServer:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def adapter(self, **kwargs) -> FakeServerAdapter:
+        """创建转发到该服务器的 requests 适配器，``kwargs`` 传给 :class:`requests.adapters.HTTPAdapter`"""
+        return FakeServerAdapter(self.address, **kwargs)
+
+    def mount(self, session: Session, **kwargs) -> Session:
+        """让会话中对重大各个域名的请求都转发到该服务器，``kwargs`` 传给 :class:`requests.adapters.HTTPAdapter`
+
+        :param session: 会话
+        :type session: Session
+        :return: 传入的会话
+        :rtype: Session
+        """
+        adapter = self.adapter(**kwargs)
+        for hostname in HOSTNAMES:
+            session.mount(f"http://{hostname}", adapter)
+            session.mount(f"https://{hostname}", adapter)
+        return session
+
+    def async_transport(self, transport: Optional[Any] = None) -> Any:
+        """创建用于 :class:`httpx.AsyncClient` 的 transport，对重大各个域名的请求转发到该服务器，需要安装可选依赖 httpx
+
+        :param transport: 其他请求所用的 transport，默认为 :class:`httpx.AsyncHTTPTransport`
+        :type transport: Optional[httpx.AsyncBaseTransport], optional
+        :rtype: httpx.AsyncBaseTransport
+        """
+        if httpx is None:
+            raise ImportError("httpx is needed, install pymycqu with the httpx extra")
+        return _AsyncTransport(self.address, transport or httpx.AsyncHTTPTransport())
+
+    def inject_errors(self, count: int = 1, status: Optional[int] = None, url: Optional[str] = None) -> None:
+        """让之后的 ``count`` 个请求（只计地址以 ``url`` 开头的请求，``url`` 中的端口被忽略）直接返回错误
+
+        :param count: 返回错误的请求数
+        :type count: int, optional
+        :param status: 状态码，默认为 ``error_status``
+        :type status: Optional[int], optional
+        :param url: 只对该地址开头的请求注入错误，默认对所有请求
+        :type url: Optional[str], optional
+        """
+        prefix = None
+        if url is not None:
+            hostname, path = _split(url)
+            prefix = hostname + path
+        with self._lock:
+            self._injected.append((count, self.error_status if status is None else status, prefix))
+
+    def expire_tokens(self) -> None:
+        """使所有已签发的 mycqu 认证信息失效，之后使用它们的请求会得到 401"""
+        with self._lock:
+            self._tokens.clear()
+
+    def expire_logins(self) -> None:
+        """使所有统一身份认证、SSO 和 mycqu 的登录状态失效"""
+        with self._lock:
+            self._tgts.clear()
+            self._sso_tgcs.clear()
+            self._mycqu_sessions.clear()
+            self._tokens.clear()
+
+    # 请求分发
+
+    def _dispatch(self, exchange: _Exchange) -> _Reply:
+        key = exchange.host + exchange.path
+        latency = self.latency
+        with self._lock:
+            # 服务器在多个线程中处理请求，计数需要加锁
+            self.hits[key] += 1
+            delay = self._random.uniform(*latency) if isinstance(latency, tuple) else latency
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            for i, (count, status, prefix) in enumerate(self._injected):
+                if prefix is None or key.startswith(prefix):
+                    if count > 1:
+                        self._injected[i] = (count - 1, status, prefix)
+                    else:
+                        del self._injected[i]
+                    return _Reply(status, "injected error", "text/plain")
+            if self.error_rate and self._random.random() < self.error_rate:
+                return _Reply(self.error_status, "injected error", "text/plain")
+        route = self._routes.get((exchange.host, exchange.path))
+        if route is None:
+            return _Reply(404, "not found", "text/plain")
+        reply = route(exchange)
+        if exchange.method == "GET" and reply.status == 200:
+            # 与 Spring 的 ShallowEtagHeaderFilter 一样，根据响应内容生成 ETag 并处理条件请求
+            etag = '"0' + hashlib.md5(reply.body).hexdigest() + '"'
+            if exchange.headers.get("If-None-Match") == etag:
+                reply = _Reply(304)
+            reply.headers.append(("ETag", etag))
+        return reply
+
+    def _new_ticket(self, username: str, service: str) -> str:
+        ticket = "ST-" + secrets.token_hex(12)
+        with self._lock:
+            self._tickets[ticket] = (username, service)
+        return ticket
+
+    def _redeem_ticket(self, ticket: Optional[str], service: str) -> Optional[str]:
+        with self._lock:
+            username, issued_for = self._tickets.pop(ticket or "", (None, ""))
+        return username if username is not None and service.startswith(issued_for.split("?")[0]) else None
+
+    # 统一身份认证
+
+    def _login_page(self, exchange: _Exchange, service: Optional[str], error: str = "") -> _Reply:
+        flow_id = exchange.cookies.get("JSESSIONID") or secrets.token_hex(16)
+        flow = {"salt": secrets.token_urlsafe(12)[:16], "lt": "LT-" + secrets.token_hex(8),
+                "execution": secrets.token_hex(8), "service": service, "captcha": None}
+        with self._lock:
+            self._flows[flow_id] = flow
+        body = _LOGIN_PAGE.format(salt=flow["salt"], lt=flow["lt"], execution=flow["execution"],
+                                  error=_LOGIN_ERROR.format(message=error) if error else "")
+        return _Reply(200, body).set_cookie("JSESSIONID", flow_id, "/authserver")
+
+    def _grant(self, username: str, service: Optional[str]) -> _Reply:
+        if not service:
+            return _Reply.redirect(AUTHSERVER_INDEX_URL)
+        return _Reply.redirect(_add_query(service, "ticket", self._new_ticket(username, service)))
+
+    def _log_in(self, username: str, service: Optional[str]) -> _Reply:
+        tgt = "TGT-" + secrets.token_hex(16)
+        with self._lock:
+            self._tgts[tgt] = username
+        return self._grant(username, service).set_cookie("CASTGC", tgt, "/authserver")
+
+    def _decrypt_password(self, encrypted: str, salt: str) -> Optional[str]:
+        try:
+            data = b64decode(encrypted)
+            blocks = aes_ecb_decryptor(salt.encode())(data)
+            # CBC 解密，前 64 字节为随机前缀，无需初始向量即可还原其后的明文
+            plain = bytes(a ^ b for a, b in zip(blocks[64:], data[48:]))
+            return _unpad(plain).decode()
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def _authserver_login(self, exchange: _Exchange) -> _Reply:
+        if exchange.method == "GET":
+            username = self._tgts.get(exchange.cookies.get("CASTGC", ""))
+            if username is not None:
+                return self._grant(username, exchange.query.get("service"))
+            return self._login_page(exchange, exchange.query.get("service"))
+
+        form = exchange.form
+        if form.get("_eventId") in ("continue", "cancel"):
+            with self._lock:
+                username, service, kick = self._kicks.pop(form.get("execution", ""), (None, None, False))
+            if username is None or not kick:
+                return self._login_page(exchange, service)
+            with self._lock:
+                for tgt in [tgt for tgt, owner in self._tgts.items() if owner == username]:
+                    del self._tgts[tgt]
+            return self._log_in(username, service)
+
+        flow_id = exchange.cookies.get("JSESSIONID", "")
+        flow = self._flows.get(flow_id)
+        if flow is None or form.get("execution") != flow["execution"]:
+            return self._login_page(exchange, None)
+        service = flow["service"]
+        username = form.get("username", "")
+        if self.need_captcha and (flow["captcha"] is None or
+                                  form.get("captchaResponse", "").lower() != flow["captcha"].lower()):
+            return self._login_page(exchange, service, "无效的验证码")
+        password = self._decrypt_password(form.get("password", ""), flow["salt"])
+        if password is None or (self.users is not None and self.users.get(username) != password):
+            return self._login_page(exchange, service, "您提供的用户名或者密码有误")
+        if username in self.single_login and username in self._tgts.values():
+            kick, cancel = secrets.token_hex(8), secrets.token_hex(8)
+            with self._lock:
+                self._kicks[kick] = (username, service, True)
+                self._kicks[cancel] = (username, service, False)
+            return _Reply(200, _KICK_PAGE.format(kick=kick, cancel=cancel))
+        with self._lock:
+            self._flows.pop(flow_id, None)
+        return self._log_in(username, service)
+
+    def _need_captcha(self, exchange: _Exchange) -> _Reply:
+        return _Reply(200, "true" if self.need_captcha else "false", "text/plain")
+
+    def _captcha_image(self, exchange: _Exchange) -> _Reply:
+        flow = self._flows.get(exchange.cookies.get("JSESSIONID", ""))
+        if flow is not None:
+            flow["captcha"] = self.captcha
+        return _Reply(200, b"\xff\xd8\xff\xe0captcha:" + self.captcha.encode(), "image/jpeg")
+
+    def _authserver_logout(self, exchange: _Exchange) -> _Reply:
+        with self._lock:
+            self._tgts.pop(exchange.cookies.get("CASTGC", ""), None)
+        return _Reply(200, "logout").set_cookie("CASTGC", "", "/authserver")
+
+    # SSO
+
+    def _sso_login(self, exchange: _Exchange) -> _Reply:
+        service = exchange.query.get("service", "")
+        username = self._sso_tgcs.get(exchange.cookies.get("TGC", ""))
+        if username is not None and service:
+            return self._grant(username, service)
+        pending = exchange.cookies.get("SESSION") or secrets.token_hex(16)
+        with self._lock:
+            self._sso_pending[pending] = service
+        return _Reply(200, _SSO_ADAPTER_PAGE).set_cookie("SESSION", pending)
+
+    def _sso_client_redirect(self, exchange: _Exchange) -> _Reply:
+        return _Reply.redirect(_add_query(AUTHSERVER_URL, "service", SSO_CALLBACK_URL))
+
+    def _sso_callback(self, exchange: _Exchange) -> _Reply:
+        username = self._redeem_ticket(exchange.query.get("ticket"), SSO_CALLBACK_URL)
+        service = self._sso_pending.get(exchange.cookies.get("SESSION", ""))
+        if username is None or not service:
+            return _Reply(401, "invalid ticket", "text/plain")
+        tgc = "TGC-" + secrets.token_hex(16)
+        with self._lock:
+            self._sso_tgcs[tgc] = username
+        return self._grant(username, service).set_cookie("TGC", tgc)
+
+    # my.cqu.edu.cn
+
+    def _mycqu_cas(self, exchange: _Exchange) -> _Reply:
+        username = self._redeem_ticket(exchange.query.get("ticket"), MYCQU_SERVICE_URL)
+        if username is None:
+            return _Reply(401, "invalid ticket", "text/plain")
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            self._mycqu_sessions[session_id] = username
+        return _Reply.redirect("https://my.cqu.edu.cn/enroll/").set_cookie("MYCQU_SESSION", session_id)
+
+    def _mycqu_authorize(self, exchange: _Exchange) -> _Reply:
+        username = self._mycqu_sessions.get(exchange.cookies.get("MYCQU_SESSION", ""))
+        if username is None:
+            return _Reply.redirect(_add_query(SSO_LOGIN_URL, "service", MYCQU_SERVICE_URL))
+        code = secrets.token_urlsafe(6)
+        with self._lock:
+            self._codes[code] = username
+        return _Reply.redirect(f"{exchange.query.get('redirect_uri', '')}?code={code}&state=")
+
+    def _mycqu_token(self, exchange: _Exchange) -> _Reply:
+        with self._lock:
+            username = self._codes.pop(exchange.form.get("code", ""), None)
+        if username is None:
+            return _Reply.json({"error": "invalid_grant", "error_description": "授权码无效"}, 400)
+        token = secrets.token_hex(24)
+        with self._lock:
+            self._tokens[token] = (username, time.time() + self.token_expires_in)
+        return _Reply.json({"access_token": token, "token_type": "bearer",
+                            "expires_in": self.token_expires_in, "scope": "all"})
+
+    def _authorized(self, handler: Callable[[_Exchange, str], _Reply]) -> Callable[[_Exchange], _Reply]:
+        def wrapper(exchange: _Exchange) -> _Reply:
+            username, expires_at = self._tokens.get(exchange.bearer or "", (None, 0.0))
+            if username is None or expires_at <= time.time():
+                return _Reply.json({"timestamp": int(time.time() * 1000), "status": 401,
+                                    "error": "Unauthorized", "message": "invalid_token",
+                                    "path": exchange.path}, 401)
+            return handler(exchange, username)
+        return wrapper
+
+    def _simple_user(self, exchange: _Exchange, username: str) -> _Reply:
+        return _Reply.json({"name": "用户" + username[-4:], "code": username, "username": username,
+                            "type": "student", "email": f"{username}@cqu.edu.cn", "phoneNumber": "13800000000"})
+
+    def _session_infos(self) -> List[Dict[str, Any]]:
+        today = self.today or date.today()
+        infos = []
+        for year in range(2019, today.year + 1):
+            for is_autumn in (False, True):
+                start = date(year, 8, 28) if is_autumn else date(year, 2, 20)
+                begin = start + timedelta(days=-start.weekday() % 7)
+                if begin > today + timedelta(days=60):
+                    continue
+                infos.append({"id": CQUSession(year, is_autumn).get_id(), "year": year,
+                              "term": "秋" if is_autumn else "春", "name": f"{year}年{'秋' if is_autumn else '春'}",
+                              "beginDate": begin.isoformat(),
+                              "endDate": (begin + timedelta(weeks=20, days=-1)).isoformat()})
+        infos.reverse()
+        return infos
+
+    def _current_info(self) -> Dict[str, Any]:
+        today = (self.today or date.today()).isoformat()
+        infos = self._session_infos()
+        return next((info for info in infos if info["beginDate"] <= today), infos[-1])
+
+    def _cur_session(self, exchange: _Exchange, username: str) -> _Reply:
+        return _Reply.json({"status": "success", "msg": None, "data": self._current_info()})
+
+    def _session_list(self, exchange: _Exchange, username: str) -> _Reply:
+        infos = self._session_infos()
+        infos += [{"id": CQUSession(2018, is_autumn).get_id(), "year": 2018, "term": "秋" if is_autumn else "春",
+                   "name": f"2018年{'秋' if is_autumn else '春'}", "beginDate": None, "endDate": None}
+                  for is_autumn in (True, False)]
+        return _Reply.json({"status": "success", "msg": None, "sessionVOList": infos})
+
+    def _session_options(self, exchange: _Exchange) -> _Reply:
+        return _Reply.json([{"id": info["id"], "name": f"{info['year']}{info['term']}"}
+                            for info in self._session_infos()])
+
+    def _timetable(self, exchange: _Exchange, username: str) -> _Reply:
+        sessions = {info["id"]: f"{info['year']}{info['term']}" for info in self._session_infos()}
+        session_name = sessions.get(int(exchange.query.get("sessionId") or 0))
+        try:
+            codes = json.loads(exchange.body or b"[]")
+        except ValueError:
+            return _Reply.json({"status": "error", "msg": "参数错误"}, 400)
+        timetables = [] if session_name is None else \
+            [timetable for code in codes for timetable in _timetables(str(code), session_name)]
+        return _Reply.json({"status": "success", "msg": None, "classTimetableVOList": timetables})
+
+    def _score(self, exchange: _Exchange, username: str) -> _Reply:
+        current = self._current_info()
+        names = [f"{info['year']}{info['term']}" for info in self._session_infos()
+                 if info["beginDate"] < current["beginDate"]]
+        return _Reply.json({"status": "success", "msg": None,
+                            "data": {name: {"stuScoreHomePgVoS": _scores(username, name)} for name in names}})
+
+    def _gpa_ranking(self, exchange: _Exchange, username: str) -> _Reply:
+        rng = random.Random("gpa" + username)
+        return _Reply.json({"status": "success", "msg": None,
+                            "data": {"gpa": f"{rng.uniform(2, 4):.2f}", "majorRanking": str(rng.randint(1, 200)),
+                                     "gradeRanking": None, "classRanking": str(rng.randint(1, 30))}})
+
+    def _exam_list(self, exchange: _Exchange) -> _Reply:
+        try:
+            student_id = _unpad(aes_ecb_decryptor(EXAM_KEY)(bytes.fromhex(exchange.query["studentId"]))).decode()
+        except (KeyError, ValueError):
+            return _Reply.json({"status": "error", "msg": "学号无效", "data": None})
+        info = self._current_info()
+        exams = _exams(student_id, f"{info['year']}{info['term']}", date.fromisoformat(info["beginDate"]))
+        # 与 Spring 的 Pageable 一样接受 page 和 size 参数
+        size = int(exchange.query.get("size") or self.exam_page_size or max(len(exams), 1))
+        page = int(exchange.query.get("page") or 0)
+        total_pages = max((len(exams) + size - 1) // size, 1)
+        return _Reply.json({"status": "success", "msg": None,
+                            "data": {"content": exams[page * size:(page + 1) * size],
+                                     "totalElements": len(exams), "totalPages": total_pages, "number": page,
+                                     "size": size, "first": page == 0, "last": page + 1 >= total_pages}})
+
+    # 校园卡
+
+    def _card_prelogin(self, exchange: _Exchange) -> _Reply:
+        username = self._redeem_ticket(exchange.query.get("ticket"), CARD_PRELOGIN_URL)
+        if username is None:
+            return _Reply.redirect(_add_query(AUTHSERVER_URL, "service", CARD_PRELOGIN_URL + "?sysid=FWDT"))
+        ssoticket = secrets.token_hex(16)
+        with self._lock:
+            self._card["sso:" + ssoticket] = username
+        return _Reply(200, _CARD_PRELOGIN_PAGE.format(ticket=ssoticket))
+
+    def _card_hall_ticket(self, exchange: _Exchange) -> _Reply:
+        username = self._card.get("sso:" + exchange.form.get("ssoticketid", ""))
+        if username is None:
+            return _Reply(200, "ssoticketid 无效")
+        hallticket = secrets.token_hex(16)
+        with self._lock:
+            self._card["hall:" + hallticket] = username
+        return _Reply(200, "ok").set_cookie("hallticket", hallticket)
+
+    def _card_ticket(self, exchange: _Exchange) -> _Reply:
+        username = self._card.get("hall:" + exchange.cookies.get("hallticket", ""))
+        if username is None:
+            return _Reply(200, "<html>请先登录</html>")
+        ticket = secrets.token_hex(16)
+        with self._lock:
+            self._card["ticket:" + ticket] = username
+        return _Reply(200, _CARD_TICKET_PAGE.format(ticket=ticket))
+
+    def _card_synjones_auth(self, exchange: _Exchange) -> _Reply:
+        with self._lock:
+            username = self._card.pop("ticket:" + exchange.form.get("ticket", ""), None)
+        if username is None:
+            return _Reply.json({"code": 401, "success": False, "data": None, "msg": "ticket 无效"})
+        token = secrets.token_hex(16)
+        with self._lock:
+            self._card["synjones:" + token] = username
+        return _Reply.json({"code": 200, "success": True, "data": {"access_token": token}, "msg": "操作成功"})
+
+    def _card_fee_data(self, exchange: _Exchange) -> _Reply:
+        auth = exchange.cookies.get("synjones-auth", "")
+        if not auth.startswith("bearer ") or "synjones:" + auth[7:] not in self._card:
+            return _Reply.json({"msg": "未登录", "map": None})
+        rng = random.Random("fee" + exchange.form.get("room", ""))
+        return _Reply.json({"msg": "success", "map": {"showData": {
+            "剩余金额": round(rng.uniform(0, 200), 2),
+            "电剩余补助": round(rng.uniform(0, 30), 2),
+            "水剩余补助": round(rng.uniform(0, 10), 2)}}})
+
+
+if httpx is not None:
+    class _AsyncTransport(httpx.AsyncBaseTransport):
+        def __init__(self, address: Tuple[str, int], transport: httpx.AsyncBaseTransport):
+            self.address: Tuple[str, int] = address
+            self.transport: httpx.AsyncBaseTransport = transport
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            if request.url.host not in HOSTNAMES:
+                return await self.transport.handle_async_request(request)
+            local = httpx.Request(request.method,
+                                  request.url.copy_with(scheme="http", host=self.address[0], port=self.address[1]),
+                                  headers=request.headers, stream=request.stream, extensions=request.extensions)
+            return await self.transport.handle_async_request(local)
+
+        async def aclose(self) -> None:
+            await self.transport.aclose()
+
+
+def _timetables(code: str, session_name: str) -> List[Dict[str, Any]]:
+    rng = random.Random(code + session_name)
+    timetables = []
+    for i in range(rng.randint(6, 10)):
+        course_index = rng.randrange(len(_COURSE_NAMES))
+        first_week = rng.randint(1, 8)
+        first_period = rng.choice((1, 3, 6, 8, 10))
+        timetables.append({
+            "courseName": _COURSE_NAMES[course_index], "courseCode": f"CST{course_index:03d}{i:02d}",
+            "classNbr": f"{rng.randint(100000, 999999)}-{rng.randint(1, 30):03d}",
+            "courseDepartmentName": rng.choice(_DEPTS), "courseDeptShortName": None,
+            "credit": float(rng.randint(1, 5)), "instructorName": f"教师{rng.randint(1, 500)}-[主讲]",
+            "session": session_name, "selectedStuNum": rng.randint(20, 120),
+            "roomName": f"D{rng.randint(1, 3)}{rng.randint(100, 599)}", "weeks": None,
+            "teachingWeekFormat": f"{first_week}-{first_week + rng.randint(3, 9)}",
+            "periodFormat": f"{first_period}-{first_period + 1}",
+            "weekDayFormat": _WEEKDAYS[rng.randrange(5)], "wholeWeekOccupy": 0,
+        })
+    return timetables
+
+
+def _exams(student_id: str, session_name: str, begin: date) -> List[Dict[str, Any]]:
+    rng = random.Random(student_id + session_name)
+    exams = []
+    for i in range(rng.randint(2, 5)):
+        week, weekday = rng.randint(17, 19), rng.randint(1, 5)
+        start = rng.choice(("09:00", "14:25", "19:00"))
+        course_index = rng.randrange(len(_COURSE_NAMES))
+        exams.append({
+            "courseName": _COURSE_NAMES[course_index], "courseCode": f"CST{course_index:03d}{i:02d}",
+            "batchName": "集中考试周", "batchId": 100 + rng.randint(0, 20), "buildingName": "D区",
+            "floorNum": rng.randint(1, 5), "roomName": f"D{rng.randint(1, 3)}{rng.randint(100, 599)}",
+            "examStuNum": rng.randint(20, 120),
+            "examDate": (begin + timedelta(weeks=week - 1, days=weekday - 1)).isoformat(),
+            "startTime": start, "endTime": f"{int(start[:2]) + 2:02d}{start[2:]}",
+            "week": week, "weekDay": str(weekday), "studentId": student_id, "seatNum": rng.randint(1, 60),
+            "simpleChiefinvigilatorVOS": [{"instructor": f"教师{rng.randint(1, 500)}", "instDeptShortName": "数统"}],
+            "simpleAssistantInviVOS": [{"instructor": f"教师{rng.randint(1, 500)}", "instDeptShortName": "计算机"}],
+        })
+    return exams
+
+
+def _scores(username: str, session_name: str) -> List[Dict[str, Any]]:
+    rng = random.Random(username + session_name)
+    scores = []
+    for i in range(rng.randint(4, 8)):
+        course_index = rng.randrange(len(_COURSE_NAMES))
+        scores.append({
+            "sessionName": session_name, "courseName": _COURSE_NAMES[course_index],
+            "courseCode": f"CST{course_index:03d}{i:02d}", "credit": float(rng.randint(1, 5)),
+            "instructorName": None,
+            "effectiveScoreShow": str(rng.randint(55, 99)) if rng.random() < 0.8 else rng.choice(_GRADES),
+            "studyNature": "初修" if rng.random() < 0.9 else "重修",
+            "courseNature": rng.choice(("必修", "选修")),
+        })
+    return scores
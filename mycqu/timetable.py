@@ -0,0 +1,190 @@
+"""课表的周次、星期、节次索引，用于快速查询某一时刻的课程和下一节课
+"""
+from __future__ import annotations
+from typing import Iterable, List, Optional, Tuple
+from .course import CourseTimetable
+
+__all__ = ("TimetableIndex", "weeks_to_mask", "mask_to_weeks")
+
+# 每天最多的节次
+MAX_PERIOD = 13
+
+
+def weeks_to_mask(weeks: Iterable[Tuple[int, int]]) -> int:
+    """将 :attr:`.course.CourseTimetable.weeks` 形式的周数范围转换为位掩码，第 ``n`` 周对应第 ``n`` 位
+
+    >>> bin(weeks_to_mask([(1, 3), (5, 5)]))
+    '0b101110'
+
+    :param weeks: 周数范围列表
+    :type weeks: Iterable[Tuple[int, int]]
+    :rtype: int
+    """
+    mask = 0
+    for start, end in weeks:
+        mask |= ((1 << (end - start + 1)) - 1) << start
+    return mask
+
+
+def mask_to_weeks(mask: int) -> List[int]:
+    """列出位掩码中包含的所有周次
+
+    >>> mask_to_weeks(0b101110)
+    [1, 2, 3, 5]
+
+    :param mask: :func:`weeks_to_mask` 得到的位掩码
+    :type mask: int
+    :rtype: List[int]
+    """
+    weeks = []
+    week = 0
+    while mask:
+        if mask & 1:
+            weeks.append(week)
+        mask >>= 1
+        week += 1
+    return weeks
+
+
+class TimetableIndex:
+    """由一组课表编译得到的索引
+
+    构建时把每个课表的周数转换为位掩码，并将每节课展开到以（周次，星期，节次）为下标的稠密表中，
+    此后的单点查询和“下一节课”查询都只需一次下标访问。
+    没有确定星期和节次（:attr:`.course.CourseTimetable.day_time` 为 :obj:`None`）的课表只能通过 :meth:`in_week` 查询。
+
+    >>> index = TimetableIndex(CourseTimetable.fetch(session, "201xxxxx"))
+    >>> index.at(week=7, weekday=1, period=3)
+    >>> index.next_class(week=7, weekday=1, period=3)
+
+    :param timetables: 课表列表
+    :type timetables: Iterable[CourseTimetable]
+    :param max_period: 每天最多的节次，默认为 :data:`MAX_PERIOD`
+    :type max_period: int, optional
+    """
+
+    def __init__(self, timetables: Iterable[CourseTimetable], max_period: int = MAX_PERIOD):
+        self.timetables: Tuple[CourseTimetable, ...] = tuple(timetables)
+        """构建索引所用的课表"""
+        self.week_masks: Tuple[int, ...] = tuple(weeks_to_mask(timetable.weeks)
+                                                 for timetable in self.timetables)
+        """与 :attr:`timetables` 一一对应的周数位掩码"""
+        self.max_period: int = max_period
+        all_weeks = 0
+        for mask in self.week_masks:
+            all_weeks |= mask
+        self.max_week: int = all_weeks.bit_length() - 1 if all_weeks else 0
+        """课表中出现的最大周次"""
+
+        size = self.max_week * 7 * max_period
+        occupied: List[List[CourseTimetable]] = [[] for _ in range(size)]
+        starting: List[List[CourseTimetable]] = [[] for _ in range(size)]
+        for timetable, mask in zip(self.timetables, self.week_masks):
+            if timetable.day_time is None or timetable.day_time.period[0] > max_period:
+                continue
+            first, last = timetable.day_time.period
+            for week in mask_to_weeks(mask):
+                base = self._ordinal(week, timetable.day_time.weekday, 1)
+                starting[base + first - 1].append(timetable)
+                for period in range(first, min(last, max_period) + 1):
+                    occupied[base + period - 1].append(timetable)
+        self._occupied: List[Tuple[CourseTimetable, ...]] = [tuple(slot) for slot in occupied]
+        self._starting: List[Tuple[CourseTimetable, ...]] = [tuple(slot) for slot in starting]
+        # _next_start[i] 为下标不小于 i 的第一个有课程开始的格子，没有则为 -1
+        self._next_start: List[int] = [-1] * (size + 1)
+        for ordinal in range(size - 1, -1, -1):
+            self._next_start[ordinal] = ordinal if starting[ordinal] else self._next_start[ordinal + 1]
+
+    @staticmethod
+    def _check_weekday(weekday: int) -> None:
+        if not 0 <= weekday <= 6:
+            raise ValueError(f"weekday should be in 0 ~ 6 (0 for Monday), but {weekday} is got")
+
+    def _ordinal(self, week: int, weekday: int, period: int) -> int:
+        return ((week - 1) * 7 + weekday) * self.max_period + period - 1
+
+    def _position(self, ordinal: int) -> Tuple[int, int, int]:
+        day, period = divmod(ordinal, self.max_period)
+        week, weekday = divmod(day, 7)
+        return week + 1, weekday, period + 1
+
+    def at(self, week: int, weekday: int, period: int) -> Tuple[CourseTimetable, ...]:
+        """查询某周某天某一节正在进行的课程
+
+        :param week: 周次
+        :type week: int
+        :param weekday: 星期，0 为周一
+        :type weekday: int
+        :param period: 节次
+        :type period: int
+        :raises ValueError: ``weekday`` 不在 0 ~ 6 之间
+        :return: 该节的所有课程（可能有冲突的多门），没有则为空元组
+        :rtype: Tuple[CourseTimetable, ...]
+        """
+        self._check_weekday(weekday)
+        if not (1 <= week <= self.max_week and 1 <= period <= self.max_period):
+            return ()
+        return self._occupied[self._ordinal(week, weekday, period)]
+
+    def on_day(self, week: int, weekday: int) -> List[Tuple[int, Tuple[CourseTimetable, ...]]]:
+        """查询某周某天各节开始的课程
+
+        :param week: 周次
+        :type week: int
+        :param weekday: 星期，0 为周一
+        :type weekday: int
+        :raises ValueError: ``weekday`` 不在 0 ~ 6 之间
+        :return: 按节次排序的（开始节次，课程）列表
+        :rtype: List[Tuple[int, Tuple[CourseTimetable, ...]]]
+        """
+        self._check_weekday(weekday)
+        if not 1 <= week <= self.max_week:
+            return []
+        base = self._ordinal(week, weekday, 1)
+        return [(period + 1, self._starting[base + period])
+                for period in range(self.max_period) if self._starting[base + period]]
+
+    def in_week(self, week: int) -> List[CourseTimetable]:
+        """查询某周有安排的所有课表，包括没有确定星期和节次的课表
+
+        :param week: 周次
+        :type week: int
+        :raises ValueError: ``week`` 为负数
+        :rtype: List[CourseTimetable]
+        """
+        if week < 0:
+            raise ValueError(f"week should not be negative, but {week} is got")
+        bit = 1 << week
+        return [timetable for timetable, mask in zip(self.timetables, self.week_masks) if mask & bit]
+
+    def next_class(self, week: int, weekday: int, period: int = 1
+                   ) -> Optional[Tuple[int, int, int, Tuple[CourseTimetable, ...]]]:
+        """查询从某周某天某一节（含）起，下一次开始上课的时间和课程
+
+        :param week: 周次
+        :type week: int
+        :param weekday: 星期，0 为周一
+        :type weekday: int
+        :param period: 节次，默认为 1 即从当天第一节开始
+        :type period: int, optional
+        :raises ValueError: ``weekday`` 不在 0 ~ 6 之间
+        :return: （周次，星期，开始节次，课程）；之后没有课则为 :obj:`None`
+        :rtype: Optional[Tuple[int, int, int, Tuple[CourseTimetable, ...]]]
+        """
+        self._check_weekday(weekday)
+        if week < 1:
+            week, weekday, period = 1, 0, 1
+        if period < 1:
+            period = 1
+        elif period > self.max_period:
+            period = self.max_period + 1  # 即下一天的第一节
+        ordinal = self._ordinal(week, weekday, 1) + period - 1
+        if ordinal >= len(self._starting):
+            return None
+        found = self._next_start[ordinal]
+        if found < 0:
+            return None
+        return (*self._position(found), self._starting[found])
+
+    def __len__(self) -> int:
+        return len(self.timetables)
@@ -3,6 +3,7 @@
 from __future__ import annotations
 from requests import Session
 from ._lib_wrapper.dataclass import dataclass
+from .instrument import report
 from .mycqu import MycquUnauthorized
 __all__ = ("User",)
 
@@ -34,7 +35,7 @@ class User:
         :return: 当前用户信息
         :rtype: User
         """
-        resp = session.get("https://my.cqu.edu.cn/authserver/simple-user")
+        resp = report("user.self", session.get("https://my.cqu.edu.cn/authserver/simple-user"))
         if resp.status_code == 401:
             raise MycquUnauthorized()
         data = resp.json()
@@ -0,0 +1,46 @@
+from typing import Callable, Dict, Iterable, Iterator, Tuple, TypeVar, Union
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+__all__ = ("imap_unordered",)
+
+_K = TypeVar("_K")
+_V = TypeVar("_V")
+
+
+def imap_unordered(func: Callable[[_K], _V], items: Iterable[_K], concurrency: int,
+                   return_exceptions: bool = False, thread_name_prefix: str = ""
+                   ) -> Iterator[Tuple[_K, Union[_V, Exception]]]:
+    """在线程池中对 ``items`` 逐个调用 ``func``，按完成的先后产生（参数，结果）
+
+    ``items`` 被逐步消费，同时进行中的调用不超过 ``concurrency`` 个；``return_exceptions`` 为 :obj:`False` 时
+    第一个异常会被抛出，未开始的调用被取消。调用在调用者上下文（:mod:`contextvars`）的副本中进行，
+    如 :func:`.scheduler.priority` 设置的优先级。
+    """
+    items = iter(items)
+    pending: Dict[Future, _K] = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=thread_name_prefix) as executor:
+        def submit(count: int):
+            for item in items:
+                pending[executor.submit(contextvars.copy_context().run, func, item)] = item
+                count -= 1
+                if count <= 0:
+                    break
+
+        submit(concurrency)
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        result: Union[_V, Exception] = future.result()
+                    except Exception as error:  # pylint: disable=broad-except
+                        if not return_exceptions:
+                            raise
+                        result = error
+                    yield item, result
+                submit(len(done))
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,148 @@
+"""日期与（学期，教学周，星期）之间的相互转换
+
+第 1 周为学期开始日期（:attr:`.course.CQUSessionInfo.begin_date`）所在的那一周（周一至周日），星期以 0 为周一，
+与 :attr:`.course.CourseDayTime.weekday` 一致。
+
+安装了 `numpy <https://numpy.org>`_ 时，:meth:`TeachingCalendar.locate_many` 和 :meth:`TeachingCalendar.to_dates`
+以向量化的方式处理整个数组。
+"""
+from __future__ import annotations
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+from bisect import bisect_left
+from datetime import date, timedelta
+from .course import CQUSession, CQUSessionInfo
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+__all__ = ("TeachingCalendar",)
+
+# 0001-01-01 的序数为 1，1970-01-01 的序数为 719163
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class TeachingCalendar:
+    """由一组学期信息构建的教学周索引，两个方向的转换都是 O(log n)
+
+    >>> calendar = TeachingCalendar(CQUSessionInfo.fetch_all(session))
+    >>> calendar.locate(date(2021, 10, 13))
+    (CQUSessionInfo(session=CQUSession(year=2021, is_autumn=True), ...), 7, 2)
+    >>> calendar.to_date(CQUSession(2021, True), 7, 2)
+    datetime.date(2021, 10, 13)
+
+    :param infos: 学期信息，顺序任意；开始和结束日期有重叠时，日期属于结束较早的学期
+    :type infos: Iterable[CQUSessionInfo]
+    """
+
+    def __init__(self, infos: Iterable[CQUSessionInfo]):
+        self.infos: Tuple[CQUSessionInfo, ...] = tuple(sorted(infos, key=lambda info: info.end_date))
+        """按结束日期排序的学期信息"""
+        # 各学期第 1 周周一和结束日期的序数
+        self._mondays: List[int] = [info.begin_date.toordinal() - info.begin_date.weekday()
+                                    for info in self.infos]
+        self._ends: List[int] = [info.end_date.toordinal() for info in self.infos]
+        self._index = {info.session: i for i, info in enumerate(self.infos)}
+
+    def _find(self, ordinal: int) -> int:
+        i = bisect_left(self._ends, ordinal)
+        return i if i < len(self._ends) and self._mondays[i] <= ordinal else -1
+
+    def locate(self, day: date) -> Optional[Tuple[CQUSessionInfo, int, int]]:
+        """确定日期所在的学期、教学周和星期
+
+        :param day: 日期
+        :type day: date
+        :return: （学期信息，周次，星期）；日期不在任何学期中（如假期）时为 :obj:`None`
+        :rtype: Optional[Tuple[CQUSessionInfo, int, int]]
+        """
+        ordinal = day.toordinal()
+        i = self._find(ordinal)
+        if i < 0:
+            return None
+        return self.infos[i], (ordinal - self._mondays[i]) // 7 + 1, day.weekday()
+
+    def week_of(self, day: date) -> Optional[int]:
+        """确定日期所在的教学周
+
+        :param day: 日期
+        :type day: date
+        :return: 周次，日期不在任何学期中时为 :obj:`None`
+        :rtype: Optional[int]
+        """
+        located = self.locate(day)
+        return None if located is None else located[1]
+
+    def to_date(self, cqu_session: Union[CQUSession, str], week: int, weekday: int) -> date:
+        """获取某学期某周某天的日期
+
+        :param cqu_session: 学期
+        :type cqu_session: Union[CQUSession, str]
+        :param week: 周次
+        :type week: int
+        :param weekday: 星期，0 为周一
+        :type weekday: int
+        :raises KeyError: 索引中没有该学期
+        :rtype: date
+        """
+        if isinstance(cqu_session, str):
+            cqu_session = CQUSession.from_str(cqu_session)
+        return date.fromordinal(self._mondays[self._index[cqu_session]] + (week - 1) * 7 + weekday)
+
+    def locate_many(self, days: Union[Iterable[date], Any]) -> Tuple[Sequence[int], Sequence[int], Sequence[int]]:
+        """批量确定日期所在的学期、教学周和星期
+
+        安装了 numpy 时接受 :class:`datetime.date` 的序列或 ``datetime64`` 数组，以 :func:`numpy.searchsorted`
+        一次处理全部日期并返回 :class:`numpy.ndarray`；否则逐个二分查找并返回列表。
+
+        :param days: 日期
+        :type days: Union[Iterable[date], numpy.ndarray]
+        :return: 三个等长的序列：学期在 :attr:`infos` 中的下标、周次、星期；不在任何学期中的日期，其下标和周次为 -1
+        :rtype: Tuple[Sequence[int], Sequence[int], Sequence[int]]
+        """
+        if np is not None:
+            ordinals = np.asarray(days, dtype="datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+            index = np.searchsorted(np.asarray(self._ends, dtype=np.int64), ordinals, side="left")
+            mondays = np.asarray(self._mondays + [0], dtype=np.int64)[index]
+            found = (index < len(self._ends)) & (mondays <= ordinals)
+            index = np.where(found, index, -1)
+            weeks = np.where(found, (ordinals - mondays) // 7 + 1, -1)
+            # 0001-01-01 是周一
+            return index, weeks, (ordinals - 1) % 7
+        indices: List[int] = []
+        weeks_list: List[int] = []
+        weekdays: List[int] = []
+        for day in days:
+            ordinal = day.toordinal()
+            i = self._find(ordinal)
+            indices.append(i)
+            weeks_list.append(-1 if i < 0 else (ordinal - self._mondays[i]) // 7 + 1)
+            weekdays.append(day.weekday())
+        return indices, weeks_list, weekdays
+
+    def to_dates(self, cqu_session: Union[CQUSession, str],
+                 weeks: Iterable[int], weekdays: Iterable[int]) -> Union[List[date], Any]:
+        """批量获取某学期各周各天的日期
+
+        :param cqu_session: 学期
+        :type cqu_session: Union[CQUSession, str]
+        :param weeks: 周次
+        :type weeks: Iterable[int]
+        :param weekdays: 星期，0 为周一，与 ``weeks`` 等长
+        :type weekdays: Iterable[int]
+        :raises KeyError: 索引中没有该学期
+        :return: 安装了 numpy 时为 ``datetime64[D]`` 数组，否则为 :class:`datetime.date` 的列表
+        :rtype: Union[List[date], numpy.ndarray]
+        """
+        if isinstance(cqu_session, str):
+            cqu_session = CQUSession.from_str(cqu_session)
+        monday = self._mondays[self._index[cqu_session]]
+        if np is not None:
+            offsets = (np.asarray(weeks, dtype=np.int64) - 1) * 7 + np.asarray(weekdays, dtype=np.int64)
+            return (offsets + (monday - _EPOCH_ORDINAL)).astype("datetime64[D]")
+        first = date.fromordinal(monday)
+        return [first + timedelta(days=(week - 1) * 7 + weekday) for week, weekday in zip(weeks, weekdays)]
+
+    def __len__(self) -> int:
+        return len(self.infos)
@@ -0,0 +1,26 @@
+from mycqu import gpa
+from mycqu.course import CQUSession
+from mycqu.score import Score
+
+
+def _score(session_name: str, score: str = "90") -> Score:
+    return Score.from_dict({
+        "sessionName": session_name, "courseName": "高等数学", "courseCode": "MATH10011", "credit": 4.0,
+        "instructorName": None, "effectiveScoreShow": score, "studyNature": "初修", "courseNature": "必修",
+    })
+
+
+def test_by_session_is_in_time_order():
+    # 覆盖 2015 年之前（id 随时间递减）、2015 ~ 2018 年（特殊 id）和 2018 年之后的学期
+    names = ["2013秋", "2012秋", "2016秋", "2018秋", "2015春", "2021春"]
+    table = gpa.ScoreTable({"20180001": [_score(name) for name in names]})
+    got = [str(session) for session in table.by_session()["20180001"]]
+    assert got == ["2012秋", "2013秋", "2015春", "2016秋", "2018秋", "2021春"]
+    assert got == sorted(names, key=CQUSession.from_str)
+
+
+def test_by_session_only_has_sessions_of_the_student():
+    table = gpa.ScoreTable({"20180001": [_score("2019秋")], "20180002": [_score("2020春"), _score("2019秋")]})
+    sessions = table.by_session()
+    assert [str(session) for session in sessions["20180001"]] == ["2019秋"]
+    assert [str(session) for session in sessions["20180002"]] == ["2019秋", "2020春"]